@@ -0,0 +1,325 @@
+"""
+Columnar representation of configuration items
+
+A workbook sheet is kept as one NumPy array per column instead of one dict per
+row, so column names and row metadata are stored once per sheet. Rows are
+exposed through lightweight ``ConfigurationRow`` views and only turned into
+dicts when they are sent over the wire. Blocks can be spilled to disk under
+memory pressure and are reloaded while a consumer holds them.
+"""
+import os
+import math
+import pickle
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+def _to_python(value: Any) -> Any:
+    """Convert a NumPy cell to a JSON-friendly Python value (NaN/NaT -> None)"""
+    if value is None:
+        return None
+    if isinstance(value, np.datetime64):
+        if np.isnat(value):
+            return None
+        return value.astype("datetime64[us]").item()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    # pandas missing markers (NaT, NA) inside object columns
+    if type(value).__name__ in ("NaTType", "NAType"):
+        return None
+    if hasattr(value, "to_pydatetime"):
+        return value.to_pydatetime()
+    return value
+
+
+class SheetBlock:
+    """Column arrays for the rows of one sheet sharing a configuration type"""
+
+    __slots__ = ("sheet", "config_type", "columns", "_values", "index", "part", "properties", "_spill", "_pins")
+
+    def __init__(
+        self,
+        sheet: str,
+        config_type: str,
+        columns: Tuple[str, ...],
+        values: List[np.ndarray],
+        index: np.ndarray,
+        part: Optional[str] = None,
+        properties: Optional[Dict[str, str]] = None
+    ):
+        self.sheet = sheet
+        self.config_type = config_type
+        self.columns = columns
+        self._values = values
+        self.index = index
+        # Set when a sheet is split column-wise into several blocks over the same rows
+        self.part = part
+        # column -> SF property name suggested by the column classifier
+        self.properties = properties or {}
+        # (spill directory, column files) once spilled; pins keep a spilled block resident
+        self._spill = None
+        self._pins = 0
+
+    @classmethod
+    def from_frame(
+        cls,
+        df,
+        sheet: str,
+        config_type: str,
+        part: Optional[str] = None,
+        properties: Optional[Dict[str, str]] = None
+    ) -> "SheetBlock":
+        """Build a block from a pandas DataFrame without copying per-row dicts"""
+        return cls(
+            sheet=sheet,
+            config_type=config_type,
+            columns=tuple(str(col) for col in df.columns),
+            values=[df.iloc[:, i].to_numpy() for i in range(df.shape[1])],
+            index=np.asarray(df.index),
+            part=part,
+            properties=properties
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def values(self) -> List[np.ndarray]:
+        """Column arrays; read from disk for a spilled block that is not held"""
+        if self._values is not None:
+            return self._values
+        return self._load()
+
+    def spill(self, directory) -> bool:
+        """
+        Write the columns to ``directory`` (a TemporaryDirectory) and drop them from memory
+        Numeric and datetime columns are memory-mapped back. Returns False if the block is held.
+        """
+        if self._pins:
+            return False
+        if self._spill is None:
+            base = os.path.join(directory.name, f"{id(self):x}")
+            paths = []
+            for i, column in enumerate(self._values):
+                if column.dtype.kind in "biufcmM":
+                    path = f"{base}_{i}.npy"
+                    np.save(path, column)
+                else:
+                    path = f"{base}_{i}.pkl"
+                    with open(path, "wb") as f:
+                        pickle.dump(column, f, protocol=pickle.HIGHEST_PROTOCOL)
+                paths.append(path)
+            # Holding the directory object keeps the files alive as long as the block
+            self._spill = (directory, paths)
+        self._values = None
+        return True
+
+    def _load(self) -> List[np.ndarray]:
+        values = []
+        for path in self._spill[1]:
+            if path.endswith(".npy"):
+                values.append(np.load(path, mmap_mode="r"))
+            else:
+                with open(path, "rb") as f:
+                    values.append(pickle.load(f))
+        return values
+
+    def acquire(self):
+        """Keep the columns in memory until the matching release()"""
+        self._pins += 1
+        if self._values is None:
+            self._values = self._load()
+
+    def release(self):
+        self._pins = max(self._pins - 1, 0)
+        if self._pins == 0 and self._spill is not None:
+            self._values = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill is not None
+
+    def row_id(self, pos: int) -> str:
+        """Item id of a row: sheet and row index, plus the part for split sheets"""
+        row_id = f"{self.sheet}_{_to_python(self.index[pos])}"
+        return f"{row_id}_{self.part}" if self.part else row_id
+
+    def row_data(self, pos: int, names: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Materialize one row as a column -> value dict
+        With ``names``, only mapped columns are kept and keys are renamed.
+        """
+        if names is None:
+            return {
+                name: _to_python(column[pos])
+                for name, column in zip(self.columns, self.values)
+            }
+        return {
+            names[name]: _to_python(column[pos])
+            for name, column in zip(self.columns, self.values)
+            if name in names
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the column arrays (index only while spilled)"""
+        total = self.index.nbytes
+        for column in self._values or ():
+            if isinstance(column, np.memmap):
+                continue
+            total += column.nbytes
+            if column.dtype == object:
+                total += sum(
+                    len(v) if isinstance(v, str) else 8
+                    for v in column
+                )
+        return total
+
+
+class ConfigurationRow:
+    """Read-only view of a single configuration item inside a block"""
+
+    __slots__ = ("_block", "_pos")
+
+    def __init__(self, block: SheetBlock, pos: int):
+        self._block = block
+        self._pos = pos
+
+    @property
+    def id(self) -> str:
+        return self._block.row_id(self._pos)
+
+    @property
+    def type(self) -> str:
+        return self._block.config_type
+
+    @property
+    def sheet(self) -> str:
+        return self._block.sheet
+
+    @property
+    def row(self) -> int:
+        return int(self._block.index[self._pos]) + 1
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self._block.row_data(self._pos)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Wire format, matching the historical per-row dict"""
+        return {
+            "id": self.id,
+            "type": self.type,
+            "sheet": self.sheet,
+            "row": self.row,
+            "data": self.data
+        }
+
+    def __repr__(self) -> str:
+        return f"<ConfigurationRow {self.id} type={self.type}>"
+
+
+class ConfigurationBatch:
+    """Configuration items of a workbook, stored column-wise per sheet"""
+
+    __slots__ = ("blocks",)
+
+    def __init__(self, blocks: Optional[Sequence[SheetBlock]] = None):
+        self.blocks: List[SheetBlock] = [b for b in (blocks or []) if len(b)]
+
+    def add_block(self, block: SheetBlock):
+        if len(block):
+            self.blocks.append(block)
+
+    def __len__(self) -> int:
+        return sum(len(block) for block in self.blocks)
+
+    def __iter__(self) -> Iterator[ConfigurationRow]:
+        return self.iter_range()
+
+    def iter_range(self, start: int = 0, stop: Optional[int] = None) -> Iterator[ConfigurationRow]:
+        """Iterate rows [start, stop) in batch order without touching earlier blocks' rows"""
+        stop = len(self) if stop is None else stop
+        offset = 0
+        for block in self.blocks:
+            size = len(block)
+            if offset + size <= start:
+                offset += size
+                continue
+            if offset >= stop:
+                break
+            # Hold spilled blocks in memory only while their rows are being read
+            block.acquire()
+            try:
+                for pos in range(max(start - offset, 0), min(stop - offset, size)):
+                    yield ConfigurationRow(block, pos)
+            finally:
+                block.release()
+            offset += size
+
+    def select_ids(self, ids: Set[str]) -> "ConfigurationBatch":
+        """New batch holding only the rows whose id is in ``ids``"""
+        blocks = []
+        for block in self.blocks:
+            mask = np.fromiter(
+                (block.row_id(pos) in ids for pos in range(len(block))),
+                dtype=bool,
+                count=len(block)
+            )
+            if mask.any():
+                blocks.append(SheetBlock(
+                    sheet=block.sheet,
+                    config_type=block.config_type,
+                    columns=block.columns,
+                    values=[column[mask] for column in block.values],
+                    index=block.index[mask],
+                    part=block.part,
+                    properties=block.properties
+                ))
+        return ConfigurationBatch(blocks)
+
+    def select_rows(self, ranges: Sequence[Sequence[int]]) -> "ConfigurationBatch":
+        """New batch holding rows ``start:stop`` of the block at each [block index, start, stop]"""
+        blocks = []
+        for index, start, stop in ranges:
+            block = self.blocks[index]
+            block.acquire()
+            try:
+                # Copies, so the selection does not pin a spilled block's files
+                values = [np.array(column[start:stop]) for column in block.values]
+            finally:
+                block.release()
+            blocks.append(SheetBlock(
+                sheet=block.sheet,
+                config_type=block.config_type,
+                columns=block.columns,
+                values=values,
+                index=block.index[start:stop],
+                part=block.part,
+                properties=block.properties
+            ))
+        return ConfigurationBatch(blocks)
+
+    def ids(self) -> Set[str]:
+        return {block.row_id(pos) for block in self.blocks for pos in range(len(block))}
+
+    def types(self) -> List[str]:
+        """Distinct configuration types, in first-seen order"""
+        return list(dict.fromkeys(block.config_type for block in self.blocks))
+
+    def type_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for block in self.blocks:
+            counts[block.config_type] = counts.get(block.config_type, 0) + len(block)
+        return counts
+
+    def to_dicts(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Serialize rows for a response body"""
+        return [row.to_dict() for row in self.iter_range(start, stop)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(block.nbytes for block in self.blocks)
@@ -1,7 +1,8 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -16,6 +17,16 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
 )
 
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # API and job worker processes share the file: readers must not block
+        # the writer, and a writer waits for the lock instead of failing
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -31,5 +42,42 @@ def get_db():
 
 def init_db():
     """Initialize database tables"""
-    from app.models import SFConnection, Workbook, WorkbookVersion
+    from app.models import (
+        SFConnection, Workbook, WorkbookVersion,
+        ImplementationLog, ImplementationSnapshot, ImplementationResult,
+        ImplementationJob, JobUnit
+    )
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+
+def migrate_db():
+    """
+    Bring tables created by an older release up to the current models
+    create_all only creates missing tables, so columns added to existing
+    tables since are added here (nullable, so no backfill is needed).
+    API and worker processes may start together, so a column another process
+    added in the meantime is skipped instead of failing startup.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'
+                    ))
+            except DBAPIError as e:
+                # SQLite: "duplicate column name"; Postgres: "column ... already exists"
+                message = str(e.orig).lower()
+                if "duplicate column" not in message and "already exists" not in message:
+                    raise
+                continue
+            print(f"Added column {table.name}.{column.name}")
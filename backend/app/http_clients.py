@@ -0,0 +1,36 @@
+"""
+Shared outbound HTTP connection pools
+"""
+import os
+import importlib.util
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
+
+# HTTP/2 needs the optional h2 package (installed with httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(
+    max_connections: int = None,
+    max_keepalive_connections: int = None,
+    keepalive_expiry: float = None,
+    timeout: float = 30.0
+) -> "httpx.AsyncClient":
+    """
+    Build a bounded, keep-alive async HTTP client
+    Pool sizes default to HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE / HTTP_KEEPALIVE_EXPIRY
+    """
+    import httpx
+    
+    limits = httpx.Limits(
+        max_connections=max_connections or int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=max_keepalive_connections or int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=keepalive_expiry or float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+    )
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=limits,
+        timeout=timeout
+    )
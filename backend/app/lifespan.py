@@ -0,0 +1,132 @@
+"""
+Application lifespan and app-scoped service container
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+
+from app.database import init_db
+from app.http_clients import build_http_client
+from app.memory import MemoryBudget
+from app.services.sf_service import SuccessFactorsService
+from app.services.workbook_service import WorkbookService
+from app.services.version_control import VersionControlService
+from app.services.ai_bot import AIBotService
+from app.services.scheduler import TenantPolicy, TenantScheduler
+from app.services.single_flight import SingleFlight
+from app.services.job_leases import JobLeaseService
+from app.services.job_worker import JobWorker
+
+
+class ServiceContainer:
+    """Services and connection pools shared by every request handled by a worker"""
+    
+    def __init__(
+        self,
+        workbook_service: WorkbookService,
+        version_control: VersionControlService,
+        ai_bot: AIBotService,
+        sf_service: SuccessFactorsService,
+        scheduler: TenantScheduler,
+        single_flight: SingleFlight = None,
+        memory_budget: MemoryBudget = None,
+        job_leases: JobLeaseService = None,
+        http_clients: list = None
+    ):
+        self.workbook_service = workbook_service
+        self.version_control = version_control
+        self.ai_bot = ai_bot
+        self.sf_service = sf_service
+        self.scheduler = scheduler
+        self.single_flight = single_flight or SingleFlight()
+        self.memory_budget = memory_budget or MemoryBudget()
+        self.job_leases = job_leases or JobLeaseService(version_control)
+        self.http_clients = http_clients or []
+    
+    async def aclose(self):
+        """Close the shared HTTP pools, draining keep-alive connections"""
+        for client in self.http_clients:
+            await client.aclose()
+        self.http_clients = []
+
+
+def build_services() -> ServiceContainer:
+    """Build each service once per worker, with one HTTP pool per upstream"""
+    sf_http = build_http_client(timeout=30.0)
+    # LLM completions are slow, so that pool gets a longer timeout
+    llm_http = build_http_client(timeout=120.0)
+    # One memory budget for every job that parses workbooks in this worker
+    memory_budget = MemoryBudget()
+    version_control = VersionControlService()
+    # In-process jobs and leased job units follow the same tenant settings
+    policy = TenantPolicy()
+    return ServiceContainer(
+        workbook_service=WorkbookService(memory_budget=memory_budget),
+        version_control=version_control,
+        ai_bot=AIBotService(http_client=llm_http, memory_budget=memory_budget),
+        sf_service=SuccessFactorsService(http_client=sf_http),
+        scheduler=TenantScheduler(policy=policy),
+        single_flight=SingleFlight(),
+        memory_budget=memory_budget,
+        job_leases=JobLeaseService(version_control, policy=policy),
+        http_clients=[sf_http, llm_http]
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Initialize the database and app-scoped services; close pools on shutdown
+    Also runs an in-process job worker (JOB_WORKER_CONCURRENCY=0 leaves job
+    units to standalone worker.py processes).
+    """
+    init_db()
+    services = build_services()
+    app.state.services = services
+    worker = JobWorker(services.job_leases, services.workbook_service, services.ai_bot, services.sf_service)
+    worker_task = asyncio.create_task(worker.run()) if worker.concurrency > 0 else None
+    try:
+        yield
+    finally:
+        if worker_task is not None:
+            # Units in progress are handed back for another worker to pick up
+            worker_task.cancel()
+            await asyncio.gather(worker_task, return_exceptions=True)
+        await services.aclose()
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """Dependency returning the app-scoped service container"""
+    return request.app.state.services
+
+
+def get_workbook_service(request: Request) -> WorkbookService:
+    return get_services(request).workbook_service
+
+
+def get_version_control(request: Request) -> VersionControlService:
+    return get_services(request).version_control
+
+
+def get_ai_bot(request: Request) -> AIBotService:
+    return get_services(request).ai_bot
+
+
+def get_sf_service(request: Request) -> SuccessFactorsService:
+    return get_services(request).sf_service
+
+
+def get_scheduler(request: Request) -> TenantScheduler:
+    return get_services(request).scheduler
+
+
+def get_single_flight(request: Request) -> SingleFlight:
+    return get_services(request).single_flight
+
+
+def get_memory_budget(request: Request) -> MemoryBudget:
+    return get_services(request).memory_budget
+
+
+def get_job_leases(request: Request) -> JobLeaseService:
+    return get_services(request).job_leases
@@ -0,0 +1,346 @@
+"""
+Process memory budget: admission control, per-job accounting and spill-to-disk
+
+Heavy jobs (parsing a workbook into a ConfigurationBatch) reserve an estimate
+of their memory before they start; when the reservations or the process RSS
+are near the limit, new jobs wait in FIFO order instead of pushing the worker
+into the OOM killer. Within a job, sheet blocks beyond the job budget are
+spilled to temp files and result lists move to disk past a fixed length.
+Caches of parsed data are charged to the same budget and give their entries
+up when a job would otherwise have to wait.
+"""
+import os
+import time
+import pickle
+import asyncio
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.configuration_batch import SheetBlock
+
+# In-memory size of a parsed workbook relative to its file size
+EXPANSION_FACTORS = {".xlsx": 12.0, ".xls": 12.0, ".csv": 4.0}
+
+MB = 1024 * 1024
+
+
+def _detect_memory_limit() -> int:
+    """Container (cgroup) memory limit, else physical memory"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value)
+        except OSError:
+            continue
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 4096 * MB
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (Linux), None where unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def estimate_file_memory(file_path: str) -> int:
+    """Rough peak memory needed to parse a workbook file"""
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return 0
+    return estimate_parse_memory(size, file_path)
+
+
+def estimate_parse_memory(size: int, file_name: str) -> int:
+    """Rough peak memory needed to parse ``size`` bytes of a file with this name"""
+    return int(size * EXPANSION_FACTORS.get(os.path.splitext(file_name)[1].lower(), 8.0))
+
+
+class JobMemory:
+    """Resident bytes of one job's sheet blocks; spills the largest blocks past the budget"""
+
+    def __init__(self, budget: int, spill_dir: str, on_spill=None):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.peak = 0
+        self.spilled_bytes = 0
+        self._blocks: Dict[int, List[Any]] = {}
+        self._resident = 0
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+        self._on_spill = on_spill
+
+    def track(self, block: "SheetBlock"):
+        """Account for a new block and spill blocks until the job is within budget"""
+        size = block.nbytes
+        self._blocks[id(block)] = [block, size]
+        self._resident += size
+        self.peak = max(self.peak, self._resident)
+
+        if self._resident <= self.budget:
+            return
+        for entry in sorted(self._blocks.values(), key=lambda e: e[1], reverse=True):
+            if self._resident <= self.budget:
+                break
+            block, size = entry
+            if size and block.spill(self._spill_directory()):
+                self._resident -= size
+                self.spilled_bytes += size
+                entry[1] = 0
+                if self._on_spill is not None:
+                    self._on_spill(size)
+
+    def _spill_directory(self) -> tempfile.TemporaryDirectory:
+        # Removed once the last block referencing it is garbage collected
+        if self._directory is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._directory = tempfile.TemporaryDirectory(prefix="job-", dir=self.spill_dir)
+        return self._directory
+
+    @property
+    def resident(self) -> int:
+        return self._resident
+
+
+class MemoryBudget:
+    """Admission control for heavy jobs against a process-wide memory limit"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        job_budget: Optional[int] = None,
+        high_watermark: Optional[float] = None
+    ):
+        limit_mb = os.getenv("MEMORY_LIMIT_MB")
+        self.limit = limit or (int(limit_mb) * MB if limit_mb else _detect_memory_limit())
+        self.high_watermark = high_watermark or float(os.getenv("MEMORY_HIGH_WATERMARK", "0.85"))
+        self.job_budget = job_budget or int(os.getenv("MEMORY_JOB_BUDGET_MB", "256")) * MB
+        self.spill_dir = os.getenv("MEMORY_SPILL_DIR", os.path.join(tempfile.gettempdir(), "sfbot-spill"))
+        self.poll_interval = 0.5
+        self._reserved = 0
+        self._running = 0
+        self._waiting: Deque[object] = deque()
+        self._changed = asyncio.Event()
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.spilled_bytes = 0
+        self._caches: List["BudgetedCache"] = []
+
+    @property
+    def threshold(self) -> int:
+        return int(self.limit * self.high_watermark)
+
+    @property
+    def cached(self) -> int:
+        """Bytes held by the caches charged to this budget"""
+        return sum(cache.nbytes for cache in self._caches)
+
+    def register(self, cache: "BudgetedCache"):
+        self._caches.append(cache)
+
+    def _fits(self, estimate: int) -> bool:
+        # A job always runs when nothing else does, however large it is
+        if self._running == 0:
+            return True
+        if self._reserved + self.cached + estimate > self.threshold:
+            self._shed(self._reserved + self.cached + estimate - self.threshold)
+            if self._reserved + self.cached + estimate > self.threshold:
+                return False
+        rss = current_rss()
+        if rss is not None and rss + estimate > self.threshold:
+            # Freed entries show up in the RSS on a later poll
+            self._shed(rss + estimate - self.threshold)
+            return False
+        return True
+
+    def _shed(self, needed: int):
+        """Evict cache entries, least recently used first, until ``needed`` bytes are freed"""
+        for cache in self._caches:
+            if needed <= 0:
+                break
+            needed -= cache.shrink(needed)
+
+    @asynccontextmanager
+    async def admit(self, estimate: int):
+        """
+        Reserve ``estimate`` bytes for a job, waiting while the process is near its limit
+        Yields a JobMemory for the job's own accounting and spilling.
+        """
+        ticket = object()
+        self._waiting.append(ticket)
+        started = time.monotonic()
+        try:
+            while self._waiting[0] is not ticket or not self._fits(estimate):
+                self._changed.clear()
+                try:
+                    # RSS also drops without a release (GC), so poll as well
+                    await asyncio.wait_for(self._changed.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiting.remove(ticket)
+            self._changed.set()
+
+        self._reserved += estimate
+        self._running += 1
+        self.admitted += 1
+        self.total_wait += time.monotonic() - started
+        try:
+            yield self.job()
+        finally:
+            self._reserved -= estimate
+            self._running -= 1
+            self._changed.set()
+
+    def job(self) -> JobMemory:
+        return JobMemory(self.job_budget, self.spill_dir, on_spill=self._record_spill)
+
+    def _record_spill(self, size: int):
+        self.spilled_bytes += size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "threshold": self.threshold,
+            "rss": current_rss(),
+            "reserved": self._reserved,
+            "running": self._running,
+            "queued": len(self._waiting),
+            "admitted": self.admitted,
+            "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "job_budget": self.job_budget,
+            "spilled_bytes": self.spilled_bytes,
+            "cached": self.cached
+        }
+
+
+class BudgetedCache:
+    """
+    LRU cache bounded by entries and bytes, whose bytes are charged to a MemoryBudget
+    The budget evicts from it when admitting a job needs the room.
+    """
+
+    def __init__(self, budget: MemoryBudget, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+        self._nbytes = 0
+        # Entries are read and added from worker threads
+        self._lock = threading.Lock()
+        budget.register(self)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """Cache ``value`` as ``size`` bytes; values larger than the whole cache are not kept"""
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = [value, size]
+            self._nbytes += size
+            while len(self._entries) > self.max_items or self._nbytes > self.max_bytes:
+                self._nbytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def shrink(self, needed: int) -> int:
+        """Evict least recently used entries until ``needed`` bytes are freed; returns bytes freed"""
+        freed = 0
+        with self._lock:
+            while self._entries and freed < needed:
+                freed += self._entries.popitem(last=False)[1][1]
+            self._nbytes -= freed
+        return freed
+
+
+class SpillList:
+    """Append-only list whose items move to a temp file in chunks of ``max_items``"""
+
+    def __init__(self, max_items: Optional[int] = None):
+        self.max_items = max_items or int(os.getenv("MEMORY_SPILL_LIST_ITEMS", "50000"))
+        self._items: List[Any] = []
+        self._file = None
+        self._chunks: List[int] = []
+        self._spilled = 0
+
+    def append(self, item: Any):
+        self._items.append(item)
+        if len(self._items) >= self.max_items:
+            self._spill()
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.append(item)
+
+    def _spill(self):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        self._file.seek(0, os.SEEK_END)
+        self._chunks.append(self._file.tell())
+        pickle.dump(self._items, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled += len(self._items)
+        self._items = []
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._items)
+
+    def __iter__(self) -> Iterator[Any]:
+        for offset in list(self._chunks):
+            self._file.seek(offset)
+            yield from pickle.load(self._file)
+        yield from list(self._items)
+
+    def close(self):
+        """Drop the items and delete the temp file; the list is empty afterwards"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._items = []
+        self._chunks = []
+        self._spilled = 0
+
+    def __enter__(self) -> "SpillList":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def close_results(result: Dict):
+    """Close the SpillLists of an implementation result once it has been recorded"""
+    for value in result.values():
+        if isinstance(value, SpillList):
+            value.close()
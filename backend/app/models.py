@@ -1,7 +1,7 @@
 """
 Database models for SuccessFactors Configuration Bot
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, LargeBinary, Index, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -48,11 +48,20 @@ class WorkbookVersion(Base):
     file_path = Column(String(500), nullable=False)
     file_size = Column(Integer)
     checksum = Column(String(64))  # SHA256 checksum for version tracking
+    storage_kind = Column(String(20), default="file")  # file, keyframe or delta
+    base_version_id = Column(Integer, ForeignKey("workbook_versions.id"))  # Version a delta applies to
+    blob_path = Column(String(500))  # Keyframe/delta blob in the version store
+    stored_size = Column(Integer)  # Bytes on disk after compression
+    chain_digest = Column(String(32))  # Hash of the blobs the version is rebuilt from, set when stored
+    profile = Column(Text)  # JSON: per-sheet rows, dtypes, null counts, key cardinality, config types
+    sheet_count = Column(Integer)
+    total_rows = Column(Integer)
+    type_counts = Column(Text)  # JSON: configuration items per type, for list views
     changes_summary = Column(Text)
     created_by = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    workbook = relationship("Workbook", back_populates="versions")
+    workbook = relationship("Workbook", back_populates="versions", foreign_keys=[workbook_id])
 
 
 class ImplementationLog(Base):
@@ -64,6 +73,89 @@ class ImplementationLog(Base):
     connection_id = Column(Integer, ForeignKey("sf_connections.id"))
     status = Column(String(50))  # success, failed, partial
     changes_applied = Column(Integer, default=0)
-    errors = Column(Text)
+    errors = Column(Text)  # JSON: failed item counts by error class
     implementation_data = Column(Text)  # JSON string
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    snapshots = relationship("ImplementationSnapshot", back_populates="implementation_log", cascade="all, delete-orphan")
+
+
+class ImplementationSnapshot(Base):
+    """Tenant state of the entities touched by an implementation, captured before it ran"""
+    __tablename__ = "implementation_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    implementation_log_id = Column(Integer, ForeignKey("implementation_logs.id"), nullable=False, index=True)
+    config_type = Column(String(100))
+    entity_set = Column(String(255), nullable=False)
+    row_count = Column(Integer, default=0)  # Touched entity keys
+    data = Column(LargeBinary)  # zlib-compressed JSON: keys, properties, touched keys, prior records
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    implementation_log = relationship("ImplementationLog", back_populates="snapshots")
+
+
+class ImplementationResult(Base):
+    """Outcome of a single configuration item within an implementation"""
+    __tablename__ = "implementation_results"
+    __table_args__ = (
+        Index("ix_implementation_results_log_status", "implementation_log_id", "status"),
+        Index("ix_implementation_results_log_entity_type", "implementation_log_id", "entity_type"),
+        Index("ix_implementation_results_log_error_class", "implementation_log_id", "error_class"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    implementation_log_id = Column(Integer, ForeignKey("implementation_logs.id"), nullable=False)
+    config_item = Column(String(255))  # "<sheet>_<row index>"
+    entity_type = Column(String(100))  # Configuration type
+    entity_set = Column(String(255))
+    status = Column(String(20), nullable=False)  # success, rejected, held_back, failed
+    error_class = Column(String(50))
+    status_code = Column(Integer)
+    error = Column(Text)
+
+
+class ImplementationJob(Base):
+    """An implementation split into work units that any worker process can lease"""
+    __tablename__ = "implementation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    workbook_version_id = Column(Integer, ForeignKey("workbook_versions.id"), nullable=False)
+    connection_id = Column(Integer, ForeignKey("sf_connections.id"), nullable=False)
+    implementation_log_id = Column(Integer, ForeignKey("implementation_logs.id"))  # Collects every unit's results
+    status = Column(String(20), nullable=False, default="running")  # running, success, partial, failed
+    total_units = Column(Integer, default=0)
+    total_items = Column(Integer, default=0)
+    created_by = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime)
+    
+    units = relationship("JobUnit", back_populates="job", cascade="all, delete-orphan")
+
+
+class JobUnit(Base):
+    """A batch of configuration items of one type, leased to one worker at a time"""
+    __tablename__ = "job_units"
+    __table_args__ = (
+        Index("ix_job_units_job_level_status", "job_id", "level", "status"),
+        Index("ix_job_units_status_lease", "status", "lease_expires_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("implementation_jobs.id"), nullable=False)
+    level = Column(Integer, nullable=False, default=0)  # Dependency level; lower levels finish first
+    config_type = Column(String(100))
+    item_ids = Column(Text, nullable=False)  # JSON list of "<sheet>_<row index>" ids
+    row_ranges = Column(Text)  # JSON [block index, start, stop] spans of the items in the batch
+    item_count = Column(Integer, default=0)
+    status = Column(String(20), nullable=False, default="pending")  # pending, leased, done, failed
+    owner = Column(String(255))  # Worker id holding the lease
+    lease_expires_at = Column(DateTime)  # UTC; an expired lease may be claimed by another worker
+    heartbeat_at = Column(DateTime)
+    attempts = Column(Integer, default=0)
+    changes_applied = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    last_error = Column(Text)
+    snapshots_taken = Column(Boolean, default=False)  # Set by the first attempt to store its snapshots
+    
+    job = relationship("ImplementationJob", back_populates="units")
@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 
@@ -47,9 +47,17 @@ class WorkbookResponse(BaseModel):
     id: int
     name: str
     description: Optional[str]
-    connection_id: int
+    connection_id: Optional[int]
     created_at: datetime
     updated_at: Optional[datetime]
+    # Latest version, from its sheet profile index
+    latest_version_id: Optional[int] = None
+    latest_version_number: Optional[str] = None
+    sheet_count: Optional[int] = None
+    total_rows: Optional[int] = None
+    type_counts: Optional[Dict[str, int]] = None
+    complexity: Optional[str] = None
+    risk_level: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -63,6 +71,8 @@ class WorkbookVersionResponse(BaseModel):
     file_size: Optional[int]
     checksum: Optional[str]
     changes_summary: Optional[str]
+    sheet_count: Optional[int] = None
+    total_rows: Optional[int] = None
     created_at: datetime
     
     class Config:
@@ -2,17 +2,25 @@
 AI Bot service for intelligent configuration analysis and recommendations
 """
 import os
-import pandas as pd
-from typing import Dict, List, Any
-import json
+import asyncio
+import importlib.util
+from typing import Dict, List, Any, Optional, TYPE_CHECKING
 from dotenv import load_dotenv
 
-# For AI integration - can use OpenAI, LangChain, or other AI services
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+from app.memory import MB, BudgetedCache, JobMemory, MemoryBudget, estimate_file_memory
+from app.services.column_classifier import ColumnClassifier
+from app.services.prompt_builder import WorkbookPromptBuilder
+from app.services.workbook_profile import assess_complexity, assess_risk
+
+if TYPE_CHECKING:
+    import httpx
+    import pandas as pd
+    from app.configuration_batch import ConfigurationBatch
+
+# For AI integration - can use OpenAI, LangChain, or other AI services.
+# The client library is only imported when a client is actually built, since
+# importing openai dominates the cold start of a worker.
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 load_dotenv()
 
@@ -20,33 +28,94 @@ load_dotenv()
 class AIBotService:
     """AI-powered bot for analyzing and recommending SuccessFactors configurations"""
     
-    def __init__(self):
-        self.openai_client = None
-        if OPENAI_AVAILABLE and os.getenv("OPENAI_API_KEY"):
-            self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        http_client: Optional["httpx.AsyncClient"] = None,
+        memory_budget: Optional[MemoryBudget] = None
+    ):
+        # Shared keep-alive pool for LLM calls; owned by the app lifespan
+        self.http_client = http_client
+        # Process-wide admission control for workbook parsing
+        self.memory_budget = memory_budget or MemoryBudget()
+        self._openai_client = None
+        self._openai_client_built = False
+        # Recently extracted workbooks, so paging through rows does not re-parse;
+        # their resident bytes count against the memory budget
+        self._extraction_cache = BudgetedCache(
+            self.memory_budget,
+            max_items=int(os.getenv("AI_EXTRACTION_CACHE_SIZE", "4")),
+            max_bytes=int(os.getenv("AI_EXTRACTION_CACHE_MB", "512")) * MB
+        )
+        self.prompt_builder = WorkbookPromptBuilder()
+        self.column_classifier = ColumnClassifier()
+    
+    @property
+    def openai_client(self):
+        """OpenAI client, created on first use"""
+        if not self._openai_client_built:
+            self._openai_client_built = True
+            if OPENAI_AVAILABLE and os.getenv("OPENAI_API_KEY"):
+                from openai import AsyncOpenAI
+                self._openai_client = AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=self.http_client
+                )
+        return self._openai_client
+    
+    async def extract_configurations(self, file_path: str) -> Dict[str, Any]:
+        """
+        Read a workbook into a ConfigurationBatch plus rule-based recommendations
+        Results are cached per file path; stored versions are immutable.
+        """
+        cached = self._extraction_cache.get(file_path)
+        if cached is not None:
+            return cached
+        
+        async with self.memory_budget.admit(estimate_file_memory(file_path)) as job:
+            extraction = await asyncio.to_thread(self._extract_configurations, file_path, job)
+        # Spilled blocks are not resident, so only what stays in memory is charged
+        self._extraction_cache.put(file_path, extraction, extraction["configurations"].nbytes)
+        return extraction
+    
+    def _extract_configurations(self, file_path: str, job: Optional[JobMemory] = None) -> Dict[str, Any]:
+        import pandas as pd
+        from app.configuration_batch import ConfigurationBatch
+        
+        # Read workbook
+        if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
+            df_dict = pd.read_excel(file_path, sheet_name=None)
+        elif file_path.endswith('.csv'):
+            df_dict = {"Sheet1": pd.read_csv(file_path)}
+        else:
+            raise ValueError("Unsupported file format")
+        
+        # Extract configuration patterns
+        configurations = ConfigurationBatch()
+        recommendations = []
+        
+        while df_dict:
+            # Analyze each sheet, dropping its DataFrame once it is converted
+            sheet_name = next(iter(df_dict))
+            sheet_analysis = self._analyze_sheet(df_dict.pop(sheet_name), sheet_name)
+            for block in sheet_analysis["blocks"]:
+                configurations.add_block(block)
+                if job is not None:
+                    job.track(block)
+            recommendations.extend(sheet_analysis.get("recommendations", []))
+        
+        return {
+            "configurations": configurations,
+            "recommendations": recommendations
+        }
     
     async def analyze_workbook(self, file_path: str) -> Dict[str, Any]:
         """
         Analyze workbook using AI to understand configuration requirements
         """
         try:
-            # Read workbook
-            if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
-                df_dict = pd.read_excel(file_path, sheet_name=None)
-            elif file_path.endswith('.csv'):
-                df_dict = {"Sheet1": pd.read_csv(file_path)}
-            else:
-                return {"error": "Unsupported file format"}
-            
-            # Extract configuration patterns
-            configurations = []
-            recommendations = []
-            
-            for sheet_name, df in df_dict.items():
-                # Analyze each sheet
-                sheet_analysis = self._analyze_sheet(df, sheet_name)
-                configurations.extend(sheet_analysis.get("configurations", []))
-                recommendations.extend(sheet_analysis.get("recommendations", []))
+            extraction = await self.extract_configurations(file_path)
+            configurations = extraction["configurations"]
+            recommendations = list(extraction["recommendations"])
             
             # Use AI for intelligent recommendations if available
             if self.openai_client:
@@ -65,54 +134,55 @@ class AIBotService:
         except Exception as e:
             return {"error": str(e)}
     
-    def _analyze_sheet(self, df: pd.DataFrame, sheet_name: str) -> Dict:
+    def summarize_analysis(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Analysis without row data: counts, complexity, risk and recommendations"""
+        configurations = analysis["configurations"]
+        return {
+            "estimated_changes": analysis["estimated_changes"],
+            "type_counts": configurations.type_counts(),
+            "sheets": list(dict.fromkeys(block.sheet for block in configurations.blocks)),
+            "complexity": analysis["complexity"],
+            "risk_level": analysis["risk_level"],
+            "recommendations": analysis["recommendations"]
+        }
+    
+    def _analyze_sheet(self, df: "pd.DataFrame", sheet_name: str) -> Dict:
         """Analyze a single sheet for configuration patterns"""
-        configurations = []
         recommendations = []
         
-        # Detect configuration type based on column names
-        columns = [col.lower() for col in df.columns]
+        # Classify columns (memoized per header row); mixed sheets yield several blocks
+        plan = self.column_classifier.classify(df.columns)
+        blocks = plan.split(df, sheet_name)
+        config_types = {block.config_type for block in blocks}
         
-        if any("user" in col for col in columns) or any("employee" in col for col in columns):
-            config_type = "user"
+        if "user" in config_types:
             recommendations.append({
                 "type": "user_management",
                 "message": "Detected user/employee configuration. Ensure proper role assignments.",
                 "priority": "high"
             })
-        elif any("position" in col for col in columns):
-            config_type = "position"
-        elif any("job" in col for col in columns):
-            config_type = "job"
-        elif any("compensation" in col for col in columns) or any("salary" in col for col in columns):
-            config_type = "compensation"
+        if "compensation" in config_types:
             recommendations.append({
                 "type": "compensation",
                 "message": "Compensation changes detected. Review approval workflows.",
                 "priority": "high"
             })
-        else:
-            config_type = "generic"
-        
-        # Process each row as a configuration item
-        for idx, row in df.iterrows():
-            config_item = {
-                "id": f"{sheet_name}_{idx}",
-                "type": config_type,
-                "sheet": sheet_name,
-                "row": idx + 1,
-                "data": row.to_dict()
-            }
-            configurations.append(config_item)
+        if len(blocks) > 1:
+            recommendations.append({
+                "type": "mixed_sheet",
+                "message": f"Sheet '{sheet_name}' mixes {', '.join(sorted(config_types))} items; they are applied separately.",
+                "priority": "medium"
+            })
         
+        # Every row is a configuration item; keep them column-wise
         return {
-            "configurations": configurations,
+            "blocks": blocks,
             "recommendations": recommendations
         }
     
     async def _get_ai_recommendations(
         self,
-        configurations: List[Dict],
+        configurations: "ConfigurationBatch",
         file_path: str
     ) -> List[Dict]:
         """Get AI-powered recommendations"""
@@ -120,27 +190,10 @@ class AIBotService:
             return []
         
         try:
-            # Prepare prompt for AI
-            config_summary = {
-                "total_items": len(configurations),
-                "types": list(set(c.get("type") for c in configurations))
-            }
-            
-            prompt = f"""
-            Analyze this SuccessFactors configuration workbook:
-            - Total configuration items: {config_summary['total_items']}
-            - Configuration types: {', '.join(config_summary['types'])}
-            
-            Provide recommendations for:
-            1. Best practices for implementation
-            2. Potential risks or issues
-            3. Optimization suggestions
-            4. Required approvals or workflows
-            
-            Return as JSON array of recommendations.
-            """
+            # Prepare prompt for AI: per-sheet profiles bounded by the token budget
+            prompt = await asyncio.to_thread(self.prompt_builder.build, configurations)
             
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "You are a SuccessFactors configuration expert."},
@@ -165,20 +218,21 @@ class AIBotService:
             print(f"AI recommendation error: {str(e)}")
             return []
     
-    def _assess_complexity(self, configurations: List[Dict]) -> str:
+    def assess_profile(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Item counts, complexity and risk from a stored sheet profile, without reading the file"""
+        type_counts = profile["type_counts"]
+        estimated_changes = sum(type_counts.values())
+        return {
+            "estimated_changes": estimated_changes,
+            "type_counts": type_counts,
+            "complexity": assess_complexity(estimated_changes),
+            "risk_level": assess_risk(list(type_counts))
+        }
+    
+    def _assess_complexity(self, configurations: "ConfigurationBatch") -> str:
         """Assess complexity of configuration"""
-        count = len(configurations)
-        if count < 10:
-            return "low"
-        elif count < 50:
-            return "medium"
-        else:
-            return "high"
+        return assess_complexity(len(configurations))
     
-    def _assess_risk(self, configurations: List[Dict]) -> str:
+    def _assess_risk(self, configurations: "ConfigurationBatch") -> str:
         """Assess risk level of configuration"""
-        high_risk_types = ["compensation", "permission", "workflow"]
-        has_high_risk = any(
-            c.get("type") in high_risk_types for c in configurations
-        )
-        return "high" if has_high_risk else "medium"
+        return assess_risk(configurations.types())
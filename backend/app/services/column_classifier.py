@@ -0,0 +1,360 @@
+"""
+Rules-based classification of workbook columns
+
+Every header is matched against one compiled alternation of column rules, so
+a column is classified in a single regex pass and mapped to a configuration
+type, a role (key or attribute) and the SF property it most likely feeds.
+Sheet plans are memoized by a hash of the header row: recurring templates
+are classified once. A plan can split a sheet holding several entity types,
+either column-wise (e.g. user and position columns side by side) or row-wise
+by a discriminator column such as "Entity Type".
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from app.configuration_batch import SheetBlock
+
+# Preference order when types tie; the first four match the historical precedence
+TYPE_ORDER = [
+    "user", "position", "job", "compensation", "department",
+    "pay_grade", "permission", "workflow", "form_template", "rating_scale"
+]
+
+# (config type or None for shared columns, role, SF property, full-match pattern
+# on the normalized header). Earlier rules win when several match. "weak" attributes
+# are generic headers that only count for their type once its key is present.
+COLUMN_RULES: List[Tuple[Optional[str], str, str, str]] = [
+    ("user", "key", "userId", r"(user|employee|emp|person)_?(id|code|number|no|num)?"),
+    ("user", "attr", "firstName", r"(first|given)_?name"),
+    ("user", "attr", "lastName", r"(last|family)_?name|surname"),
+    ("user", "attr", "email", r"e_?mail(_?(address|id))?"),
+    ("user", "attr", "username", r"user_?name|login(_?name)?"),
+    ("user", "attr", "displayName", r"(employee|emp|full|display)_?name"),
+    ("user", "attr", "manager", r"(manager|supervisor)(_?(user_?)?id)?"),
+    ("user", "attr", "hireDate", r"hire_?date|(date_?of_?)?joining(_?date)?"),
+    ("user", "weak", "title", r"title|designation"),
+    ("user", "weak", "department", r"department|dept"),
+    ("user", "weak", "location", r"location|office"),
+    ("position", "key", "code", r"position(_?(id|code|number|no))?"),
+    ("position", "attr", "externalName_defaultValue", r"position_?(title|name|description)"),
+    ("position", "attr", "parentPosition", r"(parent|reports_?to)_?position(_?(id|code))?"),
+    ("position", "attr", "targetFTE", r"(target_?)?fte"),
+    ("position", "attr", "vacant", r"(is_?)?vacant"),
+    ("job", "key", "externalCode", r"job(_?(id|code|key|classification))?"),
+    ("job", "attr", "name", r"job_?(title|name)"),
+    ("job", "attr", "jobFunction", r"job_?(function|family)"),
+    ("job", "attr", "jobLevel", r"job_?level"),
+    ("compensation", "key", "externalCode", r"compensation_?(id|code)"),
+    ("compensation", "attr", "payComponent", r"pay_?component(_?(id|code))?"),
+    ("compensation", "attr", "paycompvalue",
+     r"(base_?)?salary|pay_?(amount|rate)|amount|compensation(_?amount)?"),
+    ("compensation", "attr", "currencyCode", r"currency(_?code)?"),
+    ("compensation", "attr", "frequency", r"(pay_?)?frequency"),
+    ("department", "key", "externalCode", r"(department|dept)_?(id|code|number|no)"),
+    ("department", "attr", "name", r"(department|dept)_?name"),
+    ("department", "attr", "costCenter", r"cost_?cent(er|re)(_?(id|code))?"),
+    ("department", "attr", "parent", r"parent_?(department|dept)(_?(id|code))?"),
+    ("department", "attr", "headOfUnit", r"head_?of_?(unit|department|dept)"),
+    ("pay_grade", "key", "externalCode", r"pay_?grade(_?(id|code))?"),
+    ("pay_grade", "attr", "name", r"pay_?grade_?name"),
+    ("pay_grade", "attr", "paygradeLevel", r"(pay_?)?grade_?level"),
+    ("permission", "key", "roleName", r"(permission_?)?role(_?(id|name))?|permission(_?(id|name))?"),
+    ("permission", "attr", "permissions", r"(permission|access)_?(level|type|rights?)"),
+    ("permission", "attr", "groupName", r"(permission_?|user_?)?group(_?name)?"),
+    ("workflow", "key", "externalCode", r"workflow(_?(id|code|name))?"),
+    ("workflow", "attr", "approverType", r"approver(_?(type|role|id))?"),
+    ("workflow", "attr", "stepNum", r"(step|stage)(_?(number|no|order))?"),
+    ("form_template", "key", "formTemplateId", r"form_?template(_?(id|name))?"),
+    ("form_template", "attr", "sectionName", r"(form_?)?section(_?name)?"),
+    ("rating_scale", "key", "scaleId", r"rating_?scale(_?(id|name))?"),
+    ("rating_scale", "attr", "scoreValue", r"(rating|score)(_?(value|label))?"),
+    (None, "shared", "externalCode", r"(external_?)?code|id"),
+    (None, "shared", "name", r"name|label"),
+    (None, "shared", "description", r"desc(ription)?"),
+    (None, "shared", "startDate", r"(effective_?)?start_?date|effective_?date|valid_?from"),
+    (None, "shared", "endDate", r"(effective_?)?end_?date|valid_?to"),
+    (None, "shared", "status", r"status|(is_?)?active"),
+]
+
+# Property a type's key takes when it is referenced from another type's rows
+REFERENCE_PROPERTIES = {
+    "user": "userId",
+    "position": "position",
+    "job": "jobCode",
+    "department": "department",
+    "pay_grade": "payGrade",
+    "compensation": "compensation",
+    "permission": "role",
+    "workflow": "workflow",
+    "form_template": "formTemplateId",
+    "rating_scale": "ratingScale",
+}
+
+# Attributes that name or point at an item rather than describe it. On another
+# type's rows (Position Title next to Position Code on a user row) they travel
+# with the reference, so they do not make their type stand on its own there.
+LINK_PROPERTIES = {"externalName_defaultValue", "name", "manager", "parentPosition", "parent", "headOfUnit"}
+
+# Property holding a type's own key
+KEY_PROPERTIES = {config_type: prop for config_type, role, prop, _ in COLUMN_RULES if role == "key"}
+
+# Header of a column naming each row's configuration type
+DISCRIMINATOR_PATTERN = re.compile(r"(config(uration)?|entity|object|record|item)_?type")
+
+# Discriminator cell values -> configuration type
+TYPE_ALIASES = {
+    "user": "user", "users": "user", "employee": "user", "employees": "user",
+    "position": "position", "positions": "position",
+    "job": "job", "jobs": "job", "jobcode": "job", "jobclassification": "job",
+    "compensation": "compensation", "salary": "compensation", "paycomponent": "compensation",
+    "department": "department", "departments": "department", "dept": "department",
+    "paygrade": "pay_grade", "permission": "permission", "role": "permission",
+    "workflow": "workflow", "formtemplate": "form_template", "ratingscale": "rating_scale",
+}
+
+# Substring hints for headers no rule recognizes (the original classification)
+FALLBACK_HINTS = [
+    ("user", re.compile(r"user|employee")),
+    ("position", re.compile(r"position")),
+    ("job", re.compile(r"job")),
+    ("compensation", re.compile(r"compensation|salary")),
+]
+
+_RULES_PATTERN = re.compile("|".join(
+    f"(?P<r{i}>{pattern})" for i, (_, _, _, pattern) in enumerate(COLUMN_RULES)
+))
+
+
+def normalize_header(header) -> str:
+    """Lower-case header with runs of non-alphanumerics collapsed to "_" """
+    return re.sub(r"[^a-z0-9]+", "_", str(header).lower()).strip("_")
+
+
+def _normalize_value(value) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+
+def classify_column(header) -> Optional[Tuple[Optional[str], str, str]]:
+    """(config type, role, SF property) of a header, or None when no rule matches"""
+    match = _RULES_PATTERN.fullmatch(normalize_header(header))
+    if match is None:
+        return None
+    config_type, role, prop, _ = COLUMN_RULES[int(match.lastgroup[1:])]
+    return config_type, role, prop
+
+
+def key_column(columns: Sequence[str], properties: Dict[str, str], config_type: str) -> Optional[int]:
+    """Position of the column holding the items' own key, None when there is none"""
+    shared = None
+    for i, column in enumerate(columns):
+        rule = classify_column(column)
+        if properties.get(column) == KEY_PROPERTIES.get(config_type) or rule == (
+            config_type, "key", KEY_PROPERTIES.get(config_type)
+        ):
+            return i
+        if shared is None and (properties.get(column) == "externalCode" or rule == (None, "shared", "externalCode")):
+            shared = i
+    return shared
+
+
+def reference_column(columns: Sequence[str], properties: Dict[str, str], parent_type: str) -> Optional[int]:
+    """Position of the column referencing an item of ``parent_type``, None when there is none"""
+    prop = REFERENCE_PROPERTIES.get(parent_type)
+    names = {parent_type, normalize_header(prop or parent_type)}
+    for i, column in enumerate(columns):
+        rule = classify_column(column)
+        if properties.get(column) == prop or normalize_header(column) in names:
+            return i
+        if rule is not None and rule[0] == parent_type and rule[1] == "key":
+            return i
+    return None
+
+
+class SheetPart:
+    """Columns of a sheet that make up the items of one configuration type"""
+
+    __slots__ = ("config_type", "columns", "properties")
+
+    def __init__(self, config_type: str, columns: Tuple[int, ...], properties: Dict[int, str]):
+        self.config_type = config_type
+        self.columns = columns
+        self.properties = properties
+
+
+class SheetPlan:
+    """How to turn a sheet with a given header row into SheetBlocks"""
+
+    __slots__ = ("parts", "discriminator", "properties")
+
+    def __init__(self, parts: List[SheetPart], discriminator: Optional[int], properties: Dict[int, str]):
+        self.parts = parts
+        self.discriminator = discriminator
+        # Per-column property hints over the whole sheet (used for row-wise splits)
+        self.properties = properties
+
+    @property
+    def config_types(self) -> List[str]:
+        return [part.config_type for part in self.parts]
+
+    def split(self, df: "pd.DataFrame", sheet: str) -> List["SheetBlock"]:
+        """Blocks for a sheet matching this plan"""
+        from app.configuration_batch import SheetBlock
+
+        names = [str(c) for c in df.columns]
+
+        if self.discriminator is not None:
+            row_types = df.iloc[:, self.discriminator].map(
+                lambda v: TYPE_ALIASES.get(_normalize_value(v), self.parts[0].config_type)
+            )
+            data = df.drop(columns=df.columns[self.discriminator])
+            blocks = []
+            for config_type in dict.fromkeys(row_types):
+                rows = data[(row_types == config_type).to_numpy()]
+                rows = rows.loc[:, rows.notna().any().to_numpy()]
+                kept = set(str(c) for c in rows.columns)
+                blocks.append(SheetBlock.from_frame(
+                    rows, sheet, config_type,
+                    properties={names[i]: p for i, p in self.properties.items() if names[i] in kept}
+                ))
+            return blocks
+
+        if len(self.parts) == 1:
+            part = self.parts[0]
+            return [SheetBlock.from_frame(
+                df, sheet, part.config_type,
+                properties={names[i]: p for i, p in part.properties.items()}
+            )]
+
+        return [
+            SheetBlock.from_frame(
+                df.iloc[:, list(part.columns)], sheet, part.config_type,
+                part=part.config_type,
+                properties={names[i]: p for i, p in part.properties.items()}
+            )
+            for part in self.parts
+        ]
+
+
+class ColumnClassifier:
+    """Classifies sheets by their header row; plans are cached by header hash"""
+
+    def __init__(self, cache_size: Optional[int] = None):
+        self.cache_size = cache_size or int(os.getenv("COLUMN_CLASSIFIER_CACHE_SIZE", "256"))
+        self._plans: "OrderedDict[str, SheetPlan]" = OrderedDict()
+        # Extraction runs in worker threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def header_key(columns: Sequence) -> str:
+        joined = "\x1f".join(normalize_header(c) for c in columns)
+        return hashlib.blake2b(joined.encode(), digest_size=16).hexdigest()
+
+    def classify(self, columns: Sequence) -> SheetPlan:
+        """Plan for a header row, from the cache when the template was seen before"""
+        key = self.header_key(columns)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        plan = self._build_plan(columns)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.cache_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _build_plan(self, columns: Sequence) -> SheetPlan:
+        keys: Dict[str, List[int]] = {}
+        attrs: Dict[str, List[int]] = {}
+        weak: Dict[str, List[int]] = {}
+        hints: Dict[int, Tuple[Optional[str], str, str]] = {}
+        discriminator = None
+
+        for i, header in enumerate(columns):
+            if discriminator is None and DISCRIMINATOR_PATTERN.fullmatch(normalize_header(header)):
+                discriminator = i
+                continue
+            rule = classify_column(header)
+            if rule is None:
+                continue
+            hints[i] = rule
+            config_type, role, _ = rule
+            if role == "key":
+                keys.setdefault(config_type, []).append(i)
+            elif role == "attr":
+                attrs.setdefault(config_type, []).append(i)
+            elif role == "weak":
+                weak.setdefault(config_type, []).append(i)
+
+        # "Title" next to "Job Code" describes the job, not a user
+        for config_type, found in weak.items():
+            if config_type in keys:
+                attrs.setdefault(config_type, []).extend(found)
+
+        rank = {t: n for n, t in enumerate(TYPE_ORDER)}
+        # A type stands on its own with a key and an attribute, or two attributes
+        primary = [
+            t for t in TYPE_ORDER
+            if t in attrs and (t in keys or len(attrs[t]) >= 2)
+        ]
+        # Further types split the sheet only with their own key and a describing attribute;
+        # otherwise their columns stay on the first type's items as references
+        primary = primary[:1] + [
+            t for t in primary[1:]
+            if t in keys and any(hints[i][2] not in LINK_PROPERTIES for i in attrs[t])
+        ]
+        if not primary:
+            # Attributes weigh more than keys: salary + userId is compensation
+            scores = {t: 2 * len(attrs.get(t, [])) + len(keys.get(t, [])) for t in set(keys) | set(attrs)}
+            if scores:
+                primary = [min(scores, key=lambda t: (-scores[t], rank[t]))]
+            else:
+                lowered = " ".join(str(c).lower() for c in columns)
+                primary = [next((t for t, hint in FALLBACK_HINTS if hint.search(lowered)), "generic")]
+
+        sheet_properties = {i: rule[2] for i, rule in hints.items()}
+        if len(primary) == 1:
+            config_type = primary[0]
+            properties = {}
+            for i, (rule_type, role, prop) in hints.items():
+                if rule_type in (None, config_type):
+                    properties[i] = prop
+                elif role == "key":
+                    properties[i] = REFERENCE_PROPERTIES.get(rule_type, prop)
+            part = SheetPart(config_type, tuple(range(len(columns))), properties)
+            return SheetPlan([part], discriminator, sheet_properties)
+
+        # Several types side by side: each gets its own columns plus the shared ones
+        owned = {i for t in primary for i in keys.get(t, []) + attrs.get(t, [])}
+        shared = [i for i in range(len(columns)) if i not in owned and i != discriminator]
+        parts = []
+        for config_type in primary:
+            own = keys.get(config_type, []) + attrs.get(config_type, [])
+            properties = {i: hints[i][2] for i in own}
+            for i in shared:
+                if i in hints:
+                    rule_type, role, prop = hints[i]
+                    if rule_type is None:
+                        properties[i] = prop
+                    elif role == "key":
+                        properties[i] = REFERENCE_PROPERTIES.get(rule_type, prop)
+            # Keys of the other parts link the split items back together
+            for other in primary:
+                if other != config_type:
+                    for i in keys.get(other, []):
+                        properties[i] = REFERENCE_PROPERTIES.get(other, hints[i][2])
+            linked = [i for other in primary if other != config_type for i in keys.get(other, [])]
+            parts.append(SheetPart(config_type, tuple(sorted(set(own + shared + linked))), properties))
+        return SheetPlan(parts, discriminator, sheet_properties)
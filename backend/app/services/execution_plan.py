@@ -0,0 +1,204 @@
+"""
+Dependency-aware execution plan for configuration items
+
+Configuration types are ordered into levels of a dependency DAG (a Position
+needs its Department, a User needs its Job, ...). Types within a level are
+independent and their items are dispatched concurrently; a level only starts
+once the previous one has finished. Items whose parent failed are held back
+instead of being sent to fail remotely: by the parent key they reference when
+one resolves, else whenever the parent type had a failure.
+"""
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set
+
+# config type -> config types that must be applied before it
+ENTITY_DEPENDENCIES: Dict[str, List[str]] = {
+    "position": ["department"],
+    "job": ["position"],
+    "user": ["job"],
+    "compensation": ["pay_grade", "user"],
+    "permission": ["user"],
+    "workflow": ["permission"],
+    "form_template": ["rating_scale"]
+}
+
+
+def reverse_dependencies(dependencies: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """Dependencies with every edge flipped, for undoing work children-first"""
+    reversed_map: Dict[str, List[str]] = {}
+    for child, parents in (ENTITY_DEPENDENCIES if dependencies is None else dependencies).items():
+        for parent in parents:
+            reversed_map.setdefault(parent, []).append(child)
+    return reversed_map
+
+
+class ExecutionPlanner:
+    """Plans configuration types into levels and runs each level in parallel"""
+
+    def __init__(
+        self,
+        dependencies: Optional[Dict[str, List[str]]] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        self.dependencies = ENTITY_DEPENDENCIES if dependencies is None else dependencies
+        self.max_concurrency = max_concurrency or int(os.getenv("SF_MAX_CONCURRENCY", "8"))
+
+    def parents_of(self, config_type: str, present: Set[str]) -> List[str]:
+        """Parents of a type, following absent types through to present ancestors"""
+        parents = []
+        pending = list(self.dependencies.get(config_type, []))
+        seen = set()
+        while pending:
+            parent = pending.pop()
+            if parent in seen:
+                continue
+            seen.add(parent)
+            if parent in present:
+                parents.append(parent)
+            else:
+                pending.extend(self.dependencies.get(parent, []))
+        return parents
+
+    def plan(self, config_types: Iterable[str]) -> List[List[str]]:
+        """Group the given types into dependency levels (Kahn's algorithm)"""
+        present = set(config_types)
+        parents = {t: set(self.parents_of(t, present)) for t in present}
+        levels = []
+        done: Set[str] = set()
+        while len(done) < len(present):
+            level = sorted(t for t in present - done if parents[t] <= done)
+            if not level:
+                raise ValueError(f"Dependency cycle among: {', '.join(sorted(present - done))}")
+            levels.append(level)
+            done.update(level)
+        return levels
+
+    async def execute(
+        self,
+        work: Dict[str, Callable[[], Iterator[Any]]],
+        dispatch: Callable[[Any], Awaitable[Optional[Dict]]],
+        describe: Callable[[Any], str],
+        entity_set: Optional[Callable[[Any], Optional[str]]] = None,
+        failed_types: Optional[Set[str]] = None,
+        on_success: Optional[Callable[[str, Any], None]] = None,
+        errors: Optional[List[Dict]] = None,
+        key: Optional[Callable[[Any], Optional[Hashable]]] = None,
+        reference: Optional[Callable[[Any, str], Optional[Hashable]]] = None,
+        failed_keys: Optional[Dict[str, Set[Hashable]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run the plan
+        ``work`` maps each type to a factory of its items, ``dispatch`` sends one
+        item and returns an error dict or None, ``describe`` gives an item id.
+        ``entity_set`` gives the entity set an item targets, for held-back errors.
+        ``key(item)`` gives an item's own key and ``reference(item, parent_type)``
+        the parent key it refers to; an item is held back when that parent key
+        failed or was held back, and on any failure of the parent type only when
+        it has no reference to resolve.
+        ``failed_types`` seeds types that failed with unknown keys and ``failed_keys``
+        seeds failed keys by type (e.g. local validation, earlier job units).
+        ``on_success(config_type, item)`` is called for every applied item.
+        ``errors`` is an optional list-like sink the error dicts are appended to.
+        """
+        failures: Dict[str, Set[Hashable]] = {t: set(keys) for t, keys in (failed_keys or {}).items()}
+        # Types with a failure whose key is unknown block every child item
+        unkeyed = set(failed_types or ())
+        held_keys: Dict[str, Set[Hashable]] = {}
+        present = set(work) | set(failures) | unkeyed
+        succeeded = 0
+        held_back = 0
+        errors = [] if errors is None else errors
+        levels = self.plan(work)
+
+        def record_failure(config_type: str, item: Any):
+            item_key = key(item) if key is not None else None
+            if item_key is None:
+                unkeyed.add(config_type)
+            else:
+                failures.setdefault(config_type, set()).add(item_key)
+
+        def blocked_by(item: Any, parents: List[str]) -> List[str]:
+            reasons = []
+            for parent in parents:
+                ref = reference(item, parent) if reference is not None else None
+                if parent in unkeyed or (ref is None and failures.get(parent)):
+                    reasons.append(f"parent type {parent} had failures")
+                elif ref is not None and (ref in failures.get(parent, ()) or ref in held_keys.get(parent, ())):
+                    reasons.append(f"parent {parent} {ref} was not applied")
+            return reasons
+
+        def gated(config_type: str, parents: List[str]) -> Callable[[], Iterator[Any]]:
+            def items():
+                nonlocal held_back
+                for item in work[config_type]():
+                    reasons = blocked_by(item, parents)
+                    if not reasons:
+                        yield item
+                        continue
+                    held_back += 1
+                    # Its own children are held back by this key only, not by type
+                    item_key = key(item) if key is not None else None
+                    if item_key is not None:
+                        held_keys.setdefault(config_type, set()).add(item_key)
+                    errors.append({
+                        "config_item": describe(item),
+                        "type": config_type,
+                        "entity_set": entity_set(item) if entity_set is not None else None,
+                        "error": f"Held back: {'; '.join(reasons)}",
+                        "stage": "held_back"
+                    })
+            return items
+
+        for level in levels:
+            runnable = {}
+            for config_type in level:
+                parents = [
+                    p for p in self.parents_of(config_type, present)
+                    if p in unkeyed or failures.get(p) or held_keys.get(p)
+                ]
+                runnable[config_type] = gated(config_type, parents) if parents else work[config_type]
+
+            succeeded += await self._run_level(runnable, dispatch, on_success, errors, record_failure)
+
+        return {
+            "succeeded": succeeded,
+            "held_back": held_back,
+            "errors": errors,
+            "levels": levels
+        }
+
+    async def _run_level(
+        self,
+        work: Dict[str, Callable[[], Iterator[Any]]],
+        dispatch: Callable[[Any], Awaitable[Optional[Dict]]],
+        on_success: Optional[Callable[[str, Any], None]] = None,
+        errors: Optional[List[Dict]] = None,
+        on_failure: Optional[Callable[[str, Any], None]] = None
+    ) -> int:
+        """Drain every type of a level through a bounded pool of workers; returns items applied"""
+        def items():
+            for config_type, factory in work.items():
+                for item in factory():
+                    yield config_type, item
+
+        queue = items()
+        succeeded = 0
+        errors = [] if errors is None else errors
+
+        async def worker():
+            nonlocal succeeded
+            # A shared generator keeps memory flat regardless of item count
+            for config_type, item in queue:
+                error = await dispatch(item)
+                if error is None:
+                    succeeded += 1
+                    if on_success is not None:
+                        on_success(config_type, item)
+                else:
+                    errors.append(error)
+                    if on_failure is not None:
+                        on_failure(config_type, item)
+
+        await asyncio.gather(*(worker() for _ in range(self.max_concurrency)))
+        return succeeded
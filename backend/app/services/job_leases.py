@@ -0,0 +1,494 @@
+"""
+Database-backed job leases for distributing implementations across workers
+
+An implementation job is split into work units: batches of configuration item
+ids of one type, tagged with the dependency level of that type. Any worker
+process sharing the database claims a unit with a conditional UPDATE, so two
+workers never hold the same lease, keeps it alive with heartbeats and records
+the unit's results on the job's implementation log. A unit whose lease
+expires (its worker crashed or stalled) becomes claimable again, so delivery
+is at-least-once. Units of a level are only claimable once every unit of the
+lower levels of the same job has finished (parents before children); a unit
+then holds back only the items referencing parent items that were not applied.
+Claims follow the TenantPolicy used by the in-process scheduler: tenants by
+priority, then by leased units per unit of weight, never past their cap.
+"""
+import os
+import json
+import uuid
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from sqlalchemy import and_, or_, case, exists, func
+from sqlalchemy.orm import Session, aliased
+
+from app.models import ImplementationJob, ImplementationLog, JobUnit, SFConnection
+from app.services.execution_plan import ExecutionPlanner
+from app.services.scheduler import PRIORITIES, TenantPolicy
+
+if TYPE_CHECKING:
+    from app.configuration_batch import ConfigurationBatch
+    from app.models import WorkbookVersion
+    from app.services.version_control import VersionControlService
+
+UNFINISHED_STATUSES = ("pending", "leased")
+
+# Candidates read per claim attempt; others may win the race for some of them
+CLAIM_CANDIDATES = 8
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, stored and compared the same way on SQLite and Postgres"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def row_ranges(blocks: List[Tuple[int, int]], start: int, stop: int) -> List[List[int]]:
+    """
+    [block index, start, stop] spans covering items ``start:stop`` of one type
+    ``blocks`` are the (block index, row count) pairs of the type, in item order.
+    """
+    spans = []
+    offset = 0
+    for index, size in blocks:
+        first, last = max(start - offset, 0), min(stop - offset, size)
+        if first < last:
+            spans.append([index, first, last])
+        offset += size
+        if offset >= stop:
+            break
+    return spans
+
+
+def default_worker_id() -> str:
+    """Worker id unique across hosts, processes and restarts"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobLeaseService:
+    """Creates leased work units for implementations and hands them out to workers"""
+
+    def __init__(
+        self,
+        version_control: "VersionControlService",
+        unit_size: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        policy: Optional[TenantPolicy] = None
+    ):
+        self.version_control = version_control
+        self.policy = policy or TenantPolicy()
+        self.unit_size = unit_size or int(os.getenv("JOB_UNIT_SIZE", "500"))
+        self.lease_seconds = lease_seconds or int(os.getenv("JOB_LEASE_SECONDS", "60"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.planner = ExecutionPlanner()
+
+    def create_job(
+        self,
+        version: "WorkbookVersion",
+        connection: "SFConnection",
+        configurations: "ConfigurationBatch",
+        db: Session,
+        created_by: Optional[int] = None
+    ) -> ImplementationJob:
+        """
+        Split a workbook's configuration items into units of at most ``unit_size`` ids
+        Each unit also records where its rows sit in the batch, so a worker selects
+        them by position instead of scanning every row id of the workbook.
+        """
+        ids_by_type: Dict[str, List[str]] = {}
+        blocks_by_type: Dict[str, List[Tuple[int, int]]] = {}
+        for index, block in enumerate(configurations.blocks):
+            ids_by_type.setdefault(block.config_type, []).extend(
+                block.row_id(pos) for pos in range(len(block))
+            )
+            blocks_by_type.setdefault(block.config_type, []).append((index, len(block)))
+        levels = self.planner.plan(ids_by_type)
+
+        log = ImplementationLog(
+            workbook_version_id=version.id,
+            connection_id=connection.id,
+            status="running",
+            changes_applied=0,
+            implementation_data=json.dumps({"execution_levels": levels})
+        )
+        db.add(log)
+        db.flush()
+
+        job = ImplementationJob(
+            workbook_version_id=version.id,
+            connection_id=connection.id,
+            implementation_log_id=log.id,
+            status="running",
+            created_by=created_by
+        )
+        for level, config_types in enumerate(levels):
+            for config_type in config_types:
+                ids = ids_by_type[config_type]
+                for start in range(0, len(ids), self.unit_size):
+                    chunk = ids[start:start + self.unit_size]
+                    job.units.append(JobUnit(
+                        level=level,
+                        config_type=config_type,
+                        item_ids=json.dumps(chunk),
+                        row_ranges=json.dumps(
+                            row_ranges(blocks_by_type[config_type], start, start + len(chunk))
+                        ),
+                        item_count=len(chunk),
+                        status="pending"
+                    ))
+        job.total_units = len(job.units)
+        job.total_items = sum(len(ids) for ids in ids_by_type.values())
+        db.add(job)
+        db.commit()
+
+        if not job.units:
+            self.finish_if_done(job.id, db)
+        db.refresh(job)
+        return job
+
+    def _claimable(self, now: datetime):
+        return and_(
+            JobUnit.attempts < self.max_attempts,
+            or_(
+                JobUnit.status == "pending",
+                and_(JobUnit.status == "leased", JobUnit.lease_expires_at < now)
+            )
+        )
+
+    def _leased(self, now: datetime):
+        return and_(JobUnit.status == "leased", JobUnit.lease_expires_at >= now)
+
+    @staticmethod
+    def _per_tenant(column, db: Session):
+        return db.query(SFConnection.company_id, column).select_from(JobUnit).join(ImplementationJob).join(
+            SFConnection, ImplementationJob.connection_id == SFConnection.id
+        )
+
+    def claim(self, worker_id: str, db: Session) -> Optional[JobUnit]:
+        """
+        Lease the next runnable unit to ``worker_id``, or None when there is none
+        Tenants with runnable units are tried by priority, then by fewest leased
+        units per unit of weight, skipping those at their cap; within a tenant,
+        oldest job first, lowest level first. Expired leases are taken over.
+        """
+        self.reap_expired(db)
+        now = utcnow()
+        earlier = aliased(JobUnit)
+        blocked = exists().where(
+            earlier.job_id == JobUnit.job_id,
+            earlier.level < JobUnit.level,
+            earlier.status.in_(UNFINISHED_STATUSES)
+        )
+        # Oldest job with a runnable unit, and units currently leased, per tenant
+        runnable = dict(self._per_tenant(func.min(JobUnit.job_id), db).filter(
+            ImplementationJob.status == "running",
+            self._claimable(now),
+            ~blocked
+        ).group_by(SFConnection.company_id).all())
+        if not runnable:
+            return None
+        leased = dict(self._per_tenant(func.count(JobUnit.id), db).filter(
+            self._leased(now)
+        ).group_by(SFConnection.company_id).all())
+
+        tenants = sorted(
+            (t for t in runnable if leased.get(t, 0) < self.policy.cap(t)),
+            key=lambda t: (
+                PRIORITIES[self.policy.priority(t)],
+                leased.get(t, 0) / self.policy.weight(t),
+                runnable[t]
+            )
+        )
+        for tenant in tenants:
+            unit = self._claim_for(tenant, worker_id, now, blocked, db)
+            if unit is not None:
+                return unit
+        return None
+
+    def _claim_for(self, tenant: str, worker_id: str, now: datetime, blocked, db: Session) -> Optional[JobUnit]:
+        tenant_jobs = db.query(ImplementationJob.id).join(
+            SFConnection, ImplementationJob.connection_id == SFConnection.id
+        ).filter(SFConnection.company_id == tenant)
+        candidates = db.query(JobUnit.id).join(ImplementationJob).filter(
+            ImplementationJob.status == "running",
+            JobUnit.job_id.in_(tenant_jobs),
+            self._claimable(now),
+            ~blocked
+        ).order_by(JobUnit.job_id, JobUnit.level, JobUnit.id).limit(CLAIM_CANDIDATES).all()
+
+        running = aliased(JobUnit)
+        tenant_leased = db.query(func.count(running.id)).filter(
+            running.job_id.in_(tenant_jobs),
+            running.status == "leased",
+            running.lease_expires_at >= now
+        ).scalar_subquery()
+        for (unit_id,) in candidates:
+            # Compare-and-set: only one worker's UPDATE matches the unclaimed row,
+            # and none once the tenant's leased units reach its cap
+            claimed = db.query(JobUnit).filter(
+                JobUnit.id == unit_id,
+                self._claimable(now),
+                tenant_leased < self.policy.cap(tenant)
+            ).update({
+                "status": "leased",
+                "owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                "heartbeat_at": now,
+                "attempts": JobUnit.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return db.query(JobUnit).filter(JobUnit.id == unit_id).first()
+        return None
+
+    def heartbeat(self, unit_id: int, worker_id: str, db: Session) -> bool:
+        """Extend a lease; False when the worker no longer holds it"""
+        now = utcnow()
+        extended = db.query(JobUnit).filter(
+            JobUnit.id == unit_id,
+            JobUnit.owner == worker_id,
+            JobUnit.status == "leased"
+        ).update({
+            "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+            "heartbeat_at": now
+        }, synchronize_session=False)
+        db.commit()
+        return extended == 1
+
+    def complete(self, unit_id: int, worker_id: str, result: Dict, db: Session) -> bool:
+        """
+        Record a unit's results on the job's log and mark it done, in one transaction
+        Returns False (and records nothing) when the lease was lost to another worker.
+        """
+        errors = result.get("errors", [])
+        done = db.query(JobUnit).filter(
+            JobUnit.id == unit_id,
+            JobUnit.owner == worker_id,
+            JobUnit.status == "leased"
+        ).update({
+            "status": "done",
+            "lease_expires_at": None,
+            "changes_applied": result.get("changes_count", 0),
+            "error_count": len(errors)
+        }, synchronize_session=False)
+        if not done:
+            db.rollback()
+            return False
+
+        unit = db.query(JobUnit).filter(JobUnit.id == unit_id).first()
+        log = db.query(ImplementationLog).filter(
+            ImplementationLog.id == unit.job.implementation_log_id
+        ).first()
+        self.version_control.append_results(log, result, db)
+        db.commit()
+        self.finish_if_done(unit.job_id, db)
+        return True
+
+    def keep_snapshots(self, unit_id: int, snapshots: List[Dict], db: Session) -> bool:
+        """
+        Store a unit's pre-implementation snapshots unless an earlier attempt already did
+        A re-run after a crash sees the state its first attempt wrote, so only the
+        first capture can undo it. Returns False when the first one was kept.
+        """
+        taken = db.query(JobUnit).filter(
+            JobUnit.id == unit_id,
+            JobUnit.snapshots_taken.isnot(True)
+        ).update({"snapshots_taken": True}, synchronize_session=False)
+        if not taken:
+            db.rollback()
+            return False
+
+        unit = db.query(JobUnit).filter(JobUnit.id == unit_id).first()
+        log = db.query(ImplementationLog).filter(
+            ImplementationLog.id == unit.job.implementation_log_id
+        ).first()
+        self.version_control.append_snapshots(log, snapshots, db)
+        db.commit()
+        return True
+
+    def release(
+        self,
+        unit_id: int,
+        worker_id: str,
+        error: str,
+        db: Session,
+        count_attempt: bool = True
+    ) -> bool:
+        """
+        Give a unit back after a failed attempt; it fails for good after ``max_attempts``
+        ``count_attempt=False`` (e.g. on worker shutdown) does not use up an attempt.
+        """
+        unit = db.query(JobUnit).filter(
+            JobUnit.id == unit_id,
+            JobUnit.owner == worker_id,
+            JobUnit.status == "leased"
+        ).first()
+        if unit is None:
+            return False
+        if count_attempt and unit.attempts >= self.max_attempts:
+            return self._fail(unit, error, db, owner=worker_id)
+
+        released = db.query(JobUnit).filter(
+            JobUnit.id == unit_id,
+            JobUnit.owner == worker_id,
+            JobUnit.status == "leased"
+        ).update({
+            "status": "pending",
+            "owner": None,
+            "lease_expires_at": None,
+            "last_error": error,
+            "attempts": JobUnit.attempts if count_attempt else JobUnit.attempts - 1
+        }, synchronize_session=False)
+        db.commit()
+        return released == 1
+
+    def reap_expired(self, db: Session) -> int:
+        """Fail units whose lease expired on their last allowed attempt"""
+        expired = db.query(JobUnit).filter(
+            JobUnit.status == "leased",
+            JobUnit.lease_expires_at < utcnow(),
+            JobUnit.attempts >= self.max_attempts
+        ).all()
+        reaped = 0
+        for unit in expired:
+            message = f"Lease expired after {unit.attempts} attempt(s)"
+            if self._fail(unit, unit.last_error or message, db, owner=unit.owner):
+                reaped += 1
+        return reaped
+
+    def _fail(self, unit: JobUnit, error: str, db: Session, owner: Optional[str]) -> bool:
+        # Every item gets a failed result, so the retry endpoint can pick them up
+        failed = db.query(JobUnit).filter(
+            JobUnit.id == unit.id,
+            JobUnit.owner == owner,
+            JobUnit.status == "leased"
+        ).update({
+            "status": "failed",
+            "lease_expires_at": None,
+            "error_count": unit.item_count,
+            "last_error": error
+        }, synchronize_session=False)
+        if not failed:
+            db.rollback()
+            return False
+
+        log = db.query(ImplementationLog).filter(
+            ImplementationLog.id == unit.job.implementation_log_id
+        ).first()
+        self.version_control.append_results(log, {
+            "errors": [
+                {"config_item": item_id, "type": unit.config_type, "error": error, "stage": "run"}
+                for item_id in json.loads(unit.item_ids)
+            ]
+        }, db)
+        db.commit()
+        self.finish_if_done(unit.job_id, db)
+        return True
+
+    def failed_parent_items(self, unit: JobUnit, db: Session) -> List[str]:
+        """
+        Items of a unit's parent types that earlier levels of its job did not apply
+        Only children referencing them are held back when the unit runs.
+        """
+        present = {row[0] for row in db.query(JobUnit.config_type).filter(
+            JobUnit.job_id == unit.job_id
+        ).distinct()}
+        parents = self.planner.parents_of(unit.config_type, present)
+        if not parents:
+            return []
+        failed = {row[0] for row in db.query(JobUnit.config_type).filter(
+            JobUnit.job_id == unit.job_id,
+            JobUnit.config_type.in_(parents),
+            or_(JobUnit.status == "failed", JobUnit.error_count > 0)
+        ).distinct()}
+        if not failed:
+            return []
+        return self.version_control.results_store.unapplied_items(
+            unit.job.implementation_log_id, db, failed
+        )
+
+    def finish_if_done(self, job_id: int, db: Session) -> bool:
+        """Close a job and its log once no unit is pending or leased"""
+        unfinished = db.query(func.count(JobUnit.id)).filter(
+            JobUnit.job_id == job_id,
+            JobUnit.status.in_(UNFINISHED_STATUSES)
+        ).scalar()
+        if unfinished:
+            return False
+
+        changes, error_count, failed_units, total_units = db.query(
+            func.coalesce(func.sum(JobUnit.changes_applied), 0),
+            func.coalesce(func.sum(JobUnit.error_count), 0),
+            func.coalesce(func.sum(case((JobUnit.status == "failed", 1), else_=0)), 0),
+            func.count(JobUnit.id)
+        ).filter(JobUnit.job_id == job_id).one()
+        if total_units and failed_units == total_units:
+            status = "failed"
+        else:
+            status = "success" if not error_count else "partial"
+
+        # Several workers may finish the last units at once; one closes the job
+        closed = db.query(ImplementationJob).filter(
+            ImplementationJob.id == job_id,
+            ImplementationJob.status == "running"
+        ).update({"status": status, "completed_at": utcnow()}, synchronize_session=False)
+        if not closed:
+            db.rollback()
+            return False
+
+        job = db.query(ImplementationJob).filter(ImplementationJob.id == job_id).first()
+        log = db.query(ImplementationLog).filter(ImplementationLog.id == job.implementation_log_id).first()
+        summary = self.version_control.results_store.summary(log.id, db)
+        data = json.loads(log.implementation_data or "{}")
+        data.update({
+            "held_back": summary["by_status"].get("held_back", 0),
+            "error_count": error_count,
+            "retry_of": None,
+            "job_id": job_id
+        })
+        log.status = status
+        log.changes_applied = changes
+        log.errors = json.dumps(summary["by_error_class"])
+        log.implementation_data = json.dumps(data)
+        db.commit()
+        return True
+
+    def progress(self, job: ImplementationJob, db: Session) -> Dict[str, Any]:
+        """Unit and item counts of a job by status"""
+        rows = db.query(
+            JobUnit.status,
+            func.count(JobUnit.id),
+            func.coalesce(func.sum(JobUnit.item_count), 0),
+            func.coalesce(func.sum(JobUnit.changes_applied), 0),
+            func.coalesce(func.sum(JobUnit.error_count), 0)
+        ).filter(JobUnit.job_id == job.id).group_by(JobUnit.status).all()
+
+        units = {status: 0 for status in ("pending", "leased", "done", "failed")}
+        items = dict(units)
+        changes_applied = 0
+        error_count = 0
+        for status, count, item_count, changes, errors in rows:
+            units[status] = count
+            items[status] = item_count
+            changes_applied += changes
+            error_count += errors
+        workers = [row[0] for row in db.query(JobUnit.owner).filter(
+            JobUnit.job_id == job.id,
+            JobUnit.status == "leased"
+        ).distinct()]
+
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "implementation_id": job.implementation_log_id,
+            "total_units": job.total_units,
+            "total_items": job.total_items,
+            "units": units,
+            "items": items,
+            "changes_applied": changes_applied,
+            "error_count": error_count,
+            "workers": workers,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None
+        }
@@ -0,0 +1,207 @@
+"""
+Worker loop that claims leased job units from the database and implements them
+
+Runs inside the API process (JOB_WORKER_CONCURRENCY slots, 0 to disable) and
+in standalone ``worker.py`` processes on any node sharing the database.
+"""
+import os
+import json
+import asyncio
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from app.database import SessionLocal
+from app.memory import close_results
+from app.models import JobUnit, SFConnection, WorkbookVersion
+from app.services.job_leases import JobLeaseService, default_worker_id
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from app.configuration_batch import ConfigurationBatch
+    from app.services.ai_bot import AIBotService
+    from app.services.sf_service import SuccessFactorsService
+    from app.services.workbook_service import WorkbookService
+
+
+class JobWorker:
+    """Runs ``concurrency`` claim-implement-complete loops against the job unit table"""
+
+    def __init__(
+        self,
+        leases: JobLeaseService,
+        workbook_service: "WorkbookService",
+        ai_bot: "AIBotService",
+        sf_service: "SuccessFactorsService",
+        worker_id: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.leases = leases
+        self.workbook_service = workbook_service
+        self.ai_bot = ai_bot
+        self.sf_service = sf_service
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = concurrency if concurrency is not None else int(os.getenv("JOB_WORKER_CONCURRENCY", "1"))
+        self.poll_interval = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+        # Well inside the lease, so one missed beat does not lose it
+        self.heartbeat_interval = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(leases.lease_seconds / 3)))
+        self.completed = 0
+        self.lost = 0
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """Claim and run units until ``stop`` is set; running units are finished first"""
+        stop = stop or asyncio.Event()
+        await asyncio.gather(*(self._slot(stop) for _ in range(self.concurrency)))
+
+    async def _slot(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                unit_id = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                print(f"Error claiming job unit: {str(e)}")
+                unit_id = None
+
+            if unit_id is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_unit(unit_id)
+
+    def _claim(self) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            unit = self.leases.claim(self.worker_id, db)
+            return unit.id if unit is not None else None
+        finally:
+            db.close()
+
+    async def run_unit(self, unit_id: int):
+        """
+        Implement one leased unit and record its results
+        Database calls run in worker threads (they may wait out a busy_timeout),
+        each on the unit's own session and never two at once.
+        """
+        db = SessionLocal()
+        result = None
+        try:
+            unit, version, connection, failed_parents = await asyncio.to_thread(self._load_unit, unit_id, db)
+            task = asyncio.ensure_future(self._implement(unit, version, connection, failed_parents, db))
+            heartbeat = asyncio.ensure_future(self._heartbeat(unit_id, task))
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+                    # Lease lost: another worker owns the unit now
+                    self.lost += 1
+                    return
+                # Worker shutting down: hand the unit back without using an attempt
+                await asyncio.to_thread(
+                    self.leases.release, unit_id, self.worker_id, "Worker stopped", db, count_attempt=False
+                )
+                raise
+            finally:
+                heartbeat.cancel()
+
+            if result.get("status") == "failed":
+                # Nothing was applied (e.g. authentication failed); try again later
+                error = "; ".join(str(e.get("error")) for e in result.get("errors", []))
+                await asyncio.to_thread(self.leases.release, unit_id, self.worker_id, error, db)
+            elif await asyncio.to_thread(self.leases.complete, unit_id, self.worker_id, result, db):
+                self.completed += 1
+            else:
+                self.lost += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error running job unit {unit_id}: {str(e)}")
+            await asyncio.to_thread(self._abandon, unit_id, str(e), db)
+        finally:
+            if result is not None:
+                close_results(result)
+            db.close()
+
+    def _load_unit(self, unit_id: int, db: "Session") -> Tuple[JobUnit, WorkbookVersion, SFConnection, List[str]]:
+        unit = db.query(JobUnit).filter(JobUnit.id == unit_id).first()
+        version = db.query(WorkbookVersion).filter(WorkbookVersion.id == unit.job.workbook_version_id).first()
+        connection = db.query(SFConnection).filter(SFConnection.id == unit.job.connection_id).first()
+        return unit, version, connection, self.leases.failed_parent_items(unit, db)
+
+    def _abandon(self, unit_id: int, error: str, db: "Session"):
+        db.rollback()
+        self.leases.release(unit_id, self.worker_id, error, db)
+
+    async def _implement(
+        self,
+        unit: JobUnit,
+        version: WorkbookVersion,
+        connection: SFConnection,
+        failed_parents: List[str],
+        db: "Session"
+    ) -> Dict:
+        # Units of the same workbook share the parsed batch through the extraction cache
+        file_path = await self.workbook_service.materialize(version, db)
+        extraction = await self.ai_bot.extract_configurations(file_path)
+        configurations = extraction["configurations"]
+        batch = await asyncio.to_thread(self._select, unit, configurations)
+        parents = None
+        if failed_parents:
+            parents = await asyncio.to_thread(configurations.select_ids, set(failed_parents))
+        unit_id = unit.id
+        return await self.sf_service.implement_configuration(
+            connection=connection,
+            configuration_data={"configurations": batch},
+            workbook_version=version,
+            failed_parents=parents,
+            keep_snapshots=lambda snapshots: asyncio.to_thread(self._keep_snapshots, unit_id, snapshots)
+        )
+
+    def _keep_snapshots(self, unit_id: int, snapshots: List[Dict]) -> bool:
+        # Stored at capture time, before this attempt writes anything
+        db = SessionLocal()
+        try:
+            return self.leases.keep_snapshots(unit_id, snapshots, db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _select(unit: JobUnit, configurations: "ConfigurationBatch") -> "ConfigurationBatch":
+        """A unit's rows, by the positions recorded when the job was split"""
+        item_ids = set(json.loads(unit.item_ids))
+        if unit.row_ranges:
+            try:
+                batch = configurations.select_rows(json.loads(unit.row_ranges))
+                if batch.ids() == item_ids:
+                    return batch
+            except IndexError:
+                pass
+        # Units from before row ranges were stored, or a workbook now split differently
+        return configurations.select_ids(item_ids)
+
+    async def _heartbeat(self, unit_id: int, task: "asyncio.Future") -> bool:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                alive = await asyncio.to_thread(self._extend, unit_id)
+            except Exception as e:
+                # A transient database error; the lease outlives a few missed beats
+                print(f"Error extending lease on job unit {unit_id}: {str(e)}")
+                continue
+            if not alive:
+                print(f"Lost lease on job unit {unit_id}; abandoning it")
+                task.cancel()
+                return True
+
+    def _extend(self, unit_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            return self.leases.heartbeat(unit_id, self.worker_id, db)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "lost": self.lost
+        }
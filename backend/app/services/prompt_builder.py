@@ -0,0 +1,207 @@
+"""
+Token-budgeted workbook summaries for LLM prompts
+
+Each sheet block is reduced to a statistical profile: per-column type, null
+rate, cardinality and value range, plus a few representative rows (picked by
+row hash after de-duplication, so they are stable and distinct) and a few
+outlier rows. Profiles are computed on at most ``sample_rows`` rows per block
+and then trimmed level by level until the prompt fits the token budget, so
+prompt size and profiling time stay bounded however large the workbook is.
+"""
+import os
+import json
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.configuration_batch import ConfigurationBatch, SheetBlock
+
+# Progressively smaller profiles, tried in order until the prompt fits
+DETAIL_LEVELS = [
+    {"samples": 5, "outliers": 3, "top_values": 3, "columns": None},
+    {"samples": 2, "outliers": 2, "top_values": 2, "columns": None},
+    {"samples": 1, "outliers": 1, "top_values": 0, "columns": 40},
+    {"samples": 0, "outliers": 0, "top_values": 0, "columns": 15},
+]
+
+MAX_CELL_CHARS = 60
+OUTLIER_Z_SCORE = 3.0
+
+PROMPT_HEADER = """Analyze this SuccessFactors configuration workbook.
+The profile below lists, per sheet, its configuration type, row count, column
+statistics, representative rows and outlier rows.
+
+Provide recommendations for:
+1. Best practices for implementation
+2. Potential risks or issues (use the null rates, outliers and value ranges)
+3. Optimization suggestions
+4. Required approvals or workflows
+
+Return as JSON array of recommendations.
+
+Workbook profile:
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English/JSON text)"""
+    return len(text) // 4 + 1
+
+
+def _cell(value: Any) -> Any:
+    """Compact JSON form of a cell value"""
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    elif hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, str) and len(value) > MAX_CELL_CHARS:
+        return value[:MAX_CELL_CHARS] + "..."
+    return value
+
+
+class WorkbookPromptBuilder:
+    """Builds an LLM prompt describing a ConfigurationBatch within a token budget"""
+
+    def __init__(self, token_budget: Optional[int] = None, sample_rows: Optional[int] = None):
+        self.token_budget = token_budget or int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "3000"))
+        self.sample_rows = sample_rows or int(os.getenv("AI_PROFILE_SAMPLE_ROWS", "20000"))
+
+    def build(self, configurations: "ConfigurationBatch") -> str:
+        """Prompt text whose estimated size stays within ``token_budget``"""
+        # Largest sheets first, so they are the last to be dropped
+        profiles = sorted(
+            (self._profile_held(block) for block in configurations.blocks),
+            key=lambda p: p["rows"],
+            reverse=True
+        )
+        overview = {
+            "total_items": len(configurations),
+            "type_counts": configurations.type_counts()
+        }
+
+        for level in DETAIL_LEVELS:
+            prompt = self._render(overview, [self._trim(p, level) for p in profiles])
+            if estimate_tokens(prompt) <= self.token_budget:
+                return prompt
+
+        # Still too large: keep the biggest sheets at the smallest detail level
+        trimmed = [self._trim(p, DETAIL_LEVELS[-1]) for p in profiles]
+        while len(trimmed) > 1:
+            trimmed.pop()
+            overview["omitted_sheets"] = len(profiles) - len(trimmed)
+            prompt = self._render(overview, trimmed)
+            if estimate_tokens(prompt) <= self.token_budget:
+                return prompt
+        return prompt
+
+    def _render(self, overview: Dict[str, Any], sheets: List[Dict[str, Any]]) -> str:
+        body = dict(overview, sheets=sheets)
+        return PROMPT_HEADER + json.dumps(body, separators=(",", ":"), default=str)
+
+    def _trim(self, profile: Dict[str, Any], level: Dict[str, Any]) -> Dict[str, Any]:
+        columns = profile["columns"]
+        if level["columns"] is not None and len(columns) > level["columns"]:
+            columns = columns[:level["columns"]]
+        if level["top_values"] < 3:
+            columns = [
+                dict(c, top=c["top"][:level["top_values"]]) if "top" in c else c
+                for c in columns
+            ]
+            columns = [{k: v for k, v in c.items() if v != []} for c in columns]
+        trimmed = {
+            "sheet": profile["sheet"],
+            "type": profile["type"],
+            "rows": profile["rows"],
+            "columns": columns
+        }
+        if len(columns) < len(profile["columns"]):
+            trimmed["omitted_columns"] = len(profile["columns"]) - len(columns)
+        if level["samples"]:
+            trimmed["samples"] = profile["samples"][:level["samples"]]
+        if level["outliers"] and profile["outliers"]:
+            trimmed["outliers"] = profile["outliers"][:level["outliers"]]
+        if profile["sampled"]:
+            trimmed["stats_from_rows"] = profile["sampled"]
+        return trimmed
+
+    def _profile_held(self, block: "SheetBlock") -> Dict[str, Any]:
+        # A spilled block is read from disk once for the whole profile
+        block.acquire()
+        try:
+            return self.profile_block(block)
+        finally:
+            block.release()
+
+    def profile_block(self, block: "SheetBlock") -> Dict[str, Any]:
+        """Full-detail profile of one block (stats on at most ``sample_rows`` rows)"""
+        import numpy as np
+        import pandas as pd
+
+        total = len(block)
+        step = max(1, -(-total // self.sample_rows))
+        positions = np.arange(0, total, step)
+        df = pd.DataFrame({i: column[::step] for i, column in enumerate(block.values)})
+
+        columns = []
+        z_scores = np.zeros(len(df))
+        rare = np.zeros(len(df), dtype=bool)
+        for i, name in enumerate(block.columns):
+            series = df[i]
+            non_null = series.dropna()
+            profile: Dict[str, Any] = {
+                "name": name,
+                "null_rate": round(1 - len(non_null) / len(series), 3) if len(series) else 0.0,
+                "distinct": int(non_null.nunique())
+            }
+            if pd.api.types.is_bool_dtype(series):
+                profile["kind"] = "bool"
+            elif pd.api.types.is_numeric_dtype(series):
+                profile["kind"] = "number"
+                if len(non_null):
+                    profile["min"] = _cell(non_null.min())
+                    profile["max"] = _cell(non_null.max())
+                    profile["mean"] = _cell(float(non_null.mean()))
+                    std = float(non_null.std()) if len(non_null) > 1 else 0.0
+                    if std > 0:
+                        z = np.abs((series.to_numpy(dtype=float, na_value=np.nan) - non_null.mean()) / std)
+                        z_scores = np.fmax(z_scores, np.nan_to_num(z))
+            elif pd.api.types.is_datetime64_any_dtype(series):
+                profile["kind"] = "date"
+                if len(non_null):
+                    profile["min"] = _cell(non_null.min())
+                    profile["max"] = _cell(non_null.max())
+            else:
+                profile["kind"] = pd.api.types.infer_dtype(non_null, skipna=True)
+                counts = non_null.value_counts()
+                if len(non_null):
+                    profile["top"] = [_cell(v) for v in counts.index[:3]]
+                    profile["max_len"] = int(non_null.astype(str).str.len().max())
+                # A value seen once in an otherwise categorical column stands out
+                if len(counts) and len(counts) <= 20 and len(non_null) >= 50:
+                    singletons = set(counts.index[counts == 1])
+                    if singletons:
+                        rare |= series.isin(singletons).to_numpy()
+            columns.append(profile)
+
+        # Representatives: distinct rows with the smallest hashes (a stable pseudo-random pick)
+        hashes = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+        _, first = np.unique(hashes, return_index=True)
+        representatives = first[np.argsort(hashes[first])][:DETAIL_LEVELS[0]["samples"]]
+
+        score = np.where(rare, np.maximum(z_scores, OUTLIER_Z_SCORE), z_scores)
+        candidates = np.setdiff1d(np.flatnonzero(score >= OUTLIER_Z_SCORE), representatives)
+        outliers = candidates[np.argsort(-score[candidates], kind="stable")][:DETAIL_LEVELS[0]["outliers"]]
+
+        return {
+            "sheet": block.sheet,
+            "type": block.config_type,
+            "rows": total,
+            "sampled": len(df) if step > 1 else 0,
+            "columns": columns,
+            "samples": [self._row(block, positions[i]) for i in representatives],
+            "outliers": [self._row(block, positions[i]) for i in outliers]
+        }
+
+    def _row(self, block: "SheetBlock", pos: int) -> Dict[str, Any]:
+        return {k: _cell(v) for k, v in block.row_data(int(pos)).items() if v is not None}
@@ -0,0 +1,220 @@
+"""
+Per-item implementation results: bulk writes and indexed queries
+"""
+import os
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import insert, func, or_
+from sqlalchemy.orm import Session
+
+from app.models import ImplementationResult
+
+# Statuses that a retry re-sends
+RETRYABLE_STATUSES = ("failed", "rejected", "held_back")
+
+# Failures that re-sending cannot fix (a bug or bad local data, not the tenant or network)
+NON_RETRYABLE_CLASSES = ("internal",)
+
+
+def exception_class(exc: BaseException) -> str:
+    """Error class of an exception raised while sending an item"""
+    import httpx
+
+    if isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(exc, httpx.TransportError):
+        return "network"
+    return "internal"
+
+
+def classify_error(error: Dict) -> str:
+    """Coarse error class used to triage and selectively retry failures"""
+    stage = error.get("stage")
+    if stage in ("validation", "held_back", "run"):
+        return stage
+    if error.get("error_class"):
+        return error["error_class"]
+    status_code = error.get("status_code")
+    if status_code is None:
+        # Only transport failures are tagged network/timeout when they are raised
+        return "internal"
+    if status_code in (401, 403):
+        return "auth"
+    if status_code == 404:
+        return "not_found"
+    if status_code == 409:
+        return "conflict"
+    if status_code == 429:
+        return "rate_limited"
+    if status_code >= 500:
+        return "server_error"
+    return "bad_request"
+
+
+def _status_for(error: Dict) -> str:
+    return {"validation": "rejected", "held_back": "held_back"}.get(error.get("stage"), "failed")
+
+
+class ResultsStore:
+    """Writes implementation results in batched inserts and answers triage queries"""
+    
+    def __init__(self, chunk_size: Optional[int] = None):
+        self.chunk_size = chunk_size or int(os.getenv("RESULTS_INSERT_CHUNK_SIZE", "1000"))
+    
+    def write(
+        self,
+        log_id: int,
+        applied: Iterable[Tuple[str, str, str]],
+        errors: Iterable[Dict],
+        db: Session
+    ) -> Dict[str, int]:
+        """
+        Insert one row per item with executemany, chunk by chunk
+        The caller commits; returns failed item counts by error class.
+        """
+        counts: Dict[str, int] = {}
+        
+        def rows():
+            for config_item, entity_type, entity_set in applied:
+                yield {
+                    "implementation_log_id": log_id,
+                    "config_item": config_item,
+                    "entity_type": entity_type,
+                    "entity_set": entity_set,
+                    "status": "success",
+                    "error_class": None,
+                    "status_code": None,
+                    "error": None
+                }
+            for error in errors:
+                error_class = classify_error(error)
+                counts[error_class] = counts.get(error_class, 0) + 1
+                yield {
+                    "implementation_log_id": log_id,
+                    "config_item": error.get("config_item"),
+                    "entity_type": error.get("type"),
+                    "entity_set": error.get("entity_set"),
+                    "status": _status_for(error),
+                    "error_class": error_class,
+                    "status_code": error.get("status_code"),
+                    "error": str(error.get("error", ""))
+                }
+        
+        chunk: List[Dict] = []
+        for row in rows():
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                db.execute(insert(ImplementationResult), chunk)
+                chunk = []
+        if chunk:
+            db.execute(insert(ImplementationResult), chunk)
+        return counts
+    
+    def query(
+        self,
+        log_id: int,
+        db: Session,
+        status: Optional[str] = None,
+        error_class: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 500
+    ) -> Dict:
+        """Page through results of an implementation, filtered on indexed columns"""
+        query = db.query(ImplementationResult).filter(
+            ImplementationResult.implementation_log_id == log_id
+        )
+        if status:
+            query = query.filter(ImplementationResult.status == status)
+        if error_class:
+            query = query.filter(ImplementationResult.error_class == error_class)
+        if entity_type:
+            query = query.filter(ImplementationResult.entity_type == entity_type)
+        
+        total = query.count()
+        items = query.order_by(ImplementationResult.id).offset(offset).limit(limit).all()
+        return {
+            "implementation_id": log_id,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [
+                {
+                    "config_item": r.config_item,
+                    "entity_type": r.entity_type,
+                    "entity_set": r.entity_set,
+                    "status": r.status,
+                    "error_class": r.error_class,
+                    "status_code": r.status_code,
+                    "error": r.error
+                }
+                for r in items
+            ]
+        }
+    
+    def summary(self, log_id: int, db: Session) -> Dict:
+        """Item counts by status, error class and entity type"""
+        rows = db.query(
+            ImplementationResult.status,
+            ImplementationResult.error_class,
+            ImplementationResult.entity_type,
+            func.count(ImplementationResult.id)
+        ).filter(
+            ImplementationResult.implementation_log_id == log_id
+        ).group_by(
+            ImplementationResult.status,
+            ImplementationResult.error_class,
+            ImplementationResult.entity_type
+        ).all()
+        
+        by_status: Dict[str, int] = {}
+        by_error_class: Dict[str, int] = {}
+        by_entity_type: Dict[str, Dict[str, int]] = {}
+        for status, error_class, entity_type, count in rows:
+            by_status[status] = by_status.get(status, 0) + count
+            if error_class:
+                by_error_class[error_class] = by_error_class.get(error_class, 0) + count
+            type_counts = by_entity_type.setdefault(entity_type or "unknown", {})
+            type_counts[status] = type_counts.get(status, 0) + count
+        
+        return {
+            "implementation_id": log_id,
+            "by_status": by_status,
+            "by_error_class": by_error_class,
+            "by_entity_type": by_entity_type
+        }
+    
+    def retryable_items(self, log_id: int, db: Session, error_class: Optional[str] = None) -> List[str]:
+        """
+        config_item ids of an implementation that did not apply
+        Internal failures are only included when asked for by ``error_class``.
+        """
+        query = db.query(ImplementationResult.config_item).filter(
+            ImplementationResult.implementation_log_id == log_id,
+            ImplementationResult.status.in_(RETRYABLE_STATUSES),
+            ImplementationResult.config_item.isnot(None)
+        )
+        if error_class:
+            query = query.filter(ImplementationResult.error_class == error_class)
+        else:
+            query = query.filter(or_(
+                ImplementationResult.error_class.is_(None),
+                ImplementationResult.error_class.notin_(NON_RETRYABLE_CLASSES)
+            ))
+        return [row[0] for row in query.all()]
+
+    def unapplied_items(
+        self,
+        log_id: int,
+        db: Session,
+        config_types: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """config_item ids of an implementation that were not applied, whatever the reason"""
+        query = db.query(ImplementationResult.config_item).filter(
+            ImplementationResult.implementation_log_id == log_id,
+            ImplementationResult.status != "success",
+            ImplementationResult.config_item.isnot(None)
+        )
+        if config_types is not None:
+            query = query.filter(ImplementationResult.entity_type.in_(list(config_types)))
+        return [row[0] for row in query.all()]
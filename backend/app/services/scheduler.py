@@ -0,0 +1,241 @@
+"""
+Fair scheduling of implementation jobs across tenants
+
+Jobs are queued per tenant (SF company) and started by weighted fair queuing:
+each job gets a virtual finish tag ``start + cost / weight``, and the job
+with the smallest tag among tenants below their concurrency cap runs next.
+A tenant submitting a 1M-row job therefore cannot starve a 50-row change
+from another tenant. Priorities are strict: urgent jobs are always
+considered before normal ones, and normal before bulk. A tenant's priority,
+weight and cap come from its configuration (TenantPolicy); a request can
+lower its job's priority but never raise it.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+PRIORITIES = {"urgent": 0, "normal": 1, "bulk": 2}
+
+
+class _Job:
+    __slots__ = ("tenant", "factory", "priority", "start_tag", "finish_tag", "future", "enqueued_at", "seq")
+
+    def __init__(self, tenant, factory, priority, start_tag, finish_tag, future, seq):
+        self.tenant = tenant
+        self.factory = factory
+        self.priority = priority
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.seq = seq
+
+
+class _TenantState:
+    __slots__ = ("queues", "running", "last_finish", "started", "completed", "total_wait", "max_wait", "last_wait")
+
+    def __init__(self):
+        self.queues: Dict[int, Deque[_Job]] = {rank: deque() for rank in PRIORITIES.values()}
+        self.running = 0
+        self.last_finish = 0.0
+        self.started = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+
+def _parse_map(value: str, convert: Callable[[str], Any]) -> Dict[str, Any]:
+    """"companyA=2,companyB=0.5" -> {"companyA": 2.0, "companyB": 0.5}"""
+    settings = {}
+    for pair in value.split(","):
+        if "=" in pair:
+            tenant, setting = pair.split("=", 1)
+            settings[tenant.strip()] = convert(setting.strip())
+    return settings
+
+
+class TenantPolicy:
+    """
+    Per-tenant scheduling settings, shared by in-process jobs and leased job units
+    SCHEDULER_TENANT_PRIORITIES="companyA=urgent", SCHEDULER_TENANT_WEIGHTS="companyA=2"
+    and SCHEDULER_TENANT_CAPS="companyA=4"; unlisted tenants get normal priority,
+    weight 1 and SCHEDULER_TENANT_CAP concurrent jobs.
+    """
+
+    def __init__(
+        self,
+        default_cap: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        caps: Optional[Dict[str, int]] = None,
+        priorities: Optional[Dict[str, str]] = None
+    ):
+        self.default_cap = default_cap or int(os.getenv("SCHEDULER_TENANT_CAP", "2"))
+        self.weights = weights if weights is not None else _parse_map(
+            os.getenv("SCHEDULER_TENANT_WEIGHTS", ""), float
+        )
+        self.caps = caps if caps is not None else _parse_map(os.getenv("SCHEDULER_TENANT_CAPS", ""), int)
+        self.priorities = priorities if priorities is not None else _parse_map(
+            os.getenv("SCHEDULER_TENANT_PRIORITIES", ""), str
+        )
+        for tenant, priority in self.priorities.items():
+            if priority not in PRIORITIES:
+                raise ValueError(f"Unknown priority for {tenant}: {priority}")
+
+    def weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, 1.0)
+
+    def cap(self, tenant: str) -> int:
+        return self.caps.get(tenant, self.default_cap)
+
+    def priority(self, tenant: str, requested: Optional[str] = None) -> str:
+        """The tenant's configured priority, or ``requested`` when that is lower"""
+        configured = self.priorities.get(tenant, "normal")
+        if requested is None:
+            return configured
+        if requested not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {requested}")
+        return requested if PRIORITIES[requested] > PRIORITIES[configured] else configured
+
+
+class TenantScheduler:
+    """Weighted fair queuing of jobs with per-tenant concurrency caps"""
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        tenant_cap: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        policy: Optional[TenantPolicy] = None
+    ):
+        self.max_concurrent = max_concurrent or int(os.getenv("SCHEDULER_MAX_CONCURRENT", "4"))
+        self.policy = policy or TenantPolicy(default_cap=tenant_cap, weights=weights)
+        self._tenants: Dict[str, _TenantState] = {}
+        self._running = 0
+        self._virtual_time = 0.0
+        self._seq = 0
+
+    @property
+    def tenant_cap(self) -> int:
+        return self.policy.default_cap
+
+    def submit(
+        self,
+        tenant: str,
+        factory: Callable[[], Awaitable[Any]],
+        cost: float = 1.0,
+        priority: Optional[str] = None
+    ) -> "asyncio.Future":
+        """
+        Queue a job and return a future for its result
+        ``cost`` is the job's size (e.g. configuration item count). ``priority``
+        may only lower the tenant's configured priority.
+        """
+        priority = self.policy.priority(tenant, priority)
+
+        state = self._tenants.setdefault(tenant, _TenantState())
+        weight = self.policy.weight(tenant)
+        start_tag = max(self._virtual_time, state.last_finish)
+        finish_tag = start_tag + max(cost, 1.0) / weight
+        state.last_finish = finish_tag
+
+        self._seq += 1
+        job = _Job(
+            tenant, factory, PRIORITIES[priority], start_tag, finish_tag,
+            asyncio.get_running_loop().create_future(), self._seq
+        )
+        state.queues[job.priority].append(job)
+        self._dispatch()
+        return job.future
+
+    async def run(self, tenant: str, factory: Callable[[], Awaitable[Any]],
+                  cost: float = 1.0, priority: Optional[str] = None) -> Any:
+        """Submit a job and wait for its result"""
+        return await self.submit(tenant, factory, cost, priority)
+
+    def _next_job(self) -> Optional[_Job]:
+        best = None
+        for tenant, state in self._tenants.items():
+            if state.running >= self.policy.cap(tenant):
+                continue
+            for rank in sorted(state.queues):
+                if state.queues[rank]:
+                    head = state.queues[rank][0]
+                    key = (head.priority, head.finish_tag, head.seq)
+                    if best is None or key < (best.priority, best.finish_tag, best.seq):
+                        best = head
+                    break
+        return best
+
+    def _dispatch(self):
+        while self._running < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                return
+            state = self._tenants[job.tenant]
+            state.queues[job.priority].popleft()
+            if job.future.cancelled():
+                continue
+
+            wait = time.monotonic() - job.enqueued_at
+            state.total_wait += wait
+            state.max_wait = max(state.max_wait, wait)
+            state.last_wait = wait
+            state.started += 1
+            state.running += 1
+            self._running += 1
+            # Virtual time follows the start tag of the job entering service
+            self._virtual_time = max(self._virtual_time, job.start_tag)
+            asyncio.ensure_future(self._run_job(job, state))
+
+    async def _run_job(self, job: _Job, state: _TenantState):
+        try:
+            result = await job.factory()
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            state.running -= 1
+            state.completed += 1
+            self._running -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-tenant queue depth, running jobs and wait times (seconds)"""
+        now = time.monotonic()
+        tenants = {}
+        for tenant, state in self._tenants.items():
+            oldest = min(
+                (q[0].enqueued_at for q in state.queues.values() if q),
+                default=None
+            )
+            tenants[tenant] = {
+                "queued": state.queued,
+                "queued_by_priority": {
+                    name: len(state.queues[rank]) for name, rank in PRIORITIES.items()
+                },
+                "running": state.running,
+                "completed": state.completed,
+                "priority": self.policy.priority(tenant),
+                "weight": self.policy.weight(tenant),
+                "cap": self.policy.cap(tenant),
+                "avg_wait": state.total_wait / state.started if state.started else 0.0,
+                "max_wait": state.max_wait,
+                "last_wait": state.last_wait,
+                "oldest_queued_wait": now - oldest if oldest is not None else 0.0
+            }
+        return {
+            "running": self._running,
+            "max_concurrent": self.max_concurrent,
+            "tenant_cap": self.tenant_cap,
+            "tenants": tenants
+        }
@@ -0,0 +1,299 @@
+"""
+SuccessFactors OData metadata: fetching, per-tenant caching and local validation
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import asyncio
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
+    import numpy as np
+    from app.configuration_batch import SheetBlock
+
+SAP_NS = "{http://www.sap.com/Protocols/SAPData}"
+
+INTEGER_TYPES = {"Edm.Byte", "Edm.SByte", "Edm.Int16", "Edm.Int32", "Edm.Int64"}
+NUMERIC_TYPES = {"Edm.Decimal", "Edm.Double", "Edm.Single"}
+DATETIME_TYPES = {"Edm.DateTime", "Edm.DateTimeOffset"}
+BOOLEAN_VALUES = {"true", "false", "1", "0", "yes", "no"}
+
+
+def _local(tag: str) -> str:
+    """Element tag without its XML namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def normalize_name(name: str) -> str:
+    """Column/property name reduced to lower-case alphanumerics for matching"""
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+class EntityProperty:
+    """A property of an OData entity type"""
+
+    __slots__ = ("name", "edm_type", "nullable", "max_length", "required")
+
+    def __init__(self, name: str, edm_type: str, nullable: bool = True,
+                 max_length: Optional[int] = None, required: bool = False):
+        self.name = name
+        self.edm_type = edm_type
+        self.nullable = nullable
+        self.max_length = max_length
+        self.required = required
+
+
+class EntityType:
+    """An OData entity type with its key and properties"""
+
+    def __init__(self, name: str, keys: List[str], properties: Dict[str, EntityProperty]):
+        self.name = name
+        self.keys = keys
+        self.properties = properties
+        self._by_normalized = {normalize_name(p): prop for p, prop in properties.items()}
+
+    def map_columns(
+        self,
+        columns: Tuple[str, ...],
+        hints: Optional[Dict[str, str]] = None
+    ) -> Dict[str, EntityProperty]:
+        """
+        Map workbook columns to entity properties by normalized name
+        ``hints`` (column -> property name) covers headers that do not match by name.
+        """
+        hints = hints or {}
+        mapping = {}
+        for column in columns:
+            prop = self.properties.get(column) or self._by_normalized.get(normalize_name(column))
+            if prop is None and column in hints:
+                prop = self._by_normalized.get(normalize_name(hints[column]))
+            if prop is not None:
+                mapping[column] = prop
+        return mapping
+
+
+class ODataMetadata:
+    """Parsed $metadata document: entity sets and their entity types"""
+
+    def __init__(self, entity_sets: Dict[str, EntityType]):
+        self.entity_sets = entity_sets
+
+    @classmethod
+    def from_xml(cls, content: bytes) -> "ODataMetadata":
+        root = ET.fromstring(content)
+        types: Dict[str, EntityType] = {}
+        sets: Dict[str, str] = {}
+
+        for schema in root.iter():
+            if _local(schema.tag) != "Schema":
+                continue
+            namespace = schema.get("Namespace", "")
+            for element in schema:
+                tag = _local(element.tag)
+                if tag == "EntityType":
+                    entity = cls._parse_entity_type(element)
+                    types[f"{namespace}.{entity.name}"] = entity
+                    types.setdefault(entity.name, entity)
+                elif tag == "EntityContainer":
+                    for entity_set in element:
+                        if _local(entity_set.tag) == "EntitySet":
+                            sets[entity_set.get("Name")] = entity_set.get("EntityType")
+
+        entity_sets = {
+            name: types[type_name]
+            for name, type_name in sets.items()
+            if type_name in types
+        }
+        return cls(entity_sets)
+
+    @staticmethod
+    def _parse_entity_type(element: ET.Element) -> EntityType:
+        keys = []
+        properties = {}
+        for child in element:
+            tag = _local(child.tag)
+            if tag == "Key":
+                keys.extend(ref.get("Name") for ref in child if _local(ref.tag) == "PropertyRef")
+            elif tag == "Property":
+                max_length = child.get("MaxLength")
+                properties[child.get("Name")] = EntityProperty(
+                    name=child.get("Name"),
+                    edm_type=child.get("Type", "Edm.String"),
+                    nullable=child.get("Nullable", "true").lower() != "false",
+                    max_length=int(max_length) if max_length and max_length.isdigit() else None,
+                    required=child.get(f"{SAP_NS}required", "false").lower() == "true"
+                )
+        for key in keys:
+            if key in properties:
+                properties[key].required = True
+        return EntityType(element.get("Name"), keys, properties)
+
+    def resolve(self, candidates: List[str]) -> Optional[str]:
+        """First candidate entity set present in this tenant"""
+        for name in candidates:
+            if name in self.entity_sets:
+                return name
+        return None
+
+
+class SFMetadataService:
+    """Fetch the tenant's $metadata once and cache it in memory and on disk"""
+
+    def __init__(self, http_client: "httpx.AsyncClient", base_url: str, api_version: str):
+        self.http_client = http_client
+        self.base_url = base_url
+        self.api_version = api_version
+        self.cache_dir = os.getenv("SF_METADATA_CACHE_DIR", "./cache/sf_metadata")
+        # How long a cached document is trusted before revalidating with the tenant
+        self.refresh_seconds = int(os.getenv("SF_METADATA_REFRESH_SECONDS", "3600"))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._memory: Dict[str, Tuple[float, ODataMetadata]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _cache_paths(self, company_id: str) -> Tuple[str, str]:
+        tenant = hashlib.sha1(f"{self.base_url}|{company_id}".encode()).hexdigest()[:16]
+        base = os.path.join(self.cache_dir, f"{re.sub(r'[^A-Za-z0-9_-]', '_', company_id)}_{tenant}")
+        return f"{base}.xml", f"{base}.json"
+
+    def cached(self, company_id: str) -> Optional[ODataMetadata]:
+        """Metadata already loaded for a tenant, without revalidating it"""
+        cached = self._memory.get(company_id)
+        return cached[1] if cached else None
+
+    async def get_metadata(self, company_id: str, token: str, force_refresh: bool = False) -> ODataMetadata:
+        """
+        Tenant metadata, revalidated at most every SF_METADATA_REFRESH_SECONDS
+        Uses a conditional GET (ETag / Last-Modified) so unchanged documents are not re-downloaded
+        """
+        lock = self._locks.setdefault(company_id, asyncio.Lock())
+        async with lock:
+            cached = self._memory.get(company_id)
+            if cached and not force_refresh and time.time() - cached[0] < self.refresh_seconds:
+                return cached[1]
+
+            xml_path, meta_path = self._cache_paths(company_id)
+            info = {}
+            if os.path.exists(meta_path) and os.path.exists(xml_path):
+                with open(meta_path) as f:
+                    info = json.load(f)
+                if not force_refresh and time.time() - info.get("checked_at", 0) < self.refresh_seconds:
+                    # Another worker revalidated recently; reuse its copy
+                    metadata = self._load(xml_path)
+                    self._memory[company_id] = (info["checked_at"], metadata)
+                    return metadata
+
+            headers = {"Authorization": f"Bearer {token}"}
+            if info.get("etag"):
+                headers["If-None-Match"] = info["etag"]
+            if info.get("last_modified"):
+                headers["If-Modified-Since"] = info["last_modified"]
+
+            try:
+                response = await self.http_client.get(
+                    f"{self.base_url}/{self.api_version}/$metadata",
+                    headers=headers,
+                    timeout=60
+                )
+            except Exception as e:
+                if not info:
+                    raise
+                print(f"Error refreshing metadata, using cached copy: {str(e)}")
+                response = None
+
+            if response is not None and response.status_code == 200:
+                metadata = ODataMetadata.from_xml(response.content)
+                self._write_atomic(xml_path, response.content)
+                info = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified")
+                }
+            elif response is not None and response.status_code != 304 and not info:
+                raise ValueError(f"Failed to fetch metadata: HTTP {response.status_code}")
+            else:
+                # Unchanged (304) or tenant unreachable: keep the cached document
+                metadata = cached[1] if cached else self._load(xml_path)
+
+            info["checked_at"] = time.time()
+            self._write_atomic(meta_path, json.dumps(info).encode())
+            self._memory[company_id] = (info["checked_at"], metadata)
+            return metadata
+
+    def _load(self, xml_path: str) -> ODataMetadata:
+        with open(xml_path, "rb") as f:
+            return ODataMetadata.from_xml(f.read())
+
+    def _write_atomic(self, path: str, content: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def validate_block(block: "SheetBlock", entity: EntityType) -> Tuple["np.ndarray", Dict[str, str], List[Dict]]:
+    """
+    Validate all rows of a block against an entity type, column by column
+    Returns (valid row mask, column -> property name mapping, row errors)
+    """
+    import numpy as np
+    import pandas as pd
+
+    size = len(block)
+    mapping = entity.map_columns(block.columns, block.properties)
+    problems: List[Tuple["np.ndarray", str]] = []
+
+    mapped_names = {prop.name for prop in mapping.values()}
+    missing = [p.name for p in entity.properties.values() if p.required and p.name not in mapped_names]
+    if missing:
+        problems.append((np.ones(size, dtype=bool), f"Missing required properties: {', '.join(missing)}"))
+
+    columns = dict(zip(block.columns, block.values))
+    for column, prop in mapping.items():
+        series = pd.Series(columns[column], copy=False)
+        null = series.isna().to_numpy()
+
+        if prop.required or not prop.nullable:
+            problems.append((null, f"{prop.name} is required"))
+
+        present = ~null
+        if not present.any():
+            continue
+
+        bad = None
+        if prop.edm_type in INTEGER_TYPES:
+            numeric = pd.to_numeric(series, errors="coerce")
+            bad = present & (numeric.isna().to_numpy() | (numeric.fillna(0) % 1 != 0).to_numpy())
+        elif prop.edm_type in NUMERIC_TYPES:
+            bad = present & pd.to_numeric(series, errors="coerce").isna().to_numpy()
+        elif prop.edm_type in DATETIME_TYPES and series.dtype.kind != "M":
+            bad = present & pd.to_datetime(series, errors="coerce").isna().to_numpy()
+        elif prop.edm_type == "Edm.Boolean" and series.dtype.kind != "b":
+            bad = present & ~series.astype(str).str.lower().isin(BOOLEAN_VALUES).to_numpy()
+        elif prop.edm_type == "Edm.String" and prop.max_length:
+            bad = present & (series.astype(str).str.len() > prop.max_length).to_numpy()
+            if bad.any():
+                problems.append((bad, f"{prop.name} exceeds {prop.max_length} characters"))
+            continue
+
+        if bad is not None and bad.any():
+            problems.append((bad, f"{prop.name} is not a valid {prop.edm_type}"))
+
+    valid = np.ones(size, dtype=bool)
+    for mask, _ in problems:
+        valid &= ~mask
+
+    errors = []
+    for pos in np.flatnonzero(~valid):
+        messages = [message for mask, message in problems if mask[pos]]
+        errors.append({
+            "config_item": block.row_id(pos),
+            "type": block.config_type,
+            "error": "; ".join(messages),
+            "stage": "validation"
+        })
+
+    names = {column: prop.name for column, prop in mapping.items()}
+    return valid, names, errors
@@ -1,21 +1,75 @@
 """
 SuccessFactors API integration service
 """
-import requests
 import base64
-from typing import Dict, Optional, Any
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Any, TYPE_CHECKING
 import os
+import re
+import asyncio
+from contextlib import ExitStack
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from app.http_clients import build_http_client
+from app.memory import SpillList
+from app.services.column_classifier import key_column, reference_column
+from app.services.results_store import exception_class
+from app.services.sf_metadata import SFMetadataService, ODataMetadata, validate_block
+from app.services.execution_plan import ExecutionPlanner, reverse_dependencies
+
+if TYPE_CHECKING:
+    import httpx
+    from app.configuration_batch import ConfigurationBatch, SheetBlock
+
 load_dotenv()
 
+# Entity sets tried, in order, when the default name is absent from the tenant's metadata
+ENTITY_ALIASES = {
+    "department": ["FODepartment"],
+    "position": ["Position"],
+    "job": ["FOJobCode", "JobCode"],
+    "pay_grade": ["FOPayGrade"],
+    "compensation": ["EmpCompensation"],
+    "permission": ["RBPRole"],
+    "form_template": ["FormTemplate"],
+    "rating_scale": ["FormRatingScale"]
+}
+
 
 class SuccessFactorsService:
     """Service for interacting with SuccessFactors APIs"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional["httpx.AsyncClient"] = None):
         self.base_url = os.getenv("SF_BASE_URL", "https://api.successfactors.com")
         self.api_version = os.getenv("SF_API_VERSION", "v2")
+        # Shared keep-alive pool; owned by the app lifespan when injected
+        self._owns_http_client = http_client is None
+        self._http_client = http_client
+        self.validate_with_metadata = os.getenv("SF_VALIDATE_METADATA", "true").lower() == "true"
+        self.snapshot_before_implement = os.getenv("SF_SNAPSHOT_BEFORE_IMPLEMENT", "true").lower() == "true"
+        # Entity keys per bulk read when capturing pre-implementation state
+        self.snapshot_chunk_size = int(os.getenv("SF_SNAPSHOT_CHUNK_SIZE", "50"))
+        # Keep per-item success records (not just failures) for the results store
+        self.record_successes = os.getenv("IMPLEMENTATION_RESULTS_STORE_SUCCESS", "true").lower() == "true"
+        self._metadata_service = None
+    
+    @property
+    def metadata_service(self) -> SFMetadataService:
+        if self._metadata_service is None:
+            self._metadata_service = SFMetadataService(self.http_client, self.base_url, self.api_version)
+        return self._metadata_service
+    
+    @property
+    def http_client(self) -> "httpx.AsyncClient":
+        if self._http_client is None:
+            self._http_client = build_http_client()
+        return self._http_client
+    
+    async def aclose(self):
+        """Close the HTTP pool if this service created it"""
+        if self._owns_http_client and self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
     
     async def validate_credentials(
         self,
@@ -47,14 +101,11 @@ class SuccessFactorsService:
                 "client_secret": password
             }
             
-            response = requests.post(auth_url, headers=headers, data=data, timeout=10)
+            response = await self.http_client.post(auth_url, headers=headers, data=data, timeout=10)
             
-            if response.status_code == 200:
-                token_data = response.json()
-                self.access_token = token_data.get("access_token")
-                return True
-            else:
-                return False
+            # The service is shared by every tenant, so the token is not kept on it;
+            # calls that need one fetch it per connection via get_access_token
+            return response.status_code == 200 and bool(response.json().get("access_token"))
                 
         except Exception as e:
             print(f"Error validating credentials: {str(e)}")
@@ -78,7 +129,7 @@ class SuccessFactorsService:
             }
             
             data = {"grant_type": "client_credentials"}
-            response = requests.post(auth_url, headers=headers, data=data, timeout=10)
+            response = await self.http_client.post(auth_url, headers=headers, data=data, timeout=10)
             
             if response.status_code == 200:
                 return response.json().get("access_token")
@@ -91,75 +142,375 @@ class SuccessFactorsService:
         self,
         connection: Any,
         configuration_data: Dict,
-        workbook_version: Any
+        workbook_version: Any,
+        failed_parents: Optional["ConfigurationBatch"] = None,
+        keep_snapshots: Optional[Callable[[List[Dict]], Awaitable[Any]]] = None
     ) -> Dict:
         """
         Implement configuration changes to SuccessFactors
-        This is where the actual SF API calls are made
+        This is where the actual SF API calls are made. ``failed_parents`` holds
+        rows of parent types that were not applied earlier; children that
+        reference them are held back. ``keep_snapshots`` persists the snapshots
+        before anything is written (they are then left out of the result).
         """
+        from app.configuration_batch import ConfigurationRow
+        
         try:
-            # Get access token
-            token = await self.get_access_token(
-                company_id=connection.company_id,
-                username=connection.username,
-                password=connection.password_encrypted  # Should be decrypted
-            )
-            
-            if not token:
-                raise Exception("Failed to authenticate with SuccessFactors")
-            
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            
-            changes_applied = 0
-            errors = []
-            
-            # Process each configuration item
-            for config_item in configuration_data.get("configurations", []):
-                try:
+            with ExitStack() as cleanup:
+                # Get access token
+                token = await self.get_access_token(
+                    company_id=connection.company_id,
+                    username=connection.username,
+                    password=connection.password_encrypted  # Should be decrypted
+                )
+                
+                if not token:
+                    raise Exception("Failed to authenticate with SuccessFactors")
+                
+                headers = {
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json"
+                }
+                
+                # Result lists move to disk past MEMORY_SPILL_LIST_ITEMS entries;
+                # they are closed here on failure, else by the caller (close_results)
+                errors = cleanup.enter_context(SpillList())
+                
+                metadata = None
+                if self.validate_with_metadata:
+                    try:
+                        metadata = await self.metadata_service.get_metadata(connection.company_id, token)
+                    except Exception as e:
+                        print(f"Metadata unavailable, skipping local validation: {str(e)}")
+                
+                # Resolve endpoints and validate locally, grouping work by config type
+                prepared: Dict[str, List[Tuple]] = {}
+                item_keys = ItemKeys(metadata)
+                failed_types = set()
+                failed_keys: Dict[str, Set] = {}
+                
+                def record_failed(item):
+                    key = item_keys.key(item)
+                    if key is None:
+                        failed_types.add(item[0].config_type)
+                    else:
+                        failed_keys.setdefault(item[0].config_type, set()).add(key)
+                
+                # Parent items an earlier run (e.g. another job unit) did not apply
+                for block in (failed_parents.blocks if failed_parents is not None else []):
+                    endpoint = self._get_endpoint_for_config(block.config_type, metadata)
+                    for pos in range(len(block)):
+                        record_failed((block, endpoint, None, pos))
+                
+                configurations = configuration_data.get("configurations")
+                for block in (configurations.blocks if configurations is not None else []):
                     # Determine the SF API endpoint based on configuration type
-                    endpoint = self._get_endpoint_for_config(config_item.get("type"))
+                    endpoint = self._get_endpoint_for_config(block.config_type, metadata)
+                    entity = metadata.entity_sets.get(endpoint) if metadata else None
                     
-                    # Make API call to SF
-                    response = requests.post(
-                        f"{self.base_url}/{self.api_version}/{endpoint}",
-                        headers=headers,
-                        json=config_item.get("data"),
-                        timeout=30
-                    )
-                    
-                    if response.status_code in [200, 201]:
-                        changes_applied += 1
+                    # Reject invalid rows locally, in bulk, before any request is sent
+                    if entity is not None:
+                        valid, names, validation_errors = validate_block(block, entity)
+                        if validation_errors:
+                            for error in validation_errors:
+                                error["entity_set"] = endpoint
+                            errors.extend(validation_errors)
+                            for pos in (~valid).nonzero()[0]:
+                                record_failed((block, endpoint, names, pos))
+                        positions = valid.nonzero()[0]
                     else:
-                        errors.append({
-                            "config_item": config_item.get("id"),
-                            "error": response.text
-                        })
-                except Exception as e:
-                    errors.append({
-                        "config_item": config_item.get("id"),
-                        "error": str(e)
-                    })
-            
-            return {
-                "id": f"impl_{workbook_version.id}",
-                "changes_count": changes_applied,
-                "errors": errors,
-                "status": "success" if not errors else "partial"
-            }
-            
+                        # Without metadata, fall back to the classifier's property names
+                        names = {c: block.properties.get(c, c) for c in block.columns} if block.properties else None
+                        positions = range(len(block))
+                    prepared.setdefault(block.config_type, []).append((block, endpoint, names, positions))
+                
+                def items_for(entries):
+                    def items():
+                        for block, endpoint, names, positions in entries:
+                            # Spilled blocks stay in memory only while their rows are handed out
+                            block.acquire()
+                            try:
+                                for pos in positions:
+                                    yield block, endpoint, names, pos
+                            finally:
+                                block.release()
+                    return items
+                
+                async def dispatch(item) -> Optional[Dict]:
+                    block, endpoint, names, pos = item
+                    try:
+                        # Make API call to SF; the row dict is built only here
+                        response = await self.http_client.post(
+                            f"{self.base_url}/{self.api_version}/{endpoint}",
+                            headers=headers,
+                            json=block.row_data(pos, names),
+                            timeout=30
+                        )
+                        if response.status_code in [200, 201]:
+                            return None
+                        error = response.text
+                        status_code = response.status_code
+                        error_class = None
+                    except Exception as e:
+                        error = str(e)
+                        status_code = None
+                        error_class = exception_class(e)
+                    return {
+                        "config_item": ConfigurationRow(block, pos).id,
+                        "type": block.config_type,
+                        "entity_set": endpoint,
+                        "status_code": status_code,
+                        "error_class": error_class,
+                        "error": error
+                    }
+                
+                # Applied items, kept as compact tuples for the results store
+                applied = cleanup.enter_context(SpillList())
+                
+                def record_success(config_type: str, item):
+                    block, endpoint, names, pos = item
+                    applied.append((ConfigurationRow(block, pos).id, config_type, endpoint))
+                
+                # Capture the current tenant state of every touched entity first,
+                # so the run can be rolled back by sending only the inverse delta
+                snapshots = []
+                if metadata is not None and self.snapshot_before_implement:
+                    snapshots = await self.capture_snapshots(headers, metadata, prepared)
+                    if keep_snapshots is not None:
+                        await keep_snapshots(snapshots)
+                        snapshots = []
+                
+                # Parents before children; independent types in parallel
+                outcome = await ExecutionPlanner().execute(
+                    work={config_type: items_for(entries) for config_type, entries in prepared.items()},
+                    dispatch=dispatch,
+                    describe=lambda item: ConfigurationRow(item[0], item[3]).id,
+                    entity_set=lambda item: item[1],
+                    failed_types=failed_types,
+                    failed_keys=failed_keys,
+                    key=item_keys.key,
+                    reference=item_keys.reference,
+                    on_success=record_success if self.record_successes else None,
+                    errors=errors
+                )
+                changes_applied = outcome["succeeded"]
+                
+                # Only keys that were actually written may be reverted later
+                if snapshots:
+                    unapplied = {error.get("config_item") for error in errors}
+                    snapshots = [
+                        pruned for pruned in (
+                            _applied_only(snapshot, unapplied, metadata) for snapshot in snapshots
+                        ) if pruned["touched"]
+                    ]
+                
+                cleanup.pop_all()
+                return {
+                    "id": f"impl_{workbook_version.id}",
+                    "changes_count": changes_applied,
+                    "held_back": outcome["held_back"],
+                    "execution_levels": outcome["levels"],
+                    "snapshots": snapshots,
+                    "applied": applied,
+                    "errors": errors,
+                    "status": "success" if not errors else "partial"
+                }
+                
         except Exception as e:
             return {
                 "id": f"impl_{workbook_version.id}",
                 "changes_count": 0,
-                "errors": [str(e)],
+                "errors": [{"config_item": None, "error": str(e), "stage": "run"}],
                 "status": "failed"
             }
     
-    def _get_endpoint_for_config(self, config_type: str) -> str:
-        """Map configuration type to SF API endpoint"""
+    async def capture_snapshots(
+        self,
+        headers: Dict,
+        metadata: ODataMetadata,
+        prepared: Dict[str, List[Tuple]]
+    ) -> List[Dict]:
+        """
+        Read the current state of every entity an implementation is about to touch
+        Keys are read in chunks with $select projected to the written properties.
+        """
+        targets: Dict[Tuple[str, str], Dict] = {}
+        for config_type, entries in prepared.items():
+            for block, endpoint, names, positions in entries:
+                entity = metadata.entity_sets.get(endpoint)
+                if entity is None or not names or not entity.keys:
+                    continue
+                key_columns = {column: prop for column, prop in names.items() if prop in entity.keys}
+                if set(key_columns.values()) != set(entity.keys):
+                    print(f"Cannot snapshot {endpoint}: key properties not all mapped")
+                    continue
+                
+                target = targets.setdefault((config_type, endpoint), {
+                    "config_type": config_type,
+                    "entity_set": endpoint,
+                    "keys": list(entity.keys),
+                    "properties": set(),
+                    "touched": {}
+                })
+                target["properties"].update(names.values())
+                key_types = [entity.properties[k].edm_type for k in entity.keys]
+                block.acquire()
+                try:
+                    for pos in positions:
+                        key_data = block.row_data(pos, key_columns)
+                        key = _key_tuple([key_data[k] for k in entity.keys], key_types)
+                        target["touched"].setdefault(key, []).append(block.row_id(pos))
+                finally:
+                    block.release()
+        
+        semaphore = asyncio.Semaphore(int(os.getenv("SF_MAX_CONCURRENCY", "8")))
+        
+        async def read_chunk(target: Dict, keys: List[Tuple]) -> List[Dict]:
+            entity = metadata.entity_sets[target["entity_set"]]
+            key_filter = " or ".join(
+                "(" + " and ".join(
+                    f"{name} eq {_odata_literal(value, entity.properties[name].edm_type)}"
+                    for name, value in zip(target["keys"], key)
+                ) + ")"
+                for key in keys
+            )
+            async with semaphore:
+                response = await self.http_client.get(
+                    f"{self.base_url}/{self.api_version}/{target['entity_set']}",
+                    headers=headers,
+                    params={
+                        "$filter": key_filter,
+                        "$select": ",".join(sorted(target["properties"])),
+                        "$format": "json",
+                        "$top": str(len(keys))
+                    },
+                    timeout=60
+                )
+            if response.status_code != 200:
+                raise Exception(f"Snapshot read of {target['entity_set']} failed: {response.text}")
+            body = response.json()
+            records = body.get("d", {}).get("results", []) if "d" in body else body.get("value", [])
+            return [{k: v for k, v in record.items() if not k.startswith("__")} for record in records]
+        
+        snapshots = []
+        for target in targets.values():
+            touched = list(target["touched"])
+            chunks = [
+                touched[i:i + self.snapshot_chunk_size]
+                for i in range(0, len(touched), self.snapshot_chunk_size)
+            ]
+            results = await asyncio.gather(*(read_chunk(target, chunk) for chunk in chunks))
+            snapshots.append({
+                "config_type": target["config_type"],
+                "entity_set": target["entity_set"],
+                "keys": target["keys"],
+                "properties": sorted(target["properties"]),
+                "touched": [list(key) for key in touched],
+                "items": [target["touched"][key] for key in touched],
+                "before": [record for chunk in results for record in chunk]
+            })
+        return snapshots
+    
+    async def rollback_snapshots(
+        self,
+        connection: Any,
+        snapshots: List[Dict],
+        unapplied: Optional[Set[str]] = None
+    ) -> Dict:
+        """
+        Undo an implementation by sending only the inverse delta of its snapshots
+        Entities that existed are restored to their captured properties via upsert;
+        entities that did not exist are deleted. Children are reverted before parents.
+        Keys whose items are all in ``unapplied`` (failed, rejected, held back) are skipped.
+        """
+        token = await self.get_access_token(
+            company_id=connection.company_id,
+            username=connection.username,
+            password=connection.password_encrypted  # Should be decrypted
+        )
+        if not token:
+            raise Exception("Failed to authenticate with SuccessFactors")
+        
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        metadata = await self.metadata_service.get_metadata(connection.company_id, token)
+        counts = {"restored": 0, "deleted": 0}
+        snapshots = [
+            _applied_only(snapshot, unapplied or set(), metadata) for snapshot in snapshots
+        ]
+        
+        def items_for(type_snapshots):
+            def items():
+                for snapshot in type_snapshots:
+                    key_types = _key_types(snapshot, metadata)
+                    before = {
+                        _key_tuple([record.get(k) for k in snapshot["keys"]], key_types): record
+                        for record in snapshot["before"]
+                    }
+                    for key in snapshot["touched"]:
+                        yield snapshot, key, before.get(_key_tuple(key, key_types))
+            return items
+        
+        def key_path(snapshot: Dict, key: List) -> str:
+            entity = metadata.entity_sets[snapshot["entity_set"]]
+            literals = [
+                f"{name}={_odata_literal(value, entity.properties[name].edm_type)}"
+                for name, value in zip(snapshot["keys"], key)
+            ]
+            return f"{snapshot['entity_set']}({','.join(literals)})"
+        
+        async def dispatch(item) -> Optional[Dict]:
+            snapshot, key, before = item
+            path = key_path(snapshot, key)
+            try:
+                if before is None:
+                    response = await self.http_client.delete(
+                        f"{self.base_url}/{self.api_version}/{path}",
+                        headers=headers,
+                        timeout=30
+                    )
+                else:
+                    response = await self.http_client.post(
+                        f"{self.base_url}/{self.api_version}/upsert",
+                        headers=headers,
+                        json={"__metadata": {"uri": path}, **before},
+                        timeout=30
+                    )
+                if response.status_code in [200, 201, 204]:
+                    counts["deleted" if before is None else "restored"] += 1
+                    return None
+                if before is None and response.status_code == 404:
+                    # Already gone; nothing left to undo
+                    return None
+                error = response.text
+            except Exception as e:
+                error = str(e)
+            return {"config_item": path, "error": error, "stage": "rollback"}
+        
+        by_type: Dict[str, List[Dict]] = {}
+        for snapshot in snapshots:
+            by_type.setdefault(snapshot["config_type"], []).append(snapshot)
+        
+        outcome = await ExecutionPlanner(dependencies=reverse_dependencies()).execute(
+            work={config_type: items_for(entries) for config_type, entries in by_type.items()},
+            dispatch=dispatch,
+            describe=lambda item: key_path(item[0], item[1])
+        )
+        return {
+            "restored": counts["restored"],
+            "deleted": counts["deleted"],
+            "held_back": outcome["held_back"],
+            "errors": outcome["errors"],
+            "status": "success" if not outcome["errors"] else "partial"
+        }
+    
+    def _get_endpoint_for_config(self, config_type: str, metadata: Optional[ODataMetadata] = None) -> str:
+        """
+        Map configuration type to SF API endpoint
+        With tenant metadata, falls back to known aliases of the entity set
+        """
         endpoint_map = {
             "user": "User",
             "position": "Position",
@@ -172,4 +523,139 @@ class SuccessFactorsService:
             "form_template": "FormTemplate",
             "rating_scale": "RatingScale"
         }
-        return endpoint_map.get(config_type, "GenericObject")
+        endpoint = endpoint_map.get(config_type, "GenericObject")
+        if metadata is not None:
+            return metadata.resolve([endpoint] + ENTITY_ALIASES.get(config_type, [])) or endpoint
+        return endpoint
+
+
+class ItemKeys:
+    """
+    Own keys and parent references of implementation items (block, endpoint, names, pos)
+    Columns are resolved once per block: the entity's first key with metadata,
+    else the classifier's key and reference columns.
+    """
+    
+    def __init__(self, metadata: Optional[ODataMetadata]):
+        self.metadata = metadata
+        self._columns: Dict[Tuple[int, Optional[str]], Optional[int]] = {}
+    
+    def key(self, item) -> Optional[str]:
+        block, endpoint, names, pos = item
+        cache_key = (id(block), None)
+        if cache_key not in self._columns:
+            self._columns[cache_key] = self._key_column(block, endpoint, names)
+        return self._value(block, self._columns[cache_key], pos)
+    
+    def reference(self, item, parent_type: str) -> Optional[str]:
+        block, _, _, pos = item
+        cache_key = (id(block), parent_type)
+        if cache_key not in self._columns:
+            self._columns[cache_key] = reference_column(block.columns, block.properties, parent_type)
+        return self._value(block, self._columns[cache_key], pos)
+    
+    def _key_column(self, block: "SheetBlock", endpoint: str, names: Optional[Dict[str, str]]) -> Optional[int]:
+        entity = self.metadata.entity_sets.get(endpoint) if self.metadata is not None else None
+        if entity is not None and entity.keys:
+            mapping = names or {c: block.properties.get(c, c) for c in block.columns}
+            for i, column in enumerate(block.columns):
+                if mapping.get(column) == entity.keys[0]:
+                    return i
+        return key_column(block.columns, block.properties, block.config_type)
+    
+    @staticmethod
+    def _value(block: "SheetBlock", index: Optional[int], pos: int) -> Optional[str]:
+        """Key cell as a string, so a parent's 7 matches a child's "7" or 7.0"""
+        if index is None:
+            return None
+        value = block.row_data(pos, {block.columns[index]: "key"})["key"]
+        if value is None:
+            return None
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip() or None
+
+
+def _key_value(value: Any, edm_type: str) -> Any:
+    """Key value in one canonical form per EDM type, so 7, "7" and 7.0 compare equal"""
+    if value is None:
+        return None
+    try:
+        if edm_type in ("Edm.Byte", "Edm.SByte", "Edm.Int16", "Edm.Int32", "Edm.Int64"):
+            return int(float(value))
+        if edm_type in ("Edm.Double", "Edm.Single", "Edm.Decimal"):
+            return float(value)
+        if edm_type == "Edm.Boolean":
+            return str(value).lower() in ("true", "1", "yes")
+        if edm_type in ("Edm.DateTime", "Edm.DateTimeOffset"):
+            if isinstance(value, str):
+                # OData v2 JSON dates: /Date(1700000000000)/ or /Date(1700000000000+0000)/
+                match = re.match(r"^/Date\((-?\d+)([+-]\d{4})?\)/$", value)
+                if match:
+                    value = datetime.fromtimestamp(int(match.group(1)) / 1000, tz=timezone.utc)
+                else:
+                    value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if isinstance(value, datetime):
+                return value.replace(tzinfo=None).strftime("%Y-%m-%dT%H:%M:%S")
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+
+def _key_tuple(values: List[Any], key_types: List[str]) -> Tuple:
+    return tuple(_key_value(value, edm_type) for value, edm_type in zip(values, key_types))
+
+
+def _key_types(snapshot: Dict, metadata: Optional[ODataMetadata]) -> List[str]:
+    entity = metadata.entity_sets.get(snapshot["entity_set"]) if metadata is not None else None
+    if entity is None:
+        return ["Edm.String"] * len(snapshot["keys"])
+    return [
+        entity.properties[k].edm_type if k in entity.properties else "Edm.String"
+        for k in snapshot["keys"]
+    ]
+
+
+def _applied_only(snapshot: Dict, unapplied: Set[str], metadata: Optional[ODataMetadata]) -> Dict:
+    """
+    A snapshot reduced to keys with at least one applied item
+    Snapshots from before per-key items were recorded are returned unchanged.
+    """
+    if "items" not in snapshot or not unapplied:
+        return snapshot
+    kept = [
+        (key, items) for key, items in zip(snapshot["touched"], snapshot["items"])
+        if any(item not in unapplied for item in items)
+    ]
+    key_types = _key_types(snapshot, metadata)
+    kept_keys = {_key_tuple(key, key_types) for key, _ in kept}
+    return {
+        **snapshot,
+        "touched": [key for key, _ in kept],
+        "items": [items for _, items in kept],
+        "before": [
+            record for record in snapshot["before"]
+            if _key_tuple([record.get(k) for k in snapshot["keys"]], key_types) in kept_keys
+        ]
+    }
+
+
+def _odata_literal(value: Any, edm_type: str) -> str:
+    """Format a value as an OData v2 URI literal"""
+    if value is None:
+        return "null"
+    if edm_type == "Edm.Boolean":
+        return "true" if str(value).lower() in ("true", "1", "yes") else "false"
+    if edm_type in ("Edm.Byte", "Edm.SByte", "Edm.Int16", "Edm.Int32"):
+        return str(int(float(value)))
+    if edm_type == "Edm.Int64":
+        return f"{int(float(value))}L"
+    if edm_type == "Edm.Decimal":
+        return f"{value}M"
+    if edm_type == "Edm.Double":
+        return f"{float(value)}d"
+    if edm_type in ("Edm.DateTime", "Edm.DateTimeOffset"):
+        if isinstance(value, datetime):
+            value = value.strftime("%Y-%m-%dT%H:%M:%S")
+        return f"datetime'{value}'"
+    return "'" + str(value).replace("'", "''") + "'"
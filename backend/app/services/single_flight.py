@@ -0,0 +1,52 @@
+"""
+Single-flight coalescing of identical in-flight operations
+
+Concurrent calls with the same key (e.g. (version id, "analyze")) share one
+computation and its result instead of each parsing the workbook, calling the
+LLM or posting rows to SuccessFactors again. The computation runs as its own
+task, so a caller that disconnects does not cancel it for the others.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Result of ``factory()`` for ``key``, and whether it was shared
+        A call made while the same key is in flight attaches to that computation.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: "asyncio.Task"):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Nobody may be left waiting; retrieve the exception so it is not logged as lost
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> List[Hashable]:
+        return list(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
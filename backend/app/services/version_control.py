@@ -4,9 +4,11 @@ Uses Git-like approach for tracking changes
 """
 import os
 import json
-from typing import List, Dict, Optional
+import zlib
+from typing import List, Dict, Optional, Any
 from sqlalchemy.orm import Session
-from app.models import WorkbookVersion, Workbook
+from app.models import WorkbookVersion, Workbook, ImplementationLog, ImplementationSnapshot, SFConnection
+from app.services.results_store import ResultsStore
 
 
 class VersionControlService:
@@ -15,6 +17,7 @@ class VersionControlService:
     def __init__(self):
         self.repo_dir = os.getenv("REPO_DIR", "./repos")
         os.makedirs(self.repo_dir, exist_ok=True)
+        self.results_store = ResultsStore()
     
     def get_version_history(self, workbook_id: int, db: Session) -> List[Dict]:
         """Get version history for a workbook"""
@@ -64,13 +67,95 @@ class VersionControlService:
             "changes": "Detailed diff would be implemented here"
         }
     
-    def rollback_to_version(
+    def record_implementation(
+        self,
+        version: WorkbookVersion,
+        connection: SFConnection,
+        result: Dict,
+        db: Session
+    ) -> ImplementationLog:
+        """
+        Persist an implementation result, its per-item results and its
+        pre-implementation snapshots in a single transaction
+        """
+        log = ImplementationLog(
+            workbook_version_id=version.id,
+            connection_id=connection.id,
+            status=result.get("status"),
+            changes_applied=result.get("changes_count", 0),
+            implementation_data=json.dumps({
+                "held_back": result.get("held_back", 0),
+                "execution_levels": result.get("execution_levels", []),
+                "error_count": len(result.get("errors", [])),
+                "retry_of": result.get("retry_of")
+            })
+        )
+        db.add(log)
+        db.flush()
+        
+        error_counts = self.append_results(log, result, db)
+        log.errors = json.dumps(error_counts)
+        db.commit()
+        db.refresh(log)
+        return log
+    
+    def append_results(self, log: ImplementationLog, result: Dict, db: Session) -> Dict[str, int]:
+        """
+        Add the snapshots and per-item results of a run (or of one job unit) to a log
+        The caller commits; returns failed item counts by error class.
+        """
+        self.append_snapshots(log, result.get("snapshots", []), db)
+        return self.results_store.write(
+            log.id, result.get("applied", []), result.get("errors", []), db
+        )
+    
+    def append_snapshots(self, log: ImplementationLog, snapshots: List[Dict], db: Session):
+        """Add pre-implementation snapshots to a log; the caller commits"""
+        for snapshot in snapshots:
+            log.snapshots.append(ImplementationSnapshot(
+                config_type=snapshot["config_type"],
+                entity_set=snapshot["entity_set"],
+                row_count=len(snapshot["touched"]),
+                data=zlib.compress(json.dumps(snapshot, default=str).encode(), 6)
+            ))
+        db.flush()
+    
+    def load_snapshots(self, log: ImplementationLog) -> List[Dict]:
+        """Decompress the snapshots captured before an implementation"""
+        return [json.loads(zlib.decompress(snapshot.data)) for snapshot in log.snapshots]
+    
+    async def rollback_implementation(self, log_id: int, db: Session, sf_service: Any) -> Dict:
+        """Revert one implementation in SuccessFactors from its snapshots"""
+        log = db.query(ImplementationLog).filter(ImplementationLog.id == log_id).first()
+        if not log:
+            raise ValueError("Implementation not found")
+        if log.status == "rolled_back":
+            raise ValueError("Implementation already rolled back")
+        if not log.snapshots:
+            raise ValueError("No snapshot was captured for this implementation")
+        
+        connection = db.query(SFConnection).filter(SFConnection.id == log.connection_id).first()
+        if not connection:
+            raise ValueError("SF Connection not found")
+        
+        # Items without a success result (whatever the error class) were never written
+        unapplied = set(self.results_store.unapplied_items(log.id, db))
+        result = await sf_service.rollback_snapshots(connection, self.load_snapshots(log), unapplied)
+        log.status = "rolled_back" if result["status"] == "success" else "rollback_partial"
+        db.commit()
+        return {"implementation_id": log.id, **result}
+    
+    async def rollback_to_version(
         self,
         workbook_id: int,
         target_version_id: int,
-        db: Session
+        db: Session,
+        sf_service: Any
     ) -> Dict:
-        """Rollback workbook to a specific version"""
+        """
+        Rollback workbook to a specific version
+        Reverts, newest first, every implementation of a later version of the workbook
+        """
         target_version = db.query(WorkbookVersion).filter(
             WorkbookVersion.id == target_version_id,
             WorkbookVersion.workbook_id == workbook_id
@@ -79,9 +164,24 @@ class VersionControlService:
         if not target_version:
             raise ValueError("Target version not found")
         
-        # Create a new version from the target version
-        # This allows rollback without losing history
+        logs = db.query(ImplementationLog).join(
+            WorkbookVersion, ImplementationLog.workbook_version_id == WorkbookVersion.id
+        ).filter(
+            WorkbookVersion.workbook_id == workbook_id,
+            WorkbookVersion.id > target_version_id,
+            ImplementationLog.status.in_(["success", "partial", "rollback_partial"])
+        ).order_by(ImplementationLog.id.desc()).all()
+        
+        results = []
+        for log in logs:
+            result = await self.rollback_implementation(log.id, db, sf_service)
+            results.append(result)
+            if result["status"] != "success":
+                # Older implementations are only safe to undo once newer ones are
+                break
+        
         return {
             "message": f"Rolled back to version {target_version.version_number}",
-            "version_id": target_version_id
+            "version_id": target_version_id,
+            "implementations": results
         }
@@ -0,0 +1,317 @@
+"""
+Delta-compressed storage of workbook versions
+
+Every ``keyframe_interval``-th version of a workbook is stored as a full,
+compressed snapshot of its sheet data (a keyframe). The versions in between
+only store row-level deltas against their predecessor. Any version is
+reconstructed by loading the nearest keyframe and replaying the deltas up
+to it; recently reconstructed versions are kept in an LRU cache.
+"""
+import os
+import sys
+import json
+import zlib
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.memory import MB, BudgetedCache, MemoryBudget
+from app.services.workbook_profile import read_frames
+
+
+def _encode(value: Any) -> Any:
+    """Cell value as JSON (timestamps as ISO strings, NaN/NaT as None)"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if type(value).__name__ in ("NaTType", "NAType"):
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return _encode(value.item())
+    return value
+
+
+def _row_hash(row: List[Any]) -> str:
+    return hashlib.blake2b(json.dumps(row, default=str).encode(), digest_size=12).hexdigest()
+
+
+def _table_nbytes(table: Dict, sample: int = 64) -> int:
+    """Approximate memory held by a table, from the size of a sample of its rows"""
+    total = 0
+    for sheet in table["sheets"]:
+        rows = sheet["rows"]
+        if not rows:
+            continue
+        step = max(len(rows) // sample, 1)
+        picked = rows[::step][:sample]
+        per_row = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in picked) / len(picked)
+        total += int(per_row * len(rows)) + sys.getsizeof(rows)
+    return total
+
+
+class VersionStore:
+    """Keyframe + delta blobs on disk, with a cache of materialized versions"""
+
+    def __init__(
+        self,
+        store_dir: Optional[str] = None,
+        keyframe_interval: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        memory_budget: Optional[MemoryBudget] = None
+    ):
+        self.store_dir = store_dir or os.getenv("VERSION_STORE_DIR", "./uploads/version_store")
+        self.keyframe_interval = keyframe_interval or int(os.getenv("VERSION_KEYFRAME_INTERVAL", "10"))
+        self.cache_size = cache_size or int(os.getenv("VERSION_CACHE_SIZE", "8"))
+        self.materialized_dir = os.path.join(self.store_dir, "materialized")
+        os.makedirs(self.materialized_dir, exist_ok=True)
+        # Reconstructed tables, charged to the process memory budget
+        self._cache = BudgetedCache(
+            memory_budget or MemoryBudget(),
+            max_items=self.cache_size,
+            max_bytes=int(os.getenv("VERSION_CACHE_MB", "256")) * MB
+        )
+        # Loads and writes run in worker threads
+        self._lock = threading.Lock()
+
+    # Tables -------------------------------------------------------------
+
+    def read_table(self, file_path: str) -> Dict:
+        """Read a workbook file into the store's table format"""
+        return self.table_from_frames(read_frames(file_path))
+
+    def table_from_frames(self, frames: Dict) -> Dict:
+        """Store table for already-parsed sheets (sheet name -> DataFrame)"""
+        return {
+            "sheets": [
+                {
+                    "name": name,
+                    "columns": [str(c) for c in df.columns],
+                    "dtypes": [str(t) for t in df.dtypes],
+                    "rows": [[_encode(v) for v in row] for row in df.itertuples(index=False, name=None)]
+                }
+                for name, df in frames.items()
+            ]
+        }
+
+    def render(self, table: Dict, file_path: str):
+        """Write a table back out as .xlsx or .csv"""
+        import pandas as pd
+
+        frames = {}
+        for sheet in table["sheets"]:
+            df = pd.DataFrame(sheet["rows"], columns=sheet["columns"])
+            for column, dtype in zip(sheet["columns"], sheet["dtypes"]):
+                try:
+                    if dtype.startswith("datetime64"):
+                        df[column] = pd.to_datetime(df[column])
+                    elif dtype != "object":
+                        df[column] = df[column].astype(dtype)
+                except (ValueError, TypeError):
+                    pass
+            frames[sheet["name"]] = df
+
+        if file_path.endswith('.csv'):
+            next(iter(frames.values())).to_csv(file_path, index=False)
+        else:
+            with pd.ExcelWriter(file_path) as writer:
+                for name, df in frames.items():
+                    df.to_excel(writer, sheet_name=name, index=False)
+
+    # Blobs ---------------------------------------------------------------
+
+    def _write_blob(self, key: str, kind: str, payload: Dict) -> Tuple[str, int, str]:
+        data = zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 6)
+        path = os.path.join(self.store_dir, f"{key}.{kind}.z")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path, len(data), hashlib.blake2b(data, digest_size=12).hexdigest()
+
+    def _read_blob(self, path: str) -> Dict:
+        with open(path, "rb") as f:
+            return json.loads(zlib.decompress(f.read()))
+
+    def write_keyframe(self, key: str, table: Dict) -> Tuple[str, int, str]:
+        """Store a full table; returns (blob path, stored bytes, blob digest)"""
+        self._remember(key, table)
+        return self._write_blob(key, "keyframe", table)
+
+    def write_delta(self, key: str, base: Dict, table: Dict) -> Tuple[str, int, str]:
+        """Store the row-level delta from ``base`` to ``table``"""
+        self._remember(key, table)
+        return self._write_blob(key, "delta", self.diff(base, table))
+
+    def diff(self, base: Dict, table: Dict) -> Dict:
+        """
+        Row-level delta between two tables
+        Per sheet, a list of ops: ["copy", start, end] reuses base rows,
+        ["insert", rows] adds new ones. Sheets with changed columns are stored whole.
+        Rows are matched by content hash in one linear pass: a row extends the
+        current copy run when it equals the next base row, else starts a run at
+        the first base row with the same hash, else is inserted.
+        """
+        base_sheets = {sheet["name"]: sheet for sheet in base["sheets"]}
+        sheets = []
+        for sheet in table["sheets"]:
+            previous = base_sheets.get(sheet["name"])
+            if previous is None or previous["columns"] != sheet["columns"]:
+                sheets.append({"name": sheet["name"], "full": sheet})
+                continue
+
+            base_hashes = [_row_hash(r) for r in previous["rows"]]
+            first_seen: Dict[str, int] = {}
+            for i, row_hash in enumerate(base_hashes):
+                first_seen.setdefault(row_hash, i)
+
+            ops: List[List[Any]] = []
+            for row in sheet["rows"]:
+                row_hash = _row_hash(row)
+                last = ops[-1] if ops else None
+                if last is not None and last[0] == "copy" and last[2] < len(base_hashes) \
+                        and base_hashes[last[2]] == row_hash:
+                    last[2] += 1
+                elif row_hash in first_seen:
+                    start = first_seen[row_hash]
+                    ops.append(["copy", start, start + 1])
+                elif last is not None and last[0] == "insert":
+                    last[1].append(row)
+                else:
+                    ops.append(["insert", [row]])
+            sheets.append({"name": sheet["name"], "dtypes": sheet["dtypes"], "ops": ops})
+        return {"sheets": sheets}
+
+    def apply(self, base: Dict, delta: Dict) -> Dict:
+        """Replay a delta on top of its base table"""
+        base_sheets = {sheet["name"]: sheet for sheet in base["sheets"]}
+        sheets = []
+        for entry in delta["sheets"]:
+            if "full" in entry:
+                sheets.append(entry["full"])
+                continue
+            previous = base_sheets[entry["name"]]
+            rows = []
+            for op in entry["ops"]:
+                if op[0] == "copy":
+                    rows.extend(previous["rows"][op[1]:op[2]])
+                else:
+                    rows.extend(op[1])
+            sheets.append({
+                "name": entry["name"],
+                "columns": previous["columns"],
+                "dtypes": entry["dtypes"],
+                "rows": rows
+            })
+        return {"sheets": sheets}
+
+    # Reconstruction -------------------------------------------------------
+
+    def load(self, chain: List[Tuple[str, str, str]]) -> Dict:
+        """
+        Reconstruct a version from its chain, oldest first:
+        [(key, "keyframe", path), (key, "delta", path), ...]
+        Starts from the newest cached entry of the chain when there is one.
+        """
+        start = 0
+        table = None
+        for i in range(len(chain) - 1, -1, -1):
+            table = self._cache.get(chain[i][0])
+            if table is not None:
+                start = i + 1
+                break
+
+        for key, kind, path in chain[start:]:
+            payload = self._read_blob(path)
+            table = payload if kind == "keyframe" else self.apply(table, payload)
+        self._remember(chain[-1][0], table)
+        return table
+
+    def _remember(self, key: str, table: Dict):
+        self._cache.put(key, table, _table_nbytes(table))
+
+    @staticmethod
+    def link_digest(base_digest: Optional[str], key: str, kind: str, blob_digest: str) -> str:
+        """
+        Digest of a version's chain, from its base version's chain digest and
+        the digest of its own blob; computed once when the version is stored
+        """
+        digest = hashlib.blake2b(digest_size=12)
+        if base_digest:
+            digest.update(base_digest.encode())
+        digest.update(f"{key}:{kind}:{blob_digest}".encode())
+        return digest.hexdigest()
+
+    def chain_digest(self, chain: List[Tuple[str, str, str]]) -> str:
+        """Chain digest rebuilt from the blobs, for versions stored without one"""
+        digest = None
+        for key, kind, path in chain:
+            blob_digest = hashlib.blake2b(digest_size=12)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    blob_digest.update(chunk)
+            digest = self.link_digest(digest, key, kind, blob_digest.hexdigest())
+        return digest or ""
+
+    def cached_file(self, key: str, digest: str, extension: str) -> Optional[str]:
+        """Path of an already materialized file for a version, touched so it is not evicted"""
+        path = os.path.join(self.materialized_dir, f"{key}-{digest}{extension}")
+        with self._lock:
+            try:
+                os.utime(path)
+            except OSError:
+                return None
+        return path
+
+    def materialize(
+        self,
+        key: str,
+        chain: List[Tuple[str, str, str]],
+        extension: str,
+        digest: Optional[str] = None
+    ) -> str:
+        """
+        Path of a reconstructed file for a version, rebuilding it if needed
+        Files are named by the chain digest, so a file left by another
+        store or an older chain for the same key is never served.
+        """
+        digest = digest or self.chain_digest(chain)
+        path = self.cached_file(key, digest, extension)
+        if path:
+            return path
+
+        path = os.path.join(self.materialized_dir, f"{key}-{digest}{extension}")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp{extension}"
+        self.render(self.load(chain), tmp_path)
+        os.replace(tmp_path, path)
+        self._evict_materialized()
+        return path
+
+    def _evict_materialized(self):
+        """
+        Remove the least recently used files beyond VERSION_MATERIALIZED_MAX
+        Files used within VERSION_MATERIALIZED_GRACE_SECONDS are kept, since a
+        reader may just have been handed their path.
+        """
+        limit = int(os.getenv("VERSION_MATERIALIZED_MAX", "16"))
+        grace = float(os.getenv("VERSION_MATERIALIZED_GRACE_SECONDS", "300"))
+        with self._lock:
+            files = []
+            for name in os.listdir(self.materialized_dir):
+                if ".tmp" in name:
+                    continue
+                path = os.path.join(self.materialized_dir, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+            files.sort()
+            cutoff = time.time() - grace
+            for mtime, path in files[:max(len(files) - limit, 0)]:
+                if mtime > cutoff:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,112 @@
+"""
+Sheet profile index computed once when a workbook version is ingested
+
+The profile holds what metadata queries, list views and risk scoring need
+(per-sheet row counts, column dtypes, null counts, key cardinality and the
+detected configuration types) so they never have to re-read the spreadsheet.
+"""
+import json
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from app.services.column_classifier import ColumnClassifier, classify_column
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Bump when the profile layout changes so stale profiles are rebuilt
+PROFILE_VERSION = 1
+
+HIGH_RISK_TYPES = ("compensation", "permission", "workflow")
+
+_classifier = ColumnClassifier()
+
+
+def read_frames(file_path: str) -> Dict[str, "pd.DataFrame"]:
+    """All sheets of a workbook file as DataFrames"""
+    import pandas as pd
+
+    if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
+        return pd.read_excel(file_path, sheet_name=None)
+    elif file_path.endswith('.csv'):
+        return {"Sheet1": pd.read_csv(file_path)}
+    raise ValueError("Unsupported file format")
+
+
+def profile_frames(frames: Dict[str, "pd.DataFrame"]) -> Dict[str, Any]:
+    """Profile of every sheet, plus workbook totals"""
+    sheets = []
+    type_counts: Dict[str, int] = {}
+    for name, df in frames.items():
+        plan = _classifier.classify(df.columns)
+        nulls = df.isna().sum().to_numpy()
+        key_columns = [i for i, column in enumerate(df.columns) if _is_key(column)]
+        rows = len(df)
+        sheets.append({
+            "name": str(name),
+            "rows": rows,
+            "config_types": plan.config_types,
+            "columns": [
+                {"name": str(column), "dtype": str(dtype), "nulls": int(nulls[i])}
+                for i, (column, dtype) in enumerate(zip(df.columns, df.dtypes))
+            ],
+            "keys": {
+                str(df.columns[i]): _key_stats(df.iloc[:, i], rows - int(nulls[i]))
+                for i in key_columns
+            }
+        })
+        if plan.discriminator is not None:
+            # Row-wise mixed sheet: count rows per type as the split would
+            for block in plan.split(df, str(name)):
+                type_counts[block.config_type] = type_counts.get(block.config_type, 0) + len(block)
+        else:
+            for config_type in plan.config_types:
+                type_counts[config_type] = type_counts.get(config_type, 0) + rows
+
+    return {
+        "profile_version": PROFILE_VERSION,
+        "sheet_count": len(sheets),
+        "total_rows": sum(sheet["rows"] for sheet in sheets),
+        "type_counts": type_counts,
+        "sheets": sheets
+    }
+
+
+def _key_stats(series: "pd.Series", present: int) -> Dict[str, int]:
+    distinct = int(series.nunique())
+    return {"distinct": distinct, "duplicates": present - distinct}
+
+
+def _is_key(column) -> bool:
+    rule = classify_column(column)
+    return rule is not None and rule[1] == "key"
+
+
+def summary_line(profile: Dict[str, Any], file_path: str) -> str:
+    """The changes_summary text historically produced by _parse_workbook"""
+    if file_path.endswith('.csv'):
+        sheet = profile["sheets"][0]
+        return f"CSV file with {sheet['rows']} rows and {len(sheet['columns'])} columns"
+    return f"Excel workbook with {profile['sheet_count']} sheets and {profile['total_rows']} total rows"
+
+
+def assess_complexity(item_count: int) -> str:
+    """Complexity bucket for a number of configuration items"""
+    if item_count < 10:
+        return "low"
+    elif item_count < 50:
+        return "medium"
+    else:
+        return "high"
+
+
+def assess_risk(config_types: List[str]) -> str:
+    """Risk level for the configuration types a workbook touches"""
+    return "high" if any(t in HIGH_RISK_TYPES for t in config_types) else "medium"
+
+
+def load_profile(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Stored profile JSON, or None when missing or from an older layout"""
+    if not raw:
+        return None
+    profile = json.loads(raw)
+    return profile if profile.get("profile_version") == PROFILE_VERSION else None
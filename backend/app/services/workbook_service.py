@@ -2,32 +2,56 @@
 Workbook processing and management service
 """
 import os
+import io
+import json
+import asyncio
 import hashlib
-import pandas as pd
-from typing import Optional
+import zipfile
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from fastapi import UploadFile
 import aiofiles
 from datetime import datetime
 
+from app.memory import MemoryBudget, estimate_file_memory, estimate_parse_memory
 from app.models import Workbook, WorkbookVersion
+from app.services.version_store import VersionStore
+from app.services.workbook_profile import read_frames, profile_frames, summary_line, load_profile
+
+WORKBOOK_EXTENSIONS = (".xlsx", ".xls", ".csv")
 
 
 class WorkbookService:
     """Service for processing and managing workbooks"""
     
-    def __init__(self):
+    def __init__(self, memory_budget: Optional[MemoryBudget] = None):
         self.upload_dir = os.getenv("UPLOAD_DIR", "./uploads/workbooks")
         os.makedirs(self.upload_dir, exist_ok=True)
+        # Parsing waits for memory headroom instead of risking the OOM killer
+        self.memory_budget = memory_budget or MemoryBudget()
+        # Keyframe + delta storage; VERSION_STORE_ENABLED=false keeps full copies
+        self.version_store = VersionStore(memory_budget=self.memory_budget)
+        self.use_version_store = os.getenv("VERSION_STORE_ENABLED", "true").lower() == "true"
+        # Delta versions' uploaded files are removed once stored and rebuilt from the store
+        # (values only); "true" keeps them for formatting, formulas and extra sheet content
+        self.keep_originals = os.getenv("VERSION_STORE_KEEP_ORIGINALS", "false").lower() == "true"
+        # Batch uploads: files ingested at once, and limits on what an upload may unpack to
+        self.batch_concurrency = int(os.getenv("WORKBOOK_BATCH_CONCURRENCY", "4"))
+        self.batch_max_files = int(os.getenv("WORKBOOK_BATCH_MAX_FILES", "1000"))
+        self.batch_max_bytes = int(os.getenv("WORKBOOK_BATCH_MAX_BYTES", str(500 * 1024 * 1024)))
     
     async def process_upload(
         self,
         file: UploadFile,
         user_id: int,
         description: Optional[str],
-        db: Session
+        db: Session,
+        workbook_id: Optional[int] = None
     ) -> Workbook:
-        """Process uploaded workbook file"""
+        """
+        Process uploaded workbook file
+        With ``workbook_id`` the file is added as a new version of that workbook
+        """
         
         # Read file content
         content = await file.read()
@@ -45,25 +69,32 @@ class WorkbookService:
         
         # Save file
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{file.filename}"
+        # The checksum keeps two uploads of a same-named file in one second apart
+        filename = f"{timestamp}_{checksum[:12]}_{file.filename}"
         file_path = os.path.join(self.upload_dir, filename)
         
         async with aiofiles.open(file_path, 'wb') as f:
             await f.write(content)
         
-        # Parse workbook to extract metadata
-        workbook_data = await self._parse_workbook(file_path)
+        # Parse workbook once for metadata, the sheet profile and the version store table
+        workbook_data = await self._parse_workbook(file_path, with_table=self.use_version_store)
         
-        # Create workbook record
-        workbook = Workbook(
-            name=file.filename,
-            description=description or workbook_data.get("description", ""),
-            created_by=user_id
-        )
-        db.add(workbook)
-        db.flush()
+        if workbook_id:
+            workbook = db.query(Workbook).filter(Workbook.id == workbook_id).first()
+            if not workbook:
+                raise ValueError("Workbook not found")
+        else:
+            # Create workbook record
+            workbook = Workbook(
+                name=file.filename,
+                description=description or workbook_data.get("description", ""),
+                created_by=user_id
+            )
+            db.add(workbook)
+            db.flush()
         
         # Create version record
+        previous_version = self.get_latest_version(workbook.id, db)
         version_number = self._get_next_version_number(workbook.id, db)
         version = WorkbookVersion(
             workbook_id=workbook.id,
@@ -74,47 +105,365 @@ class WorkbookService:
             changes_summary=workbook_data.get("summary", ""),
             created_by=user_id
         )
+        self._apply_profile(version, workbook_data.get("profile"))
         db.add(version)
+        db.flush()
+        
+        if self.use_version_store:
+            await self._store_version(version, previous_version, db, workbook_data.get("table"))
+        
         db.commit()
         db.refresh(workbook)
         
         return workbook
     
-    async def _parse_workbook(self, file_path: str) -> dict:
-        """Parse workbook file and extract configuration data"""
+    async def process_batch(
+        self,
+        files: List[UploadFile],
+        user_id: int,
+        description: Optional[str],
+        db: Session
+    ) -> Dict:
+        """
+        Ingest many workbooks, given as files and/or zip archives, as new workbooks
+        Files are deduplicated by checksum within the batch and against stored
+        versions, ingested in parallel (WORKBOOK_BATCH_CONCURRENCY) and committed
+        in one transaction. Returns a per-file status report.
+        """
+        entries: List[Tuple[str, bytes]] = []
+        total = 0
+        for file in files:
+            if file.filename.lower().endswith(".zip"):
+                # Read member by member from the spooled upload, within what the batch has left
+                unpacked = await asyncio.to_thread(
+                    self._unpack_zip, file.file,
+                    self.batch_max_files - len(entries), self.batch_max_bytes - total
+                )
+            else:
+                if len(entries) >= self.batch_max_files:
+                    raise ValueError(f"Batch exceeds {self.batch_max_files} files")
+                unpacked = [(
+                    os.path.basename(file.filename),
+                    await self._read_upload(file, self.batch_max_bytes - total)
+                )]
+            entries.extend(unpacked)
+            total += sum(len(content) for _, content in unpacked)
+        
+        checksums = await asyncio.to_thread(
+            lambda: [hashlib.sha256(content).hexdigest() for _, content in entries]
+        )
+        existing = {
+            checksum: workbook_id
+            for checksum, workbook_id in db.query(
+                WorkbookVersion.checksum, WorkbookVersion.workbook_id
+            ).filter(WorkbookVersion.checksum.in_(set(checksums))).all()
+        }
+        
+        report: List[Dict] = []
+        pending: List[Tuple[Dict, bytes]] = []
+        first_seen: Dict[str, str] = {}
+        for (name, content), checksum in zip(entries, checksums):
+            status = {"file": name, "checksum": checksum}
+            report.append(status)
+            if not name.lower().endswith(WORKBOOK_EXTENSIONS):
+                status.update(status="skipped", detail="Unsupported file type")
+            elif checksum in first_seen:
+                status.update(status="duplicate", detail=f"Same content as {first_seen[checksum]}")
+            elif checksum in existing:
+                status.update(status="exists", workbook_id=existing[checksum])
+            else:
+                first_seen[checksum] = name
+                pending.append((status, content))
+        
+        # Write and parse files in parallel, bounded
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        
+        async def ingest(status: Dict, content: bytes):
+            file_path = os.path.join(self.upload_dir, f"{timestamp}_{status['checksum'][:12]}_{status['file']}")
+            async with semaphore:
+                try:
+                    async with self.memory_budget.admit(estimate_parse_memory(len(content), status["file"])):
+                        return await asyncio.to_thread(self._ingest_file, file_path, content)
+                except Exception as e:
+                    status.update(status="failed", detail=str(e))
+                    return None
+        
+        ingested = await asyncio.gather(*(ingest(status, content) for status, content in pending))
+        accepted = [
+            (status, len(content), result)
+            for (status, content), result in zip(pending, ingested)
+            if result is not None
+        ]
+        del pending
+        
+        # One flush per table for the whole batch, then a single commit
+        workbooks = [
+            Workbook(name=status["file"], description=description or "", created_by=user_id)
+            for status, _, _ in accepted
+        ]
+        db.add_all(workbooks)
+        db.flush()
+        versions = [
+            WorkbookVersion(
+                workbook_id=workbook.id,
+                version_number="1.0.0",
+                file_path=result["file_path"],
+                file_size=size,
+                checksum=status["checksum"],
+                changes_summary=result["summary"],
+                created_by=user_id
+            )
+            for workbook, (status, size, result) in zip(workbooks, accepted)
+        ]
+        for version, (_, _, result) in zip(versions, accepted):
+            self._apply_profile(version, result.get("profile"))
+        db.add_all(versions)
+        db.flush()
+        
+        if self.use_version_store:
+            async def store(version: WorkbookVersion, table: Optional[Dict]):
+                if table is None:
+                    return
+                async with semaphore:
+                    try:
+                        blob_path, stored_size, blob_digest = await asyncio.to_thread(
+                            self.version_store.write_keyframe, f"v{version.id}", table
+                        )
+                    except Exception as e:
+                        print(f"Version store skipped for {version.file_path}: {str(e)}")
+                        return
+                version.storage_kind = "keyframe"
+                version.blob_path = blob_path
+                version.stored_size = stored_size
+                version.chain_digest = self.version_store.link_digest(
+                    None, f"v{version.id}", "keyframe", blob_digest
+                )
+            
+            await asyncio.gather(*(
+                store(version, result.get("table")) for version, (_, _, result) in zip(versions, accepted)
+            ))
+        
+        db.commit()
+        
+        for workbook, version, (status, _, _) in zip(workbooks, versions, accepted):
+            status.update(status="created", workbook_id=workbook.id, version_id=version.id)
+        
+        counts: Dict[str, int] = {}
+        for status in report:
+            counts[status["status"]] = counts.get(status["status"], 0) + 1
+        return {"counts": counts, "files": report}
+    
+    async def _read_upload(self, file: UploadFile, max_bytes: int) -> bytes:
+        """Content of an upload, read in chunks and refused once it passes ``max_bytes``"""
+        chunks = []
+        size = 0
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"Batch exceeds {self.batch_max_bytes} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+    
+    def _unpack_zip(self, archive_file, max_files: int, max_bytes: int) -> List[Tuple[str, bytes]]:
+        """
+        Workbook-sized entries of a zip archive, refusing archives that expand past the limits
+        Each member's declared size is checked before it is read; zipfile never
+        returns more than the declared size.
+        """
+        entries = []
+        total = 0
+        with zipfile.ZipFile(archive_file) as archive:
+            for info in archive.infolist():
+                if (
+                    info.is_dir()
+                    or info.filename.startswith("__MACOSX/")
+                    or os.path.basename(info.filename).startswith(".")
+                ):
+                    continue
+                if len(entries) >= max_files:
+                    raise ValueError(f"Batch exceeds {self.batch_max_files} files")
+                total += info.file_size
+                if total > max_bytes:
+                    raise ValueError(f"Batch exceeds {self.batch_max_bytes} bytes")
+                entries.append((os.path.basename(info.filename), archive.read(info)))
+        return entries
+    
+    def _ingest_file(self, file_path: str, content: bytes) -> Dict:
+        """
+        Write one batch file and read it once (worker thread) for summary, profile and store table
+        Raises ValueError, leaving no file behind, when the workbook cannot be parsed.
+        """
+        with open(file_path, "wb") as f:
+            f.write(content)
+        
+        workbook_data = self._parse_workbook_file(file_path, with_table=self.use_version_store)
+        if workbook_data["type"] == "error":
+            os.remove(file_path)
+            raise ValueError(workbook_data["summary"])
+        workbook_data["file_path"] = file_path
+        return workbook_data
+    
+    async def _store_version(
+        self,
+        version: WorkbookVersion,
+        previous_version: Optional[WorkbookVersion],
+        db: Session,
+        table: Optional[Dict] = None
+    ):
+        """
+        Add a version's table to the version store
+        A keyframe every VERSION_KEYFRAME_INTERVAL versions, row-level deltas in between.
+        Delta versions' uploaded files are removed unless VERSION_STORE_KEEP_ORIGINALS=true.
+        """
         try:
-            if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
-                # Read Excel file
-                df = pd.read_excel(file_path, sheet_name=None)
-                
-                # Extract metadata
-                sheets = list(df.keys())
-                total_rows = sum(len(sheet_df) for sheet_df in df.values())
-                
-                return {
-                    "type": "excel",
-                    "sheets": sheets,
-                    "total_rows": total_rows,
-                    "summary": f"Excel workbook with {len(sheets)} sheets and {total_rows} total rows"
-                }
-            elif file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-                return {
-                    "type": "csv",
-                    "total_rows": len(df),
-                    "columns": list(df.columns),
-                    "summary": f"CSV file with {len(df)} rows and {len(df.columns)} columns"
-                }
+            if table is None:
+                table = await asyncio.to_thread(self.version_store.read_table, version.file_path)
+            
+            chain = self.version_chain(previous_version, db) if previous_version else []
+            key = f"v{version.id}"
+            base_digest = None
+            if chain and len(chain) < self.version_store.keyframe_interval:
+                base = await asyncio.to_thread(self.version_store.load, chain)
+                blob_path, stored_size, blob_digest = await asyncio.to_thread(
+                    self.version_store.write_delta, key, base, table
+                )
+                version.storage_kind = "delta"
+                version.base_version_id = previous_version.id
+                base_digest = previous_version.chain_digest or await asyncio.to_thread(
+                    self.version_store.chain_digest, chain
+                )
             else:
-                return {"type": "unknown", "summary": "Unknown file type"}
+                blob_path, stored_size, blob_digest = await asyncio.to_thread(
+                    self.version_store.write_keyframe, key, table
+                )
+                version.storage_kind = "keyframe"
+        except Exception as e:
+            # Unreadable workbooks are kept as plain files
+            print(f"Version store skipped for {version.file_path}: {str(e)}")
+            return
+        
+        version.blob_path = blob_path
+        version.stored_size = stored_size
+        version.chain_digest = self.version_store.link_digest(
+            base_digest, key, version.storage_kind, blob_digest
+        )
+        self._discard_original(version)
+    
+    def _discard_original(self, version: WorkbookVersion):
+        """Remove an uploaded file the store can stand in for, when configured to"""
+        if self.keep_originals or version.storage_kind != "delta":
+            return
+        # .xls cannot be written back, so those originals are always kept
+        if version.file_path.lower().endswith(".xls"):
+            return
+        try:
+            os.remove(version.file_path)
+        except OSError as e:
+            print(f"Could not remove {version.file_path}: {str(e)}")
+    
+    def version_chain(self, version: WorkbookVersion, db: Session) -> List[Tuple[str, str, str]]:
+        """Keyframe-to-version chain of blobs, oldest first; empty for plain files"""
+        chain = []
+        current = version
+        while current is not None and current.storage_kind in ("keyframe", "delta"):
+            chain.append((f"v{current.id}", current.storage_kind, current.blob_path))
+            if current.storage_kind == "keyframe":
+                return list(reversed(chain))
+            current = db.query(WorkbookVersion).filter(
+                WorkbookVersion.id == current.base_version_id
+            ).first()
+        return []
+    
+    async def materialize(self, version: WorkbookVersion, db: Session) -> str:
+        """Path of a readable file for a version, reconstructing it from the store if needed"""
+        if version.storage_kind not in ("keyframe", "delta") or os.path.exists(version.file_path):
+            return version.file_path
+        
+        key = f"v{version.id}"
+        extension = os.path.splitext(version.file_path)[1] or ".xlsx"
+        if version.chain_digest:
+            cached = self.version_store.cached_file(key, version.chain_digest, extension)
+            if cached:
+                return cached
+        
+        chain = self.version_chain(version, db)
+        if not chain:
+            raise ValueError("Version store chain is incomplete")
+        return await asyncio.to_thread(
+            self.version_store.materialize, key, chain, extension, version.chain_digest
+        )
+    
+    async def _parse_workbook(self, file_path: str, with_table: bool = False) -> dict:
+        """Parse workbook file and extract configuration data"""
+        async with self.memory_budget.admit(estimate_file_memory(file_path)):
+            return await asyncio.to_thread(self._parse_workbook_file, file_path, with_table)
+    
+    def _parse_workbook_file(self, file_path: str, with_table: bool = False) -> dict:
+        """
+        Read a workbook once for its summary and sheet profile
+        ``with_table`` also returns the version store table built from the same read.
+        """
+        if not file_path.endswith(WORKBOOK_EXTENSIONS):
+            return {"type": "unknown", "summary": "Unknown file type"}
+        
+        try:
+            frames = read_frames(file_path)
+            profile = profile_frames(frames)
         except Exception as e:
             return {"type": "error", "summary": f"Error parsing file: {str(e)}"}
+        
+        workbook_data = {
+            "type": "csv" if file_path.endswith('.csv') else "excel",
+            "sheets": list(frames.keys()),
+            "total_rows": profile["total_rows"],
+            "summary": summary_line(profile, file_path),
+            "profile": profile
+        }
+        if file_path.endswith('.csv'):
+            workbook_data["columns"] = [str(c) for c in frames["Sheet1"].columns]
+        if with_table:
+            workbook_data["table"] = self.version_store.table_from_frames(frames)
+        return workbook_data
+    
+    def _apply_profile(self, version: WorkbookVersion, profile: Optional[Dict]):
+        """Store the sheet profile index on a version"""
+        if profile is None:
+            return
+        version.profile = json.dumps(profile, separators=(",", ":"))
+        version.sheet_count = profile["sheet_count"]
+        version.total_rows = profile["total_rows"]
+        version.type_counts = json.dumps(profile["type_counts"])
+    
+    async def get_profile(self, version: WorkbookVersion, db: Session) -> Optional[Dict]:
+        """
+        Sheet profile of a version from the index
+        Versions ingested before profiles existed are profiled once and backfilled.
+        """
+        profile = load_profile(version.profile)
+        if profile is not None:
+            return profile
+        
+        file_path = await self.materialize(version, db)
+        workbook_data = await self._parse_workbook(file_path)
+        if "profile" not in workbook_data:
+            return None
+        self._apply_profile(version, workbook_data["profile"])
+        db.commit()
+        return workbook_data["profile"]
+    
+    def get_latest_version(self, workbook_id: int, db: Session) -> Optional[WorkbookVersion]:
+        return db.query(WorkbookVersion).filter(
+            WorkbookVersion.workbook_id == workbook_id
+        ).order_by(WorkbookVersion.id.desc()).first()
     
     def _get_next_version_number(self, workbook_id: int, db: Session) -> str:
         """Get next version number for workbook"""
-        last_version = db.query(WorkbookVersion).filter(
-            WorkbookVersion.workbook_id == workbook_id
-        ).order_by(WorkbookVersion.version_number.desc()).first()
+        # Newest by id: version strings do not sort numerically ("1.0.10" < "1.0.9")
+        last_version = self.get_latest_version(workbook_id, db)
         
         if not last_version:
             return "1.0.0"
@@ -0,0 +1,85 @@
+"""
+Memory benchmark: per-row dicts vs columnar ConfigurationBatch
+
+Each representation is built on its own from the same CSV file, the way a
+workbook is extracted: read into a DataFrame, converted, DataFrame released.
+Reports the peak while building and the memory the result keeps afterwards,
+so strings shared with the DataFrame are counted against the representation.
+
+Usage:
+    python benchmarks/batch_memory_benchmark.py [--rows 200000]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from app.configuration_batch import ConfigurationBatch, SheetBlock
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "userId": [f"user{i}" for i in range(rows)],
+        "department": rng.choice(["HR", "IT", "Sales", "Finance"], rows),
+        "salary": rng.normal(60000, 15000, rows),
+        "grade": rng.integers(1, 12, rows),
+        "startDate": pd.date_range("2020-01-01", periods=rows, freq="min"),
+    })
+
+
+def measure(build, path: str):
+    """(peak, retained) bytes of building a representation from ``path``"""
+    gc.collect()
+    tracemalloc.start()
+    result = build(path)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, retained
+
+
+def as_dicts(path: str):
+    df = pd.read_csv(path, parse_dates=["startDate"])
+    return [
+        {"id": f"Sheet1_{idx}", "type": "user", "sheet": "Sheet1", "row": idx + 1, "data": row.to_dict()}
+        for idx, row in df.iterrows()
+    ]
+
+
+def as_batch(path: str):
+    df = pd.read_csv(path, parse_dates=["startDate"])
+    return ConfigurationBatch([SheetBlock.from_frame(df, "Sheet1", "user")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "workbook.csv")
+        make_frame(args.rows).to_csv(path, index=False)
+        dict_peak, dict_kept = measure(as_dicts, path)
+        batch_peak, batch_kept = measure(as_batch, path)
+
+    print(f"rows:               {args.rows}")
+    print(f"{'':20}{'peak':>10}{'retained':>12}")
+    print(f"{'per-row dicts':20}{dict_peak / 1e6:8.1f}MB{dict_kept / 1e6:10.1f}MB")
+    print(f"{'ConfigurationBatch':20}{batch_peak / 1e6:8.1f}MB{batch_kept / 1e6:10.1f}MB")
+    print(
+        f"{'reduction':20}{dict_peak / max(batch_peak, 1):9.1f}x"
+        f"{dict_kept / max(batch_kept, 1):11.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Memory budget benchmark: resident bytes of a large batch with and without spilling
+
+Builds a many-sheet ConfigurationBatch, tracks its blocks against a job budget
+and reports resident bytes, spilled bytes and the cost of iterating every row.
+
+Usage:
+    python benchmarks/memory_budget_benchmark.py [--rows 100000] [--sheets 8] [--budget-mb 32]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from app.configuration_batch import ConfigurationBatch, SheetBlock
+from app.memory import JobMemory, MB, SpillList
+
+
+def make_frame(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "userId": [f"user{i}" for i in range(rows)],
+        "department": rng.choice(["HR", "IT", "Sales", "Finance"], rows),
+        "salary": rng.normal(60000, 15000, rows),
+        "grade": rng.integers(1, 12, rows),
+        "startDate": pd.date_range("2020-01-01", periods=rows, freq="min"),
+    })
+
+
+def run(rows: int, sheets: int, budget: int, spill_dir: str):
+    job = JobMemory(budget, spill_dir)
+    batch = ConfigurationBatch()
+    for i in range(sheets):
+        block = SheetBlock.from_frame(make_frame(rows, i), f"Sheet{i}", "user")
+        batch.add_block(block)
+        job.track(block)
+
+    started = time.perf_counter()
+    with SpillList() as results:
+        for row in batch:
+            results.append((row.id, row.type, row.data["grade"]))
+        count = len(results)
+    elapsed = time.perf_counter() - started
+    return job, count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--sheets", type=int, default=8)
+    parser.add_argument("--budget-mb", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'job budget':>12} {'peak':>9} {'resident':>9} {'spilled':>9} {'rows':>9} {'iterate':>9}")
+    with tempfile.TemporaryDirectory() as spill_dir:
+        for budget in (1 << 62, args.budget_mb * MB):
+            job, count, elapsed = run(args.rows, args.sheets, budget, spill_dir)
+            label = "unlimited" if budget == 1 << 62 else f"{args.budget_mb}MB"
+            print(
+                f"{label:>12} {job.peak // MB:>7}MB {job.resident // MB:>7}MB "
+                f"{job.spilled_bytes // MB:>7}MB {count:>9} {elapsed:>8.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
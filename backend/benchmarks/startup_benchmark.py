@@ -0,0 +1,94 @@
+"""
+Startup-time benchmark for the API worker
+
+Measures, in fresh interpreters:
+- import time of ``main`` (what a new worker or a ``reload=True`` restart pays)
+- import time of the heavy libraries the services load lazily
+- first-request and warm-request latency through the app lifespan
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+REQUEST_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+imported = time.perf_counter()
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    client.get("/")
+    first = time.perf_counter()
+    client.get("/")
+    warm = time.perf_counter()
+print(json.dumps({
+    "startup": started - imported,
+    "first_request": first - started,
+    "warm_request": warm - first,
+}))
+"""
+
+
+def _run(snippet: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def time_import(module: str, runs: int) -> float:
+    """Median import time of a module in a fresh interpreter"""
+    return statistics.median(
+        float(_run(IMPORT_SNIPPET.format(module=module))) for _ in range(runs)
+    )
+
+
+def time_requests(runs: int) -> dict:
+    """Median lifespan startup, first-request and warm-request latency"""
+    samples = [json.loads(_run(REQUEST_SNIPPET)) for _ in range(runs)]
+    return {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in samples[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Median of {args.runs} runs")
+    print(f"{'import main':<28}{time_import('main', args.runs) * 1000:>10.1f} ms")
+    for module in ("pandas", "openai", "jose", "passlib.context"):
+        try:
+            elapsed = time_import(module, args.runs)
+        except subprocess.CalledProcessError:
+            print(f"{'import ' + module:<28}{'n/a':>13}")
+            continue
+        print(f"{'import ' + module + ' (lazy)':<28}{elapsed * 1000:>10.1f} ms")
+    for key, elapsed in time_requests(args.runs).items():
+        print(f"{key:<28}{elapsed * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Version store benchmark: disk usage and reconstruction latency
+
+Simulates a workbook edited a few rows at a time and compares storing full
+copies with keyframes + row-level deltas. Store totals include the uploaded
+files kept alongside the blobs: keyframe originals by default, every original
+with VERSION_STORE_KEEP_ORIGINALS=true.
+
+Usage:
+    python benchmarks/version_store_benchmark.py [--rows 20000] [--versions 30]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from app.services.version_store import VersionStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--versions", type=int, default=30)
+    parser.add_argument("--changed-rows", type=int, default=5)
+    parser.add_argument("--keyframe-interval", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "userId": [f"user{i}" for i in range(args.rows)],
+        "department": rng.choice(["HR", "IT", "Sales", "Finance"], args.rows),
+        "salary": rng.integers(30000, 150000, args.rows),
+    })
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VersionStore(
+            store_dir=os.path.join(tmp, "store"),
+            keyframe_interval=args.keyframe_interval,
+            cache_size=4
+        )
+        full_bytes = 0
+        stored_bytes = 0
+        keyframe_originals = 0
+        chains = []
+        chain = []
+        write_time = 0.0
+
+        for v in range(args.versions):
+            if v:
+                idx = rng.choice(len(df), args.changed_rows, replace=False)
+                df.loc[idx, "salary"] += 1000
+                df = pd.concat([df, pd.DataFrame({
+                    "userId": [f"new{v}"], "department": ["IT"], "salary": [50000]
+                })], ignore_index=True)
+
+            path = os.path.join(tmp, f"v{v}.csv")
+            df.to_csv(path, index=False)
+            full_bytes += os.path.getsize(path)
+
+            start = time.perf_counter()
+            table = store.read_table(path)
+            key = f"v{v}"
+            if chain and len(chain) < args.keyframe_interval:
+                base = store.load(chain)
+                blob, size, _ = store.write_delta(key, base, table)
+                chain = chain + [(key, "delta", blob)]
+            else:
+                blob, size, _ = store.write_keyframe(key, table)
+                chain = [(key, "keyframe", blob)]
+                keyframe_originals += os.path.getsize(path)
+            write_time += time.perf_counter() - start
+            stored_bytes += size
+            chains.append(chain)
+
+        # Worst case: last version of a full keyframe interval, cold cache
+        worst = max(chains, key=len)
+        store._cache.clear()
+        start = time.perf_counter()
+        store.load(worst)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        store.load(worst)
+        warm = time.perf_counter() - start
+
+    print(f"versions:                 {args.versions} x {args.rows} rows, {args.changed_rows} rows changed each")
+    default_total = stored_bytes + keyframe_originals
+    keep_all_total = stored_bytes + full_bytes
+    print(f"full copies on disk:      {full_bytes / 1e6:10.2f} MB")
+    print(f"store blobs only:         {stored_bytes / 1e6:10.2f} MB")
+    print(f"store + keyframe files:   {default_total / 1e6:10.2f} MB "
+          f"({full_bytes / max(default_total, 1):.1f}x smaller, default)")
+    print(f"store + all files:        {keep_all_total / 1e6:10.2f} MB "
+          f"({keep_all_total / max(full_bytes, 1):.2f}x larger, KEEP_ORIGINALS=true)")
+    print(f"avg store time/version:   {write_time / args.versions * 1000:10.1f} ms")
+    print(f"reconstruct ({len(worst)}-blob chain), cold: {cold * 1000:8.1f} ms")
+    print(f"reconstruct, cached:      {warm * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,22 @@
 SuccessFactors Configuration Bot - Main Application
 This bot helps automate SuccessFactors configuration using workbook-based approach
 """
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import uvicorn
 from typing import List, Optional
 import os
+import asyncio
+import json
+import zipfile
 from dotenv import load_dotenv
 
-from app.database import get_db, init_db
-from app.models import SFConnection, Workbook, WorkbookVersion
+from app.database import get_db, SessionLocal
+from app.models import SFConnection, Workbook, WorkbookVersion, ImplementationLog, ImplementationJob
 from app.schemas import (
     SFConnectionCreate, SFConnectionResponse,
     WorkbookCreate, WorkbookResponse,
@@ -21,8 +26,16 @@ from app.schemas import (
 )
 from app.services.sf_service import SuccessFactorsService
 from app.services.workbook_service import WorkbookService
-from app.services.version_control import VersionControlService
 from app.services.ai_bot import AIBotService
+from app.services.scheduler import TenantScheduler
+from app.services.version_control import VersionControlService
+from app.services.single_flight import SingleFlight
+from app.services.job_leases import JobLeaseService
+from app.memory import MemoryBudget, close_results
+from app.lifespan import (
+    lifespan, get_sf_service, get_workbook_service, get_ai_bot, get_scheduler, get_version_control,
+    get_single_flight, get_memory_budget, get_job_leases
+)
 from app.auth import verify_token, create_access_token
 
 load_dotenv()
@@ -30,7 +43,8 @@ load_dotenv()
 app = FastAPI(
     title="SuccessFactors Configuration Bot",
     description="AI-powered bot for automating SuccessFactors configuration management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -42,12 +56,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-security = HTTPBearer()
+# Response compression: brotli when available, gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+except ImportError:
+    from fastapi.middleware.gzip import GZipMiddleware
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
 
-# Initialize database on startup
-@app.on_event("startup")
-async def startup_event():
-    init_db()
+# Page size bounds for row data endpoints
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+security = HTTPBearer()
 
 
 @app.get("/")
@@ -60,12 +81,15 @@ async def root():
 
 
 @app.post("/api/auth/login", response_model=LoginResponse)
-async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
+async def login(
+    credentials: LoginRequest,
+    db: Session = Depends(get_db),
+    sf_service: SuccessFactorsService = Depends(get_sf_service)
+):
     """
     Authenticate with SuccessFactors and get access token
     """
     try:
-        sf_service = SuccessFactorsService()
         # Validate SF credentials
         is_valid = await sf_service.validate_credentials(
             company_id=credentials.company_id,
@@ -123,11 +147,45 @@ async def create_connection(
 @app.get("/api/workbooks", response_model=List[WorkbookResponse])
 async def get_workbooks(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_bot: AIBotService = Depends(get_ai_bot)
 ):
-    """Get all workbooks"""
+    """Get all workbooks, with counts and risk of their latest version from the profile index"""
     token_data = verify_token(credentials.credentials)
-    workbooks = db.query(Workbook).all()
+    latest = db.query(
+        WorkbookVersion.workbook_id,
+        func.max(WorkbookVersion.id).label("version_id")
+    ).group_by(WorkbookVersion.workbook_id).subquery()
+    rows = db.query(
+        Workbook,
+        WorkbookVersion.id,
+        WorkbookVersion.version_number,
+        WorkbookVersion.sheet_count,
+        WorkbookVersion.total_rows,
+        WorkbookVersion.type_counts
+    ).outerjoin(
+        latest, latest.c.workbook_id == Workbook.id
+    ).outerjoin(
+        WorkbookVersion, WorkbookVersion.id == latest.c.version_id
+    ).all()
+    
+    workbooks = []
+    for workbook, version_id, version_number, sheet_count, total_rows, type_counts in rows:
+        item = WorkbookResponse.model_validate(workbook).model_dump()
+        item.update(
+            latest_version_id=version_id,
+            latest_version_number=version_number,
+            sheet_count=sheet_count,
+            total_rows=total_rows
+        )
+        if type_counts:
+            assessment = ai_bot.assess_profile({"type_counts": json.loads(type_counts)})
+            item.update(
+                type_counts=assessment["type_counts"],
+                complexity=assessment["complexity"],
+                risk_level=assessment["risk_level"]
+            )
+        workbooks.append(item)
     return workbooks
 
 
@@ -136,7 +194,8 @@ async def upload_workbook(
     file: UploadFile = File(...),
     description: Optional[str] = None,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
 ):
     """
     Upload a workbook for SuccessFactors configuration
@@ -145,7 +204,6 @@ async def upload_workbook(
     token_data = verify_token(credentials.credentials)
     
     try:
-        workbook_service = WorkbookService()
         workbook = await workbook_service.process_upload(
             file=file,
             user_id=token_data.get("sub"),
@@ -157,16 +215,83 @@ async def upload_workbook(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post("/api/workbooks/upload/batch")
+async def upload_workbooks_batch(
+    files: List[UploadFile] = File(...),
+    description: Optional[str] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
+):
+    """
+    Upload many workbooks at once, as files and/or zip archives
+    Returns a status per file: created, duplicate, exists, skipped or failed
+    """
+    token_data = verify_token(credentials.credentials)
+    
+    try:
+        return await workbook_service.process_batch(
+            files=files,
+            user_id=token_data.get("sub"),
+            description=description,
+            db=db
+        )
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/workbooks/{workbook_id}/versions")
+async def upload_workbook_version(
+    workbook_id: int,
+    file: UploadFile = File(...),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
+):
+    """Upload a new version of an existing workbook"""
+    token_data = verify_token(credentials.credentials)
+    
+    try:
+        workbook = await workbook_service.process_upload(
+            file=file,
+            user_id=token_data.get("sub"),
+            description=None,
+            db=db,
+            workbook_id=workbook_id
+        )
+        version = workbook_service.get_latest_version(workbook.id, db)
+        return {
+            "message": "Workbook version uploaded successfully",
+            "workbook_id": workbook.id,
+            "version_id": version.id,
+            "version_number": version.version_number
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post("/api/workbooks/{workbook_id}/implement")
 async def implement_workbook(
     workbook_id: int,
     version_id: Optional[int] = None,
+    priority: Optional[str] = Query(None, pattern="^(normal|bulk)$"),
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    sf_service: SuccessFactorsService = Depends(get_sf_service),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    scheduler: TenantScheduler = Depends(get_scheduler),
+    version_control: VersionControlService = Depends(get_version_control),
+    workbook_service: WorkbookService = Depends(get_workbook_service),
+    single_flight: SingleFlight = Depends(get_single_flight)
 ):
     """
     Implement workbook configuration to SuccessFactors
     Uses AI bot to analyze and apply configurations
+    Jobs are queued fairly per SF company at the company's configured priority;
+    ``priority`` (normal or bulk) can only lower it
+    A duplicate request for a version being implemented attaches to the running job
     """
     token_data = verify_token(credentials.credentials)
     
@@ -183,43 +308,307 @@ async def implement_workbook(
         if not sf_connection:
             raise HTTPException(status_code=404, detail="SF Connection not found")
         
-        # Initialize services
-        sf_service = SuccessFactorsService()
-        ai_bot = AIBotService()
-        workbook_service = WorkbookService()
-        
         # Get workbook version
-        if version_id:
-            version = db.query(WorkbookVersion).filter(
-                WorkbookVersion.id == version_id
-            ).first()
-        else:
-            version = db.query(WorkbookVersion).filter(
-                WorkbookVersion.workbook_id == workbook_id
-            ).order_by(WorkbookVersion.version_number.desc()).first()
+        version = _get_workbook_version(workbook_id, version_id, db)
+        version_id, connection_id = version.id, sf_connection.id
         
-        if not version:
-            raise HTTPException(status_code=404, detail="Workbook version not found")
+        async def run_implementation():
+            # The job outlives the request that started it, so it has its own session
+            job_db = SessionLocal()
+            try:
+                job_version = job_db.query(WorkbookVersion).filter(WorkbookVersion.id == version_id).first()
+                job_connection = job_db.query(SFConnection).filter(SFConnection.id == connection_id).first()
+                
+                # AI bot analyzes the workbook
+                file_path = await workbook_service.materialize(job_version, job_db)
+                analysis = await ai_bot.analyze_workbook(file_path)
+                
+                # Implement configuration, queued fairly against other tenants' jobs
+                implementation_result = await scheduler.run(
+                    tenant=job_connection.company_id,
+                    factory=lambda: sf_service.implement_configuration(
+                        connection=job_connection,
+                        configuration_data=analysis,
+                        workbook_version=job_version
+                    ),
+                    cost=analysis.get("estimated_changes", 1),
+                    priority=priority
+                )
+                try:
+                    implementation_log = version_control.record_implementation(
+                        job_version, job_connection, implementation_result, job_db
+                    )
+                    
+                    return {
+                        "message": "Configuration implemented successfully",
+                        "implementation_id": implementation_log.id,
+                        "changes_applied": implementation_result.get("changes_count", 0),
+                        "failed": len(implementation_result.get("errors", [])),
+                        "results_url": f"/api/implementations/{implementation_log.id}/results"
+                    }
+                finally:
+                    close_results(implementation_result)
+            finally:
+                job_db.close()
         
-        # AI bot analyzes the workbook
-        analysis = await ai_bot.analyze_workbook(version.file_path)
+        result, attached = await single_flight.do((version_id, "implement"), run_implementation)
+        return {**result, "attached": attached}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/workbooks/{workbook_id}/jobs")
+async def create_implementation_job(
+    workbook_id: int,
+    version_id: Optional[int] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    workbook_service: WorkbookService = Depends(get_workbook_service),
+    job_leases: JobLeaseService = Depends(get_job_leases)
+):
+    """
+    Queue a workbook implementation as leased work units in the database
+    Any API or worker.py process sharing the database picks units up, so a large
+    implementation is spread across workers. A running job for the same version
+    and connection is returned instead of creating a second one.
+    """
+    token_data = verify_token(credentials.credentials)
+    
+    try:
+        workbook = db.query(Workbook).filter(Workbook.id == workbook_id).first()
+        if not workbook:
+            raise HTTPException(status_code=404, detail="Workbook not found")
         
-        # Implement configuration
-        implementation_result = await sf_service.implement_configuration(
-            connection=sf_connection,
-            configuration_data=analysis,
-            workbook_version=version
-        )
+        sf_connection = db.query(SFConnection).filter(
+            SFConnection.id == workbook.connection_id
+        ).first()
+        if not sf_connection:
+            raise HTTPException(status_code=404, detail="SF Connection not found")
+        
+        version = _get_workbook_version(workbook_id, version_id, db)
+        job = db.query(ImplementationJob).filter(
+            ImplementationJob.workbook_version_id == version.id,
+            ImplementationJob.connection_id == sf_connection.id,
+            ImplementationJob.status == "running"
+        ).first()
+        attached = job is not None
+        if job is None:
+            configurations = await _load_configurations(ai_bot, workbook_service, version, db)
+            version_id, connection_id = version.id, sf_connection.id
+            
+            def create_job():
+                # Runs in a worker thread, so it has its own session
+                job_db = SessionLocal()
+                try:
+                    job_version = job_db.query(WorkbookVersion).filter(WorkbookVersion.id == version_id).first()
+                    job_connection = job_db.query(SFConnection).filter(SFConnection.id == connection_id).first()
+                    created = job_leases.create_job(
+                        job_version, job_connection, configurations, job_db, created_by=token_data.get("sub")
+                    )
+                    return created.id, created.implementation_log_id, created.total_units, created.total_items
+                finally:
+                    job_db.close()
+            
+            job_id, implementation_id, total_units, total_items = await asyncio.to_thread(create_job)
+        else:
+            job_id, implementation_id = job.id, job.implementation_log_id
+            total_units, total_items = job.total_units, job.total_items
         
         return {
-            "message": "Configuration implemented successfully",
-            "implementation_id": implementation_result.get("id"),
-            "changes_applied": implementation_result.get("changes_count", 0)
+            "message": "Implementation job queued",
+            "job_id": job_id,
+            "implementation_id": implementation_id,
+            "total_units": total_units,
+            "total_items": total_items,
+            "attached": attached,
+            "status_url": f"/api/jobs/{job_id}",
+            "results_url": f"/api/implementations/{implementation_id}/results"
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_implementation_job(
+    job_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    job_leases: JobLeaseService = Depends(get_job_leases)
+):
+    """Progress of an implementation job: units and items by status, and the workers holding leases"""
+    token_data = verify_token(credentials.credentials)
+    
+    job = db.query(ImplementationJob).filter(ImplementationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_leases.progress(job, db)
+
+
+@app.get("/api/implementations/{implementation_id}/results")
+async def get_implementation_results(
+    implementation_id: int,
+    status: Optional[str] = None,
+    error_class: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    version_control: VersionControlService = Depends(get_version_control)
+):
+    """Per-item results of an implementation, filterable by status, error class and entity type"""
+    token_data = verify_token(credentials.credentials)
+    return version_control.results_store.query(
+        implementation_id, db,
+        status=status,
+        error_class=error_class,
+        entity_type=entity_type,
+        offset=offset,
+        limit=limit
+    )
+
+
+@app.get("/api/implementations/{implementation_id}/results/summary")
+async def get_implementation_results_summary(
+    implementation_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    version_control: VersionControlService = Depends(get_version_control)
+):
+    """Item counts of an implementation by status, error class and entity type"""
+    token_data = verify_token(credentials.credentials)
+    return version_control.results_store.summary(implementation_id, db)
+
+
+@app.post("/api/implementations/{implementation_id}/retry")
+async def retry_implementation(
+    implementation_id: int,
+    error_class: Optional[str] = None,
+    priority: Optional[str] = Query(None, pattern="^(normal|bulk)$"),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    sf_service: SuccessFactorsService = Depends(get_sf_service),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    scheduler: TenantScheduler = Depends(get_scheduler),
+    version_control: VersionControlService = Depends(get_version_control),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
+):
+    """
+    Re-send only the items of an implementation that did not apply
+    ``error_class`` narrows the retry to one class of failure (e.g. rate_limited)
+    """
+    token_data = verify_token(credentials.credentials)
+    
+    try:
+        log = db.query(ImplementationLog).filter(ImplementationLog.id == implementation_id).first()
+        if not log:
+            raise HTTPException(status_code=404, detail="Implementation not found")
+        
+        item_ids = version_control.results_store.retryable_items(log.id, db, error_class)
+        if not item_ids:
+            raise HTTPException(status_code=400, detail="No failed items to retry")
+        
+        version = db.query(WorkbookVersion).filter(WorkbookVersion.id == log.workbook_version_id).first()
+        sf_connection = db.query(SFConnection).filter(SFConnection.id == log.connection_id).first()
+        if not version or not sf_connection:
+            raise HTTPException(status_code=404, detail="Workbook version or SF Connection not found")
+        
+        configurations = await _load_configurations(ai_bot, workbook_service, version, db)
+        retry_batch = configurations.select_ids(set(item_ids))
+        
+        implementation_result = await scheduler.run(
+            tenant=sf_connection.company_id,
+            factory=lambda: sf_service.implement_configuration(
+                connection=sf_connection,
+                configuration_data={"configurations": retry_batch},
+                workbook_version=version
+            ),
+            cost=len(retry_batch),
+            priority=priority
+        )
+        implementation_result["retry_of"] = log.id
+        try:
+            implementation_log = version_control.record_implementation(
+                version, sf_connection, implementation_result, db
+            )
+            
+            return {
+                "message": "Retry completed",
+                "implementation_id": implementation_log.id,
+                "retried": len(retry_batch),
+                "changes_applied": implementation_result.get("changes_count", 0),
+                "failed": len(implementation_result.get("errors", [])),
+                "results_url": f"/api/implementations/{implementation_log.id}/results"
+            }
+        finally:
+            close_results(implementation_result)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/implementations/{implementation_id}/rollback")
+async def rollback_implementation(
+    implementation_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    sf_service: SuccessFactorsService = Depends(get_sf_service),
+    version_control: VersionControlService = Depends(get_version_control)
+):
+    """
+    Revert one implementation in SuccessFactors
+    Sends only the inverse delta captured in its pre-implementation snapshot
+    """
+    token_data = verify_token(credentials.credentials)
+    
+    try:
+        return await version_control.rollback_implementation(implementation_id, db, sf_service)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/workbooks/{workbook_id}/rollback")
+async def rollback_workbook(
+    workbook_id: int,
+    target_version_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    sf_service: SuccessFactorsService = Depends(get_sf_service),
+    version_control: VersionControlService = Depends(get_version_control)
+):
+    """Revert every implementation of versions newer than the target version"""
+    token_data = verify_token(credentials.credentials)
+    
+    try:
+        return await version_control.rollback_to_version(workbook_id, target_version_id, db, sf_service)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    scheduler: TenantScheduler = Depends(get_scheduler),
+    memory_budget: MemoryBudget = Depends(get_memory_budget)
+):
+    """
+    Per-tenant queue depth, running jobs and wait times of implementation jobs,
+    plus memory admission (reserved bytes, queued parses, spilled bytes)
+    """
+    token_data = verify_token(credentials.credentials)
+    return {**scheduler.stats(), "memory": memory_budget.stats()}
+
+
 @app.get("/api/workbooks/{workbook_id}/versions", response_model=List[WorkbookVersionResponse])
 async def get_workbook_versions(
     workbook_id: int,
@@ -230,45 +619,188 @@ async def get_workbook_versions(
     token_data = verify_token(credentials.credentials)
     versions = db.query(WorkbookVersion).filter(
         WorkbookVersion.workbook_id == workbook_id
-    ).order_by(WorkbookVersion.version_number.desc()).all()
+    ).order_by(WorkbookVersion.id.desc()).all()
     return versions
 
 
+@app.get("/api/workbooks/{workbook_id}/profile")
+async def get_workbook_profile(
+    workbook_id: int,
+    version_id: Optional[int] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
+):
+    """
+    Sheet profile of a workbook version: rows, column dtypes, null counts, key cardinality,
+    config types, complexity and risk. Served from the index built at upload time.
+    """
+    token_data = verify_token(credentials.credentials)
+    
+    version = _get_workbook_version(workbook_id, version_id, db)
+    profile = await workbook_service.get_profile(version, db)
+    if profile is None:
+        raise HTTPException(status_code=422, detail="Workbook could not be profiled")
+    
+    return {
+        "workbook_id": workbook_id,
+        "version_id": version.id,
+        "sheet_count": profile["sheet_count"],
+        "total_rows": profile["total_rows"],
+        **ai_bot.assess_profile(profile),
+        "sheets": profile["sheets"]
+    }
+
+
 @app.post("/api/workbooks/{workbook_id}/analyze")
 async def analyze_workbook(
     workbook_id: int,
+    version_id: Optional[int] = None,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    workbook_service: WorkbookService = Depends(get_workbook_service),
+    single_flight: SingleFlight = Depends(get_single_flight)
 ):
     """
     Use AI bot to analyze workbook and provide recommendations
+    Returns the summary only; row data is served by the configurations endpoints
+    Concurrent requests for the same version share one analysis
     """
     token_data = verify_token(credentials.credentials)
     
     try:
-        workbook = db.query(Workbook).filter(Workbook.id == workbook_id).first()
-        if not workbook:
-            raise HTTPException(status_code=404, detail="Workbook not found")
-        
-        version = db.query(WorkbookVersion).filter(
-            WorkbookVersion.workbook_id == workbook_id
-        ).order_by(WorkbookVersion.version_number.desc()).first()
+        version = _get_workbook_version(workbook_id, version_id, db)
+        version_id = version.id
         
-        if not version:
-            raise HTTPException(status_code=404, detail="No version found")
+        async def run_analysis():
+            # Shared with requests that may finish first, so it has its own session
+            analysis_db = SessionLocal()
+            try:
+                analysis_version = analysis_db.query(WorkbookVersion).filter(
+                    WorkbookVersion.id == version_id
+                ).first()
+                file_path = await workbook_service.materialize(analysis_version, analysis_db)
+            finally:
+                analysis_db.close()
+            analysis = await ai_bot.analyze_workbook(file_path)
+            if "error" in analysis:
+                return analysis
+            return ai_bot.summarize_analysis(analysis)
         
-        ai_bot = AIBotService()
-        analysis = await ai_bot.analyze_workbook(version.file_path)
+        summary, _ = await single_flight.do((version.id, "analyze"), run_analysis)
+        if "error" in summary:
+            raise HTTPException(status_code=422, detail=summary["error"])
         
         return {
             "workbook_id": workbook_id,
-            "analysis": analysis,
-            "recommendations": analysis.get("recommendations", []),
-            "estimated_changes": analysis.get("estimated_changes", 0)
+            "version_id": version.id,
+            **summary,
+            "configurations_url": f"/api/workbooks/{workbook_id}/configurations?version_id={version.id}"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/workbooks/{workbook_id}/configurations")
+async def get_workbook_configurations(
+    workbook_id: int,
+    version_id: Optional[int] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
+):
+    """Page through the configuration items of a workbook version"""
+    token_data = verify_token(credentials.credentials)
+    
+    version = _get_workbook_version(workbook_id, version_id, db)
+    configurations = await _load_configurations(ai_bot, workbook_service, version, db)
+    total = len(configurations)
+    
+    return {
+        "workbook_id": workbook_id,
+        "version_id": version.id,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if offset + limit < total else None,
+        "items": configurations.to_dicts(offset, offset + limit)
+    }
+
+
+@app.get("/api/workbooks/{workbook_id}/configurations/stream")
+async def stream_workbook_configurations(
+    workbook_id: int,
+    version_id: Optional[int] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    ai_bot: AIBotService = Depends(get_ai_bot),
+    workbook_service: WorkbookService = Depends(get_workbook_service)
+):
+    """Stream every configuration item of a workbook version as NDJSON"""
+    token_data = verify_token(credentials.credentials)
+    
+    version = _get_workbook_version(workbook_id, version_id, db)
+    configurations = await _load_configurations(ai_bot, workbook_service, version, db)
+    
+    def encode_rows():
+        # Rows are encoded a page at a time so the body is never held in memory
+        total = len(configurations)
+        for start in range(0, total, DEFAULT_PAGE_SIZE):
+            yield "".join(
+                json.dumps(row, default=_json_default) + "\n"
+                for row in configurations.to_dicts(start, start + DEFAULT_PAGE_SIZE)
+            )
+    
+    return StreamingResponse(encode_rows(), media_type="application/x-ndjson")
+
+
+def _get_workbook_version(workbook_id: int, version_id: Optional[int], db: Session) -> WorkbookVersion:
+    """Requested version of a workbook, or its latest version"""
+    workbook = db.query(Workbook).filter(Workbook.id == workbook_id).first()
+    if not workbook:
+        raise HTTPException(status_code=404, detail="Workbook not found")
+    
+    if version_id:
+        version = db.query(WorkbookVersion).filter(
+            WorkbookVersion.id == version_id,
+            WorkbookVersion.workbook_id == workbook_id
+        ).first()
+    else:
+        version = db.query(WorkbookVersion).filter(
+            WorkbookVersion.workbook_id == workbook_id
+        ).order_by(WorkbookVersion.id.desc()).first()
+    
+    if not version:
+        raise HTTPException(status_code=404, detail="No version found")
+    return version
+
+
+async def _load_configurations(
+    ai_bot: AIBotService,
+    workbook_service: WorkbookService,
+    version: WorkbookVersion,
+    db: Session
+):
+    try:
+        file_path = await workbook_service.materialize(version, db)
+        extraction = await ai_bot.extract_configurations(file_path)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return extraction["configurations"]
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,59 @@
+"""
+Regression tests for sheet classification against the original _analyze_sheet outcomes
+"""
+import pytest
+
+from app.services.column_classifier import ColumnClassifier
+
+
+@pytest.mark.parametrize("columns, expected", [
+    # Generic attributes must not beat another type's key column
+    (["Job Code", "Title", "Description"], "job"),
+    (["Position Code", "Department", "Location"], "position"),
+    (["Job ID", "Title", "Location"], "job"),
+    (["Position ID", "Title", "Department"], "position"),
+    # Historical substring precedence
+    (["User ID", "Title", "Department", "Location"], "user"),
+    (["Employee ID", "First Name", "Last Name"], "user"),
+    (["Position", "Position Title", "Target FTE"], "position"),
+    (["Job Code", "Job Title", "Job Level"], "job"),
+    (["Compensation ID", "Salary", "Currency"], "compensation"),
+    (["Title", "Department", "Location"], "generic"),
+])
+def test_primary_type_matches_original(columns, expected):
+    assert ColumnClassifier().classify(columns).config_types == [expected]
+
+
+def test_generic_attributes_follow_user_key():
+    plan = ColumnClassifier().classify(["User ID", "Title", "Department"])
+    properties = plan.parts[0].properties
+    assert properties[1] == "title"
+    assert properties[2] == "department"
+
+
+def test_generic_attributes_do_not_map_onto_other_types():
+    plan = ColumnClassifier().classify(["Job Code", "Title", "Description"])
+    properties = plan.parts[0].properties
+    assert properties[0] == "externalCode"
+    assert 1 not in properties
+    assert properties[2] == "description"
+
+
+def test_reference_columns_stay_on_the_primary_type():
+    plan = ColumnClassifier().classify(
+        ["Employee ID", "First Name", "Position Code", "Position Title", "Department"]
+    )
+    assert plan.config_types == ["user"]
+    properties = plan.parts[0].properties
+    assert properties[2] == "position"
+    assert properties[4] == "department"
+
+
+def test_side_by_side_types_split_when_both_are_described():
+    plan = ColumnClassifier().classify(
+        ["Employee ID", "First Name", "Position Code", "Position Title", "Target FTE"]
+    )
+    assert plan.config_types == ["user", "position"]
+    user, position = plan.parts
+    assert position.columns == (0, 2, 3, 4)
+    assert user.properties[2] == "position"
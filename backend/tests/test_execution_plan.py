@@ -0,0 +1,107 @@
+"""
+Tests for holding back child items by the parent keys they reference
+"""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pandas as pd
+
+from app.configuration_batch import ConfigurationBatch
+from app.services.column_classifier import ColumnClassifier
+from app.services.execution_plan import ExecutionPlanner
+from app.services.sf_service import SuccessFactorsService
+
+
+def make_batch(**sheets) -> ConfigurationBatch:
+    classifier = ColumnClassifier()
+    batch = ConfigurationBatch()
+    for name, df in sheets.items():
+        for block in classifier.classify(list(df.columns)).split(df, name):
+            batch.add_block(block)
+    return batch
+
+
+def implement(batch: ConfigurationBatch, rejected: bytes) -> dict:
+    """Run an implementation against a mocked tenant rejecting rows containing ``rejected``"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/oauth/token"):
+            return httpx.Response(200, json={"access_token": "t"})
+        if request.url.path.endswith("$metadata"):
+            return httpx.Response(404)
+        if rejected in request.content:
+            return httpx.Response(400, text="rejected")
+        return httpx.Response(201, json={})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = SuccessFactorsService(http_client=client)
+            return await service.implement_configuration(
+                connection=SimpleNamespace(company_id="acme", username="u", password_encrypted="p"),
+                configuration_data={"configurations": batch},
+                workbook_version=SimpleNamespace(id=1)
+            )
+
+    return asyncio.run(run())
+
+
+def test_only_children_of_the_failed_parent_are_held_back():
+    batch = make_batch(
+        Departments=pd.DataFrame({"Department Code": ["D1", "D2", "D3"], "Department Name": ["A", "B", "C"]}),
+        Positions=pd.DataFrame({
+            "Position Code": ["P1", "P2", "P3"],
+            "Position Title": ["X", "Y", "Z"],
+            "Department": ["D1", "D3", "D2"]
+        }),
+        Users=pd.DataFrame({"User ID": ["U1", "U2"], "First Name": ["a", "b"], "Position Code": ["P1", "P3"]}),
+    )
+    result = implement(batch, b'"D2"')
+
+    errors = {error["config_item"]: error for error in result["errors"]}
+    assert result["changes_count"] == 5
+    assert set(errors) == {"Departments_1", "Positions_2", "Users_1"}
+    assert errors["Positions_2"]["stage"] == "held_back"
+    assert errors["Users_1"]["stage"] == "held_back"
+    assert result["held_back"] == 2
+
+
+def test_children_without_a_reference_fall_back_to_the_parent_type():
+    async def run():
+        async def dispatch(item):
+            return {"config_item": item} if item == "d2" else None
+
+        return await ExecutionPlanner(max_concurrency=2).execute(
+            work={"department": lambda: iter(["d1", "d2"]), "position": lambda: iter(["p1", "p2"])},
+            dispatch=dispatch,
+            describe=str,
+            key=str,
+            reference=lambda item, parent: None
+        )
+
+    outcome = asyncio.run(run())
+    assert outcome["succeeded"] == 1
+    assert outcome["held_back"] == 2
+
+
+def test_held_back_items_do_not_hold_back_unrelated_children():
+    async def run():
+        async def dispatch(item):
+            return {"config_item": item} if item == "d2" else None
+
+        parents = {"p1": "d1", "p2": "d2", "j1": "p1", "j2": "p2"}
+        return await ExecutionPlanner(max_concurrency=2).execute(
+            work={
+                "department": lambda: iter(["d1", "d2"]),
+                "position": lambda: iter(["p1", "p2"]),
+                "job": lambda: iter(["j1", "j2"])
+            },
+            dispatch=dispatch,
+            describe=str,
+            key=str,
+            reference=lambda item, parent: parents.get(item)
+        )
+
+    outcome = asyncio.run(run())
+    held = sorted(error["config_item"] for error in outcome["errors"] if error.get("stage") == "held_back")
+    assert held == ["j2", "p2"]
+    assert outcome["succeeded"] == 3
@@ -0,0 +1,64 @@
+"""
+Tests for tenant-fair claiming of job units
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import ImplementationJob, JobUnit, SFConnection
+from app.services.job_leases import JobLeaseService
+from app.services.scheduler import TenantPolicy
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_job(db, tenant: str, units: int) -> ImplementationJob:
+    connection = SFConnection(company_id=tenant, username="u")
+    db.add(connection)
+    db.flush()
+    job = ImplementationJob(workbook_version_id=1, connection_id=connection.id, status="running")
+    for i in range(units):
+        job.units.append(JobUnit(level=0, config_type="user", item_ids=f'["Users_{i}"]', item_count=1))
+    db.add(job)
+    db.commit()
+    return job
+
+
+def claimed_tenants(leases: JobLeaseService, db, count: int):
+    tenants = []
+    for n in range(count):
+        unit = leases.claim(f"worker{n}", db)
+        tenants.append(unit.job.connection_id if unit else None)
+    return tenants
+
+
+def test_claims_alternate_tenants_up_to_their_caps(db):
+    acme = add_job(db, "acme", 6)
+    beta = add_job(db, "beta", 3)
+    leases = JobLeaseService(None, policy=TenantPolicy(default_cap=2, weights={}, caps={}, priorities={}))
+
+    assert claimed_tenants(leases, db, 5) == [
+        acme.connection_id, beta.connection_id, acme.connection_id, beta.connection_id, None
+    ]
+
+
+def test_claims_follow_tenant_priority_and_weight(db):
+    acme = add_job(db, "acme", 6)
+    beta = add_job(db, "beta", 6)
+    gamma = add_job(db, "gamma", 6)
+    policy = TenantPolicy(
+        default_cap=4, weights={"acme": 2}, caps={"gamma": 1}, priorities={"gamma": "urgent"}
+    )
+    leases = JobLeaseService(None, policy=policy)
+
+    assert claimed_tenants(leases, db, 4) == [
+        gamma.connection_id, acme.connection_id, beta.connection_id, acme.connection_id
+    ]
@@ -0,0 +1,53 @@
+"""
+Tests for selecting a job unit's rows by the positions recorded at split time
+"""
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+
+from app.configuration_batch import ConfigurationBatch, SheetBlock
+from app.services.job_leases import row_ranges
+from app.services.job_worker import JobWorker
+
+
+def make_batch() -> ConfigurationBatch:
+    return ConfigurationBatch([
+        SheetBlock.from_frame(pd.DataFrame({"userId": [f"a{i}" for i in range(5)]}), "A", "user"),
+        SheetBlock.from_frame(pd.DataFrame({"code": [f"p{i}" for i in range(4)]}), "P", "position"),
+        SheetBlock.from_frame(pd.DataFrame({"userId": [f"b{i}" for i in range(6)]}), "B", "user"),
+    ])
+
+
+def unit_for(batch: ConfigurationBatch, config_type: str, start: int, stop: int) -> SimpleNamespace:
+    blocks = [(i, len(b)) for i, b in enumerate(batch.blocks) if b.config_type == config_type]
+    ids = [b.row_id(pos) for b in batch.blocks if b.config_type == config_type for pos in range(len(b))]
+    return SimpleNamespace(
+        item_ids=json.dumps(ids[start:stop]),
+        row_ranges=json.dumps(row_ranges(blocks, start, stop))
+    )
+
+
+def test_row_ranges_span_blocks_of_one_type():
+    blocks = [(0, 5), (2, 6)]
+    assert row_ranges(blocks, 0, 4) == [[0, 0, 4]]
+    assert row_ranges(blocks, 4, 8) == [[0, 4, 5], [2, 0, 3]]
+    assert row_ranges(blocks, 8, 11) == [[2, 3, 6]]
+
+
+def test_select_by_positions_matches_select_ids():
+    batch = make_batch()
+    unit = unit_for(batch, "user", 3, 9)
+    selected = JobWorker._select(unit, batch)
+    assert selected.ids() == set(json.loads(unit.item_ids))
+    assert [row.data["userId"] for row in selected] == ["a3", "a4", "b0", "b1", "b2", "b3"]
+
+
+def test_select_falls_back_to_ids_when_positions_are_stale():
+    batch = make_batch()
+    unit = unit_for(batch, "user", 0, 3)
+    unit.row_ranges = json.dumps([[1, 0, 3]])
+    assert JobWorker._select(unit, batch).ids() == set(json.loads(unit.item_ids))
+
+    unit.row_ranges = None
+    assert JobWorker._select(unit, batch).ids() == set(json.loads(unit.item_ids))
@@ -0,0 +1,43 @@
+"""
+Tests for cache charging and spill list cleanup in app.memory
+"""
+from app.memory import BudgetedCache, MemoryBudget, SpillList
+
+
+def test_cache_bounded_by_bytes_and_charged_to_budget():
+    budget = MemoryBudget(limit=1000, job_budget=100)
+    cache = BudgetedCache(budget, max_items=10, max_bytes=300)
+    for key in "abcd":
+        cache.put(key, key, 100)
+    assert "a" not in cache
+    assert cache.nbytes == 300
+    assert budget.cached == 300
+    assert budget.stats()["cached"] == 300
+
+    cache.put("huge", "x", 301)
+    assert "huge" not in cache
+    assert cache.nbytes == 300
+
+
+def test_admission_evicts_least_recently_used_cache_entries():
+    budget = MemoryBudget(limit=1000, job_budget=100, high_watermark=1.0)
+    cache = BudgetedCache(budget, max_items=10, max_bytes=1000)
+    for key in "abcd":
+        cache.put(key, key, 200)
+    cache.get("a")
+
+    budget._shed(300)
+    assert "b" not in cache and "c" not in cache
+    assert "a" in cache and "d" in cache
+    assert budget.cached == 400
+
+
+def test_spill_list_closes_its_temp_file():
+    with SpillList(max_items=2) as items:
+        items.extend(range(5))
+        assert list(items) == [0, 1, 2, 3, 4]
+        spill_file = items._file
+        assert spill_file is not None
+    assert spill_file.closed
+    assert len(items) == 0
+    assert list(items) == []
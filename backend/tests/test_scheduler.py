@@ -0,0 +1,41 @@
+"""
+Tests for per-tenant scheduling policy
+"""
+import asyncio
+
+import pytest
+
+from app.services.scheduler import TenantPolicy, TenantScheduler
+
+
+def test_requests_can_only_lower_the_configured_priority():
+    policy = TenantPolicy(default_cap=2, weights={}, caps={}, priorities={"acme": "urgent"})
+    assert policy.priority("acme") == "urgent"
+    assert policy.priority("acme", "bulk") == "bulk"
+    assert policy.priority("other") == "normal"
+    assert policy.priority("other", "urgent") == "normal"
+    with pytest.raises(ValueError):
+        policy.priority("other", "asap")
+
+
+def test_per_tenant_caps_bound_running_jobs():
+    policy = TenantPolicy(default_cap=1, weights={}, caps={"big": 3}, priorities={})
+    scheduler = TenantScheduler(max_concurrent=10, policy=policy)
+    peak = {"big": 0, "small": 0}
+    running = {"big": 0, "small": 0}
+
+    def job(tenant):
+        async def run():
+            running[tenant] += 1
+            peak[tenant] = max(peak[tenant], running[tenant])
+            await asyncio.sleep(0.01)
+            running[tenant] -= 1
+        return run
+
+    async def main():
+        await asyncio.gather(*(
+            scheduler.run(tenant, job(tenant)) for tenant in ["big"] * 6 + ["small"] * 3
+        ))
+
+    asyncio.run(main())
+    assert peak == {"big": 3, "small": 1}
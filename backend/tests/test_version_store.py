@@ -0,0 +1,49 @@
+"""
+Tests for chain digests and materialized file eviction in the version store
+"""
+import os
+import time
+
+from app.services.version_store import VersionStore
+
+
+def _table(salaries):
+    return {"sheets": [{
+        "name": "Users",
+        "columns": ["userId", "salary"],
+        "dtypes": ["object", "int64"],
+        "rows": [[f"user{i}", salary] for i, salary in enumerate(salaries)]
+    }]}
+
+
+def test_stored_digest_matches_digest_rebuilt_from_blobs(tmp_path):
+    store = VersionStore(store_dir=str(tmp_path), keyframe_interval=10)
+    first = _table([100, 200, 300])
+    second = _table([100, 250, 300])
+
+    path, _, blob_digest = store.write_keyframe("v1", first)
+    digest = store.link_digest(None, "v1", "keyframe", blob_digest)
+    chain = [("v1", "keyframe", path)]
+    path, _, blob_digest = store.write_delta("v2", first, second)
+    digest = store.link_digest(digest, "v2", "delta", blob_digest)
+    chain.append(("v2", "delta", path))
+
+    assert store.chain_digest(chain) == digest
+    assert store.cached_file("v2", digest, ".csv") is None
+    materialized = store.materialize("v2", chain, ".csv", digest)
+    assert store.cached_file("v2", digest, ".csv") == materialized
+
+
+def test_eviction_keeps_recently_used_files(tmp_path, monkeypatch):
+    monkeypatch.setenv("VERSION_MATERIALIZED_MAX", "1")
+    monkeypatch.setenv("VERSION_MATERIALIZED_GRACE_SECONDS", "60")
+    store = VersionStore(store_dir=str(tmp_path))
+    old = time.time() - 600
+    for name in ("stale.csv", "recent.csv", "newest.csv"):
+        path = os.path.join(store.materialized_dir, name)
+        open(path, "w").close()
+        if name == "stale.csv":
+            os.utime(path, (old, old))
+
+    store._evict_materialized()
+    assert sorted(os.listdir(store.materialized_dir)) == ["newest.csv", "recent.csv"]
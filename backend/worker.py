@@ -0,0 +1,51 @@
+"""
+Standalone job worker: claims implementation job units from the shared database
+
+Start any number of these, on one node or many, next to the API processes:
+    python worker.py --concurrency 4
+All of them must use the same DATABASE_URL (and UPLOAD_DIR / version store).
+"""
+import argparse
+import asyncio
+import signal
+
+from dotenv import load_dotenv
+
+from app.database import init_db
+from app.lifespan import build_services
+from app.services.job_worker import JobWorker
+
+load_dotenv()
+
+
+async def run_worker(concurrency: int, worker_id: str = None):
+    """Run a worker until SIGINT/SIGTERM; units in progress are finished first"""
+    init_db()
+    services = build_services()
+    worker = JobWorker(
+        services.job_leases,
+        services.workbook_service,
+        services.ai_bot,
+        services.sf_service,
+        worker_id=worker_id,
+        concurrency=concurrency
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"Job worker {worker.worker_id} started with {concurrency} slot(s)")
+    try:
+        await worker.run(stop)
+    finally:
+        await services.aclose()
+    print(f"Job worker {worker.worker_id} stopped: {worker.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Claim and run implementation job units")
+    parser.add_argument("--concurrency", type=int, default=4, help="units run at once by this process")
+    parser.add_argument("--worker-id", default=None, help="lease owner id (default: host:pid:random)")
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency, args.worker_id))